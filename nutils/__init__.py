@@ -34,8 +34,23 @@ __all__ = ['_', 'numpy', 'numeric', 'element', 'function', 'expression',
   'cache', 'transform', 'solver', 'cli', 'warnings', 'config', 'types', 'points',
   'sample', 'export', 'testing']
 
-from . import numeric, element, function, expression, mesh, topology, util, \
-  matrix, parallel, log, cache, transform, solver, cli, warnings, config, \
-  types, points, sample, export, testing
+# Submodules are imported on first attribute access rather than here, such
+# that `import nutils` is cheap and scripts pay only for what they use.  The
+# module class is replaced rather than defining a module level `__getattr__`,
+# which requires Python 3.7.
+
+import importlib, types as builtin_types
+
+class _Module(builtin_types.ModuleType):
+
+  def __getattr__(self, attr):
+    if attr not in __all__:
+      raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, attr))
+    return importlib.import_module('.'+attr, __name__)
+
+  def __dir__(self):
+    return sorted(set(super().__dir__()) | set(__all__))
+
+sys.modules[__name__].__class__ = _Module
 
 # vim:sw=2:sts=2:et
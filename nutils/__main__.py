@@ -0,0 +1,71 @@
+# Copyright (c) 2014 Evalf
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Maintenance commands, available as ``nutils`` or ``python -m nutils``.
+Currently a single command is provided:
+
+.. code:: console
+
+    nutils cache stats <cachedir>
+    nutils cache prune --size 10G [--policy lru|lfu] <cachedir>
+    nutils cache rebuild <cachedir>
+
+which shows statistics of, prunes, or rebuilds the index of the on-disk cache
+directory ``cachedir`` (see :class:`nutils.cache.DiskIndex`).
+"""
+
+from . import cache
+import sys, os, argparse
+
+def _size(s):
+  units = dict(K=2**10, M=2**20, G=2**30, T=2**40)
+  s = s.strip().upper().rstrip('B')
+  if s and s[-1] in units:
+    return int(float(s[:-1]) * units[s[-1]])
+  return int(s)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='nutils')
+  commands = parser.add_subparsers(dest='command')
+  commands.required = True
+  cacheparser = commands.add_parser('cache', help='maintain an on-disk cache directory')
+  cacheparser.add_argument('action', choices=['stats', 'prune', 'rebuild'])
+  cacheparser.add_argument('cachedir')
+  cacheparser.add_argument('--size', type=_size, help='byte budget for prune, e.g. 500M or 10G')
+  cacheparser.add_argument('--policy', choices=['lru', 'lfu'], default='lru', help='eviction policy for prune')
+  args = parser.parse_args(argv)
+  if not os.path.isdir(args.cachedir):
+    parser.error('no such directory: {}'.format(args.cachedir))
+  if args.action == 'prune' and args.size is None:
+    parser.error('prune requires a byte budget --size')
+
+  index = cache.DiskIndex(args.cachedir)
+  if args.action == 'rebuild':
+    index.rebuild()
+  elif args.action == 'prune':
+    print('removed {} files'.format(index.prune(args.size, args.policy)))
+  print(index.stats)
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+# vim:sw=2:sts=2:et
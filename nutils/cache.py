@@ -22,8 +22,8 @@
 The cache module.
 """
 
-from . import types
-import os, numpy, functools, inspect, builtins, pathlib, pickle, itertools, hashlib, abc, contextlib, treelog as log
+from . import types, config
+import os, io, numpy, functools, inspect, builtins, pathlib, pickle, itertools, hashlib, abc, contextlib, collections, time, threading, atexit, treelog as log
 
 class Wrapper:
   'function decorator that caches results by arguments'
@@ -78,6 +78,294 @@ class WrapperCache:
   def __nutils_hash__(self):
     return hashlib.sha1(b'nutils.cache.WrapperCache\0').digest()
 
+class MemoryCache:
+  '''bounded in-memory tier of the on-disk cache
+
+  Keeps the pickled data of recently loaded or stored cache files of
+  :func:`function` in memory, such that repeated calls with the same
+  arguments skip locking, reading and (for large values) the filesystem
+  altogether. Every entry is stamped with the modification time and size of
+  its cache file, which is checked on retrieval so that files that were
+  rewritten by another process are not served from memory. Least recently
+  used entries are evicted as soon as the total size exceeds
+  :attr:`nutils.config.memcachesize` bytes.
+  '''
+
+  def __init__(self):
+    self._entries = collections.OrderedDict()
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key, stamp):
+    'return data stored under ``key`` if its stamp matches, otherwise None'
+
+    try:
+      entrystamp, data = self._entries[key]
+    except KeyError:
+      data = None
+    else:
+      if entrystamp == stamp:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+      self._remove(key)
+    self.misses += 1
+    return None
+
+  def put(self, key, stamp, data):
+    'store ``data`` under ``key``, evicting least recently used entries'
+
+    if key in self._entries:
+      self._remove(key)
+    maxsize = config.memcachesize
+    if len(data) > maxsize:
+      return
+    self._entries[key] = stamp, data
+    self.size += len(data)
+    while self.size > maxsize:
+      self._remove(next(iter(self._entries)))
+      self.evictions += 1
+
+  def clear(self):
+    'remove all entries'
+
+    self._entries.clear()
+    self.size = 0
+
+  def _remove(self, key):
+    stamp, data = self._entries.pop(key)
+    self.size -= len(data)
+
+  @builtins.property
+  def stats(self):
+    count = self.hits + self.misses
+    return 'not used' if not count \
+      else 'effectivity {:.0f}% (hit {}/{} calls, {} evictions, {} entries of {} bytes)'.format(100*self.hits/count, self.hits, count, self.evictions, len(self._entries), self.size)
+
+memory = MemoryCache()
+
+def _stamp(f):
+  stat = os.fstat(f.fileno())
+  return stat.st_mtime_ns, stat.st_size
+
+def _blob(path, i):
+  return path.with_name('{}.{}.npy'.format(path.name, i))
+
+class _Pickler(pickle.Pickler):
+  # Pickler that collects arrays of at least `config.cachemmapsize` bytes in
+  # `blobs`, to be stored out-of-band by `_write` as `.npy` files next to the
+  # cache file, numbered in order of appearance.
+
+  def __init__(self, file):
+    super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+    self.minsize = config.cachemmapsize
+    self.blobs = []
+
+  def persistent_id(self, obj):
+    if type(obj) not in (numpy.ndarray, numpy.memmap) or not self.minsize or obj.nbytes < self.minsize or obj.dtype.hasobject:
+      return None
+    self.blobs.append(obj)
+    return 'npy', len(self.blobs) - 1
+
+class _Unpickler(pickle.Unpickler):
+  # Unpickler that memory-maps the out-of-band arrays written by `_Pickler`.
+  # The maps are read-only, such that `types.frozenarray` adopts them without
+  # copying.  If `blobs` is not None, the arrays are copied from this list
+  # instead, and made read-only alike.
+
+  def __init__(self, file, path, blobs=None):
+    super().__init__(file)
+    self.path = path
+    self.blobs = blobs
+    self.nbytes = 0
+
+  def persistent_load(self, pid):
+    kind, i = pid
+    if self.blobs is not None:
+      array = self.blobs[i].copy()
+      array.flags.writeable = False
+      return array
+    blob = _blob(self.path, i)
+    try:
+      array = numpy.load(str(blob), mmap_mode='r', allow_pickle=False)
+      self.nbytes += blob.stat().st_size
+    except (OSError, ValueError) as e:
+      raise pickle.UnpicklingError('failed to load array {}: {}'.format(blob, e)) from e
+    return array.view(numpy.ndarray)
+
+def _dumps(obj):
+  # Pickle `obj`.  Returns the pickled data and the arrays to be stored
+  # out-of-band.
+  f = io.BytesIO()
+  pickler = _Pickler(f)
+  pickler.dump(obj)
+  return f.getvalue(), pickler.blobs
+
+def _write(f, path, data, blobs, index, name):
+  # Write pickled `data` to locked cache file `f` at `path`, preceded by the
+  # out-of-band arrays `blobs`, and record the access in `index` as `name`.
+  # Blobs are written to a temporary file and moved in place, such that arrays
+  # memory-mapped by other processes remain valid.  Stale blobs of a previous
+  # value are removed.
+  nbytes = 0
+  for i, array in enumerate(blobs):
+    blob = _blob(path, i)
+    tmp = blob.with_name('.'+blob.name)
+    with tmp.open('wb') as fblob:
+      numpy.save(fblob, array, allow_pickle=False)
+      nbytes += fblob.tell()
+    os.replace(str(tmp), str(blob))
+  for i in itertools.count(len(blobs)):
+    try:
+      _blob(path, i).unlink()
+    except FileNotFoundError:
+      break
+  raw = _compress(data)
+  f.seek(0)
+  f.write(raw)
+  f.truncate()
+  f.flush()
+  if index is not None:
+    index.record(name, len(raw)+nbytes)
+
+def _compress(data):
+  # Compress pickled `data` according to `config.cachecompression` if it is at
+  # least `config.cachecompresssize` bytes.  Compressed data is prefixed by
+  # `#<method>\n`, which cannot be confused with the first bytes of a pickle.
+  method = config.cachecompression
+  if not method or len(data) < config.cachecompresssize:
+    return data
+  level = config.cachecompresslevel
+  if method == 'zlib':
+    import zlib
+    compressed = zlib.compress(data, -1 if level is None else level)
+  elif method == 'lzma':
+    import lzma
+    compressed = lzma.compress(data, preset=level)
+  else:
+    raise ValueError('unknown cache compression method {!r}'.format(method))
+  compressed = b'#' + method.encode() + b'\n' + compressed
+  return compressed if len(compressed) < len(data) else data
+
+def _decompress(data):
+  # Inverse of `_compress`.  Uncompressed data is returned as is.
+  if not data.startswith(b'#'):
+    return data
+  method, sep, compressed = data[1:].partition(b'\n')
+  try:
+    if method == b'zlib':
+      import zlib
+      return zlib.decompress(compressed)
+    elif method == b'lzma':
+      import lzma
+      return lzma.decompress(compressed)
+  except Exception as e:
+    raise pickle.UnpicklingError('failed to decompress: {}'.format(e)) from e
+  raise pickle.UnpicklingError('unknown compression method {!r}'.format(method))
+
+def _load(f, path, blobs=None):
+  # Unpickle from file `f` of cache file `path`.  Returns the object and the
+  # number of bytes loaded out-of-band.
+  unpickler = _Unpickler(f, path, blobs)
+  return unpickler.load(), unpickler.nbytes
+
+class WriteBack:
+  '''background writer of the on-disk cache
+
+  If :attr:`nutils.config.cachewriteback` is positive, :func:`function` and
+  :class:`Recursion` hand their stores to a background thread instead of
+  writing the cache files themselves.  The cache file remains locked until it
+  is written, such that other processes wait for the entry rather than reading
+  a partial file, while the pickled entry is kept in :attr:`pending` to serve
+  loads by this process.  A store blocks if the pending entries exceed
+  :attr:`nutils.config.cachewriteback` bytes.  Pending stores are flushed when
+  leaving an :func:`enable` context, before forking and at interpreter
+  shutdown.
+  '''
+
+  def __init__(self):
+    self.pending = {} # path -> (data, blobs)
+    self.size = 0
+    self.errors = []
+    self._queue = collections.deque()
+    self._cond = threading.Condition()
+    self._thread = None
+
+  def put(self, f, path, data, blobs, index, name):
+    '''schedule a store of ``data`` and ``blobs`` in locked cache file ``f``'''
+
+    # The writer receives a duplicate of the file descriptor, which shares
+    # the lock, such that the lock is held until the writer closes it.
+    f = os.fdopen(os.dup(f.fileno()), 'r+b')
+    blobs = [array.copy() for array in blobs]
+    size = len(data) + sum(array.nbytes for array in blobs)
+    with self._cond:
+      while self._queue and self.size + size > config.cachewriteback:
+        self._cond.wait()
+      self.pending[path] = data, blobs
+      self.size += size
+      self._queue.append((f, path, data, blobs, index, name, size))
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._run, name='nutils.cache.WriteBack', daemon=True)
+        self._thread.start()
+      self._cond.notify_all()
+
+  def get(self, path):
+    '''return the pending data and blobs of ``path``, or None'''
+
+    return self.pending.get(path)
+
+  def flush(self):
+    '''wait for all pending stores to be written'''
+
+    with self._cond:
+      while self._queue:
+        self._cond.wait()
+      errors, self.errors = self.errors, []
+    for path, e in errors:
+      log.warning('failed to write cache file {}: {}'.format(path, e))
+
+  def _run(self):
+    while True:
+      with self._cond:
+        while not self._queue:
+          self._cond.wait()
+        f, path, data, blobs, index, name, size = self._queue[0]
+      try:
+        with f:
+          _write(f, path, data, blobs, index, name)
+      except Exception as e:
+        self.errors.append((path, e))
+      with self._cond:
+        self._queue.popleft()
+        if self.pending.get(path, (None,))[0] is data:
+          del self.pending[path]
+        self.size -= size
+        self._cond.notify_all()
+
+  def _afterfork(self):
+    # Only the forking thread survives in the child, and the queue was flushed
+    # before forking.
+    self._cond = threading.Condition()
+    self._thread = None
+
+writeback = WriteBack()
+atexit.register(writeback.flush)
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(before=writeback.flush, after_in_child=writeback._afterfork)
+
+def _store(f, path, obj, index, name):
+  # Store `obj` in locked cache file `f` at `path`, asynchronously if
+  # `config.cachewriteback` is positive.  Returns the pickled data.
+  data, blobs = _dumps(obj)
+  if config.cachewriteback:
+    writeback.put(f, path, data, blobs, index, name)
+  else:
+    _write(f, path, data, blobs, index, name)
+  return data
+
 _cache = None
 
 @contextlib.contextmanager
@@ -90,13 +378,19 @@ def _cache_context(value):
   finally:
     _cache = old_value
 
+@contextlib.contextmanager
 def enable(cachedir):
   '''
   Enable cacheing and set the cache directory to ``cachedir``.  Affects
   functions decorated with :func:`function` and subclasses of
-  :class:`Recursion`.
+  :class:`Recursion`.  Pending asynchronous stores (see :class:`WriteBack`)
+  are flushed on exit.
   '''
-  return _cache_context(pathlib.Path(cachedir))
+  with _cache_context(pathlib.Path(cachedir)):
+    try:
+      yield
+    finally:
+      writeback.flush()
 
 def disable():
   '''
@@ -142,6 +436,280 @@ else:
 
 _lock_file = next(filter(None, [_lock_file_fcntl, _lock_file_msvcrt, _lock_file_fallback]))
 
+class DiskIndex:
+  '''access index of an on-disk cache directory
+
+  Keeps track of the size, last access time and number of accesses of every
+  file in cache directory ``cachedir``, such that the cache can be kept within
+  a byte budget without walking the directory tree.  Every load and store of
+  a cache file appends a single line ``atime size count name`` to the file
+  ``.index`` in the cache directory, where ``name`` is the path of the cache
+  file relative to ``cachedir`` and a negative ``size`` marks a removed file.
+  The size of a cache file includes its out-of-band arrays.
+  All index operations are serialized by a lock on ``.index.lock``.  Lines
+  written by other processes are read incrementally, and the index is
+  compacted once it contains many stale lines.
+
+  Loads and stores are recorded only if :attr:`nutils.config.cachesize` is
+  positive; an index of an unbounded cache can be brought up to date with
+  :meth:`rebuild`.  If ``.index`` does not exist, e.g. because the cache was
+  unbounded so far, the index is rebuilt on first use.
+
+  Loads from the in-memory tier (see :class:`MemoryCache`) are recorded via
+  :meth:`touch`, which defers writing to the index until the next locked
+  operation, such that memory hits do not acquire the lock.
+
+  Parameters
+  ----------
+  cachedir : :class:`str` or :class:`pathlib.Path`
+      The cache directory.
+  '''
+
+  def __init__(self, cachedir):
+    self.cachedir = pathlib.Path(cachedir)
+    self.entries = {} # name -> (size, atime, count)
+    self._threadlock = threading.Lock()
+    self.size = 0
+    self._id = None
+    self._offset = 0
+    self._nlines = 0
+    self._pending = {} # name -> (size, atime, count)
+    self._pendinglock = threading.Lock()
+    self._flushed = time.time()
+
+  @contextlib.contextmanager
+  def _locked(self):
+    self.cachedir.mkdir(parents=True, exist_ok=True)
+    with self._threadlock, (self.cachedir/'.index.lock').open('ab') as f:
+      _lock_file(f)
+      yield
+
+  def _reset(self, id=None):
+    self.entries.clear()
+    self.size = 0
+    self._id = id
+    self._offset = 0
+    self._nlines = 0
+
+  def _apply(self, name, size, atime, count):
+    old = self.entries.pop(name, None)
+    if old is not None:
+      self.size -= old[0]
+      count += old[2]
+    if size >= 0:
+      self.entries[name] = size, atime, count
+      self.size += size
+    self._nlines += 1
+
+  def _sync(self, exclude=()):
+    # Read lines appended since the last call.  Must be called with the lock
+    # held.  If the index was replaced, as identified by the random header
+    # written by `_compact`, or truncated, it is read from scratch.  If the index does not
+    # exist, it is rebuilt from the files in the cache directory, except for
+    # the files listed in `exclude`.
+    try:
+      f = (self.cachedir/'.index').open('rb')
+    except FileNotFoundError:
+      self._rebuild(exclude)
+      return
+    with f:
+      header = f.readline()
+      id = header if header.startswith(b'#') else None
+      if id != self._id or os.fstat(f.fileno()).st_size < self._offset:
+        self._reset(id)
+      f.seek(self._offset)
+      for line in f:
+        if not line.endswith(b'\n'): # incomplete line of an interrupted write
+          break
+        self._offset += len(line)
+        try:
+          atime, size, count, name = line.decode().rstrip('\n').split(' ', 3)
+          self._apply(name, int(size), float(atime), int(count))
+        except ValueError: # header
+          pass
+
+  def _append(self, records):
+    # Append `records` of the form `(name, size, atime, count)`.  Must be
+    # called with the lock held, after `_sync`.
+    data = ''.join('{:.3f} {} {} {}\n'.format(atime, size, count, name) for name, size, atime, count in records).encode()
+    with (self.cachedir/'.index').open('ab') as f:
+      f.write(data)
+    self._sync()
+
+  def _takepending(self):
+    # Return and clear the accesses recorded by `touch`, except for files that
+    # were removed in the meantime.  Must be called with the lock held, after
+    # `_sync`.
+    with self._pendinglock:
+      pending, self._pending = self._pending, {}
+      self._flushed = time.time()
+    return [(name, size, atime, count) for name, (size, atime, count) in pending.items() if name in self.entries]
+
+  def _compact(self):
+    # Rewrite the index with a single line per entry.  Must be called with the
+    # lock held, after `_sync`.
+    header = '# {}\n'.format(os.urandom(16).hex()).encode()
+    data = header + ''.join('{:.3f} {} {} {}\n'.format(atime, size, count, name) for name, (size, atime, count) in self.entries.items()).encode()
+    tmp = self.cachedir/'.index.tmp'
+    with tmp.open('wb') as f:
+      f.write(data)
+    os.replace(str(tmp), str(self.cachedir/'.index'))
+    self._id = header
+    self._offset = len(data)
+    self._nlines = len(self.entries)
+
+  def _remove(self, name):
+    # Directories of `Recursion` are left in place, as they may be in use.
+    path = self.cachedir/name
+    for file in itertools.chain([path], path.parent.glob(path.name+'.*.npy')):
+      try:
+        file.unlink()
+      except FileNotFoundError:
+        pass
+
+  def update(self):
+    'read the records written since the last update'
+
+    with self._locked():
+      self._sync()
+      pending = self._takepending()
+      if pending:
+        self._append(pending)
+
+  def touch(self, name, size):
+    '''record an access of cache file ``name`` of ``size`` bytes lazily
+
+    The access is written to the index by the next :meth:`record`,
+    :meth:`prune` or :meth:`update`, or by this method if many accesses are
+    pending or the last write was more than a minute ago.
+    '''
+
+    with self._pendinglock:
+      old = self._pending.get(name)
+      self._pending[name] = size, time.time(), 1 if old is None else old[2]+1
+      flush = len(self._pending) >= 256 or time.time() - self._flushed > 60
+    if flush:
+      self.update()
+
+  def record(self, name, size):
+    '''record an access of cache file ``name`` of ``size`` bytes
+
+    If :attr:`nutils.config.cachesize` is positive and the total size exceeds
+    this budget, cache files are evicted via :meth:`prune`, except for
+    ``name``.
+    '''
+
+    with self._locked():
+      self._sync(exclude=[name])
+      self._append(self._takepending() + [(name, size, time.time(), 1)])
+      maxsize = config.cachesize
+      if maxsize and self.size > maxsize:
+        self._prune(maxsize * 9 // 10, config.cachepolicy, keep=name)
+      elif self._nlines > 2 * len(self.entries) + 1024:
+        self._compact()
+
+  def prune(self, maxsize, policy='lru'):
+    '''remove cache files until the total size is at most ``maxsize`` bytes
+
+    Parameters
+    ----------
+    maxsize : :class:`int`
+        The byte budget.
+    policy : :class:`str`
+        The eviction policy: ``'lru'`` removes the least recently used files
+        first, ``'lfu'`` the least frequently used files, ties broken by
+        access time.
+
+    Returns
+    -------
+    :class:`int`
+        The number of removed files.
+    '''
+
+    with self._locked():
+      self._sync()
+      pending = self._takepending()
+      if pending:
+        self._append(pending)
+      return self._prune(maxsize, policy)
+
+  def _prune(self, maxsize, policy, keep=None):
+    if policy == 'lru':
+      order = lambda item: item[1][1]
+    elif policy == 'lfu':
+      order = lambda item: (item[1][2], item[1][1])
+    else:
+      raise ValueError('unknown eviction policy {!r}'.format(policy))
+    size = self.size
+    removed = []
+    now = time.time()
+    for name, (entrysize, atime, count) in sorted(self.entries.items(), key=order):
+      if size <= maxsize:
+        break
+      if name != keep:
+        self._remove(name)
+        removed.append((name, -1, now, 0))
+        size -= entrysize
+    if removed:
+      log.debug('[cache] evicted {} files'.format(len(removed)))
+      self._append(removed)
+      self._compact()
+    return len(removed)
+
+  def rebuild(self):
+    '''rebuild the index by walking the cache directory
+
+    Access counts are reset to one and access times to the modification times
+    of the cache files.
+    '''
+
+    with self._locked():
+      self._rebuild()
+
+  def _rebuild(self, exclude=()):
+    # Must be called with the lock held.
+    self._reset()
+    sizes = collections.defaultdict(int)
+    atimes = {}
+    for path in sorted(self.cachedir.iterdir()):
+      if path.name.startswith('.'):
+        continue
+      for file in sorted(path.iterdir()) if path.is_dir() else [path]:
+        if file.name.startswith('.'):
+          continue
+        stat = file.stat()
+        name = str(file.relative_to(self.cachedir))
+        if file.suffix == '.npy': # out-of-band array of cache file `name`
+          name = name[:-len(file.name)] + file.name.split('.')[0]
+        else:
+          atimes[name] = stat.st_mtime
+        sizes[name] += stat.st_size
+    for name, atime in atimes.items():
+      if name not in exclude:
+        self._apply(name, sizes[name], atime, 1)
+    self._compact()
+
+  @builtins.property
+  def stats(self):
+    self.update()
+    if not self.entries:
+      return 'empty'
+    atime = min(atime for size, atime, count in self.entries.values())
+    return '{} files of {} bytes, least recently used at {}'.format(len(self.entries), self.size, time.ctime(atime))
+
+_indices = {}
+
+def _index(cachedir):
+  # Return the index of `cachedir`, or `None` if the cache is unbounded, in
+  # which case loads and stores are not recorded.
+  if not config.cachesize:
+    return None
+  try:
+    index = _indices[cachedir]
+  except KeyError:
+    index = _indices[cachedir] = DiskIndex(cachedir)
+  return index
+
 
 def function(func=None, *, version=0):
   '''
@@ -158,7 +726,11 @@ def function(func=None, *, version=0):
   directory specified by the argument to :func:`enable`; when the decorator is
   called with the same arguments, the result is retrieved from the cache.  If
   inside a :func:`disable` context, the decorator calls ``func`` directly,
-  bypassing the cache.  Note that memoization is off by default.
+  bypassing the cache.  Note that memoization is off by default.  Recently
+  used cache files are additionally kept in memory, see :class:`MemoryCache`.
+  Large arrays are stored out-of-band as ``.npy`` files and memory-mapped on
+  load, see :attr:`nutils.config.cachemmapsize`.  Cache files are optionally
+  compressed, see :attr:`nutils.config.cachecompression`.
 
   Parameters
   ----------
@@ -203,6 +775,39 @@ def function(func=None, *, version=0):
       h.update(hkv)
     hkey = h.hexdigest()
     cachefile = _cache/hkey
+    # Try pending asynchronous stores and the in-memory tier first, the latter
+    # requiring only a `stat` call to verify that the cache file was not
+    # modified since it was last read or written.
+    pending = writeback.get(cachefile)
+    if pending is not None:
+      log.debug('[cache.function {}] load from pending store'.format(hkey))
+      (log_, fail, value), nbytes = _load(io.BytesIO(pending[0]), cachefile, pending[1])
+      log_.replay()
+      if fail:
+        raise value
+      else:
+        return value
+    try:
+      stat = cachefile.stat()
+    except FileNotFoundError:
+      pass
+    else:
+      data = memory.get((_cache, hkey), (stat.st_mtime_ns, stat.st_size))
+      if data is not None:
+        try:
+          (log_, fail, value), nbytes = _load(io.BytesIO(data), cachefile)
+        except pickle.UnpicklingError:
+          log.debug('[cache.function {}] failed to load from memory'.format(hkey))
+        else:
+          log.debug('[cache.function {}] load from memory'.format(hkey))
+          index = _index(_cache)
+          if index is not None:
+            index.touch(hkey, stat.st_size+nbytes)
+          log_.replay()
+          if fail:
+            raise value
+          else:
+            return value
     # Open and lock `cachefile`.  Try to read it and, if successful, unlock
     # the file (implicitly by closing the file) and return the value.  If
     # reading fails, e.g. because the file did not exist, call `func`, store
@@ -217,24 +822,29 @@ def function(func=None, *, version=0):
       _lock_file(f)
       log.debug('[cache.function {}] lock acquired'.format(hkey))
       try:
-        data = pickle.load(f)
-        if len(data) == 2: # For old caches.
-          value, log_ = data
+        raw = f.read()
+        data = _decompress(raw)
+        loaded, nbytes = _load(io.BytesIO(data), cachefile)
+        if len(loaded) == 2: # For old caches.
+          value, log_ = loaded
           fail = False
         else:
-          log_, fail, value = data
+          log_, fail, value = loaded
       except (EOFError, pickle.UnpicklingError, IndexError):
         log.debug('[cache.function {}] failed to load, cache will be rewritten'.format(hkey))
         pass
       else:
         log.debug('[cache.function {}] load'.format(hkey))
+        if len(loaded) == 3:
+          memory.put((_cache, hkey), _stamp(f), data)
+        index = _index(_cache)
+        if index is not None:
+          index.record(hkey, len(raw)+nbytes)
         log_.replay()
         if fail:
           raise value
         else:
           return value
-      # Seek back to the beginning, because pickle might have read garbage.
-      f.seek(0)
       # Disable the cache temporarily to prevent caching subresults *in* `func`.
       log_ = log.RecordLog()
       with disable(), log.add(log_):
@@ -245,7 +855,9 @@ def function(func=None, *, version=0):
           fail = True
         else:
           fail = False
-      pickle.dump((log_, fail, value), f)
+      data = _store(f, cachefile, (log_, fail, value), _index(_cache), hkey)
+      if not config.cachewriteback:
+        memory.put((_cache, hkey), _stamp(f), data)
       log.debug('[cache.function {}] store'.format(hkey))
       if fail:
         raise value
@@ -372,6 +984,23 @@ class Recursion(types.Immutable, metaclass=_RecursionMeta):
       stop = False
       for i in itertools.count():
         cachefile = cachepath/'{:04d}'.format(i)
+        pending = None if exhausted else writeback.get(cachefile)
+        if pending is not None:
+          log.debug('[cache.Recursion {}.{:04d}] load from pending store'.format(hkey, i))
+          (log_, stop, value), nbytes = _load(io.BytesIO(pending[0]), cachefile, pending[1])
+          log_.replay()
+          if stop and value is None:
+            value = StopIteration
+          history.append(value)
+          if len(history) > length:
+            history = history[1:]
+          if not stop:
+            yield value
+          elif isinstance(value, StopIteration):
+            return
+          else:
+            raise value
+          continue
         cachefile.touch()
         with cachefile.open('r+b') as f:
           log.debug('[cache.Recursion {}.{:04d}] acquiring lock'.format(hkey, i))
@@ -379,7 +1008,8 @@ class Recursion(types.Immutable, metaclass=_RecursionMeta):
           log.debug('[cache.Recursion {}.{:04d}] lock acquired'.format(hkey, i))
           if not exhausted:
             try:
-              log_, stop, value = pickle.load(f)
+              raw = f.read()
+              (log_, stop, value), nbytes = _load(io.BytesIO(_decompress(raw)), cachefile)
             except (pickle.UnpicklingError, IndexError):
               log.debug('[cache.Recursion {}.{:04d}] failed to load, cache will be rewritten from this point'.format(hkey, i))
               exhausted = True
@@ -388,6 +1018,9 @@ class Recursion(types.Immutable, metaclass=_RecursionMeta):
               exhausted = True
             else:
               log.debug('[cache.Recursion {}.{:04d}] load'.format(hkey, i))
+              index = _index(_cache)
+              if index is not None:
+                index.record('{}/{:04d}'.format(hkey, i), len(raw)+nbytes)
               log_.replay()
               if stop and value is None:
                 value = StopIteration
@@ -396,7 +1029,6 @@ class Recursion(types.Immutable, metaclass=_RecursionMeta):
                 history = history[1:]
             if exhausted:
               resume = self.resume(history)
-              f.seek(0)
               del history
           if exhausted:
             # Disable the cache temporarily to prevent caching subresults *in* `func`.
@@ -408,7 +1040,7 @@ class Recursion(types.Immutable, metaclass=_RecursionMeta):
                 stop = True
                 value = e
             log.debug('[cache.Recursion {}.{}] store'.format(hkey, i))
-            pickle.dump((log_, stop, value), f)
+            _store(f, cachefile, (log_, stop, value), _index(_cache), '{}/{:04d}'.format(hkey, i))
         if not stop:
           yield value
         elif isinstance(value, StopIteration):
@@ -188,6 +188,8 @@ def call(func, kwargs, scriptname, funcname=None):
         pdb.post_mortem()
       return 2
     else:
+      if config.cache:
+        log.info('memory cache', cache.memory.stats)
       log.info('finish', time.ctime())
       return 0
 
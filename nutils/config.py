@@ -110,6 +110,86 @@ class Config(types.ModuleType):
 
      Defaults to ``False``.
 
+  .. attribute:: memcachesize
+
+     Upper bound in bytes for the in-memory tier of the on-disk cache (see
+     :attr:`cache` and :class:`nutils.cache.MemoryCache`).  A value of ``0``
+     disables the in-memory tier.
+
+     Defaults to ``67108864`` (64 MiB).
+
+  .. attribute:: cachesize
+
+     Upper bound in bytes for the on-disk cache (see :attr:`cache` and
+     :class:`nutils.cache.DiskIndex`).  If exceeded, cache files are evicted
+     according to :attr:`cachepolicy` until 90% of the budget remains.  A
+     value of ``0`` means unbounded, in which case accesses are not recorded
+     in the index of the cache directory.  Existing caches can be inspected
+     and pruned with ``nutils cache``.
+
+     Defaults to ``0``.
+
+  .. attribute:: cachemmapsize
+
+     Minimum size in bytes of arrays that are stored out-of-band as ``.npy``
+     files next to the on-disk cache files (see :attr:`cache`).  These arrays
+     are memory-mapped read-only when loaded from the cache, such that they are
+     used by :class:`nutils.types.frozenarray` without copying; a loaded array
+     should be copied before it is modified.  A value of ``0`` stores all
+     arrays in the cache files.
+
+     Defaults to ``65536`` (64 KiB).
+
+  .. attribute:: cachecompression
+
+     Compression method of the on-disk cache files (see :attr:`cache`):
+     ``'zlib'``, ``'lzma'`` or ``''`` for no compression.  Arrays stored
+     out-of-band (see :attr:`cachemmapsize`) are not compressed.  Cache files
+     written with a different setting remain readable.
+
+     Defaults to ``''``.
+
+  .. attribute:: cachecompresslevel
+
+     Compression level of :attr:`cachecompression`, ``0`` to ``9``, or
+     ``None`` for the default level of the compression method.
+
+     Defaults to ``None``.
+
+  .. attribute:: cachecompresssize
+
+     Minimum size in bytes of cache files that are compressed (see
+     :attr:`cachecompression`).
+
+     Defaults to ``4096``.
+
+  .. attribute:: cachewriteback
+
+     Upper bound in bytes for cache entries that are pending to be written to
+     disk by a background thread (see :attr:`cache` and
+     :class:`nutils.cache.WriteBack`).  A value of ``0`` disables
+     asynchronous writes.
+
+     Defaults to ``0``.
+
+  .. attribute:: hashalgorithm
+
+     The digest of the data of :class:`nutils.types.frozenarray` objects in
+     :func:`nutils.types.nutils_hash`, which identifies the entries of the
+     on-disk cache (see :attr:`cache`): ``'sha1'`` or ``'blake2b'``.  Changing
+     this value invalidates all cache entries with array arguments.  The
+     ``'blake2b'`` algorithm requires Python 3.6 or newer.
+
+     Defaults to ``'sha1'``.
+
+  .. attribute:: cachepolicy
+
+     The eviction policy of the on-disk cache: ``'lru'`` to evict the least
+     recently used files first, ``'lfu'`` to evict the least frequently used
+     files first.
+
+     Defaults to ``'lru'``.
+
   .. attribute:: cachedir
 
      Defines the location of the on-disk cache (see :attr:`cache`) relative to
@@ -201,6 +281,15 @@ sys.modules[__name__] = Config(
   cachedir = 'cache',
   matrix = 'mkl,scipy,numpy',
   cache = False,
+  memcachesize = 2**26,
+  cachesize = 0,
+  cachepolicy = 'lru',
+  cachemmapsize = 2**16,
+  cachecompression = '',
+  cachecompresslevel = None,
+  cachecompresssize = 2**12,
+  hashalgorithm = 'sha1',
+  cachewriteback = 0,
 )
 
 # vim:sw=2:sts=2:et
@@ -45,18 +45,26 @@ expensive and currently unsupported operation.
 from . import util, types, numpy, numeric, config, cache, transform, expression, warnings, _
 import sys, itertools, functools, operator, inspect, numbers, builtins, re, types as builtin_types, collections.abc, math, treelog as log
 
-isevaluable = lambda arg: isinstance(arg, Evaluable)
+isevaluable = lambda arg: type(arg) in _evaluabletypes
 
 def strictevaluable(value):
-  if not isinstance(value, Evaluable):
+  if type(value) not in _evaluabletypes:
     raise ValueError('expected an object of type {!r} but got {!r} with type {!r}'.format(Evaluable.__qualname__, value, type(value).__qualname__))
   return value
 
+# All subclasses of `Evaluable` and `Array`, maintained by `__init_subclass__`,
+# that allow annotations to skip canonical arguments (see
+# `types.apply_annotations`).
+_evaluabletypes = set()
+_arraytypes = set()
+strictevaluable.__canonical__ = _evaluabletypes
+
 def simplified(value):
   return strictevaluable(value).simplified
 
 asdtype = lambda arg: arg if any(arg is dtype for dtype in (bool, int, float)) else {'f': float, 'i': int, 'b': bool}[numpy.dtype(arg).kind]
 asarray = lambda arg: arg if isarray(arg) else Constant(arg) if numeric.isarray(arg) or numpy.asarray(arg).dtype != object else stack(arg, axis=0)
+asarray.__canonical__ = _arraytypes
 asarrays = types.tuple[asarray]
 
 def as_canonical_length(value):
@@ -72,6 +80,7 @@ def as_canonical_length(value):
     raise ValueError('length should be an `int` or `Array` with zero dimensions and dtype `int`, got {!r}'.format(value))
   return value
 
+as_canonical_length.__canonical__ = int
 asshape = types.tuple[as_canonical_length]
 
 
@@ -86,6 +95,10 @@ class Evaluable(types.Singleton):
     super().__init__()
     self.__args = args
 
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    _evaluabletypes.add(cls)
+
   def evalf(self, *args):
     raise NotImplementedError('Evaluable derivatives should implement the evalf method')
 
@@ -226,6 +239,8 @@ class Evaluable(types.Singleton):
     self, = args
     return self.edit(lambda arg: arg.prepare_eval(**kwargs) if isevaluable(arg) else arg)
 
+_evaluabletypes.add(Evaluable)
+
 class EvaluationError(Exception):
   'evaluation error'
 
@@ -497,6 +512,10 @@ class Array(Evaluable):
     self.dtype = dtype
     super().__init__(args=args)
 
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    _arraytypes.add(cls)
+
   def __getitem__(self, item):
     if not isinstance(item, tuple):
       item = item,
@@ -603,6 +622,8 @@ class Array(Evaluable):
   _unravel = lambda self, axis, shape: None
   _ravel = lambda self, axis: None
 
+_arraytypes.add(Array)
+
 class Normal(Array):
   'normal'
 
@@ -3075,7 +3096,7 @@ def replace(func):
 # FUNCTIONS
 
 def isarray(arg):
-  return isinstance(arg, Array)
+  return type(arg) in _arraytypes
 
 def iszero(arg):
   return isinstance(arg.simplified, Zeros)
@@ -3630,6 +3651,63 @@ def replace_arguments(value, arguments):
       v = localgradient(v, ndims)
     return v
 
+def splitdegree(func, var):
+  '''Split ``func`` into parts of degree zero, one and higher in ``var``.
+
+  The additive terms of ``func`` are collected, descending into operations
+  that are linear in the term, and classified as either independent of
+  ``var``, linear in ``var``, or nonlinear. Affine terms are separated into
+  their value at ``var`` equal to zero and the linear remainder. The split is
+  not exhaustive:
+  terms that are not additively separated in the expression tree, such as
+  the factors of a product of two ``var`` dependent arrays, are considered
+  nonlinear as a whole.
+
+  Args
+  ----
+  func : :class:`Array`
+      Array to be split.
+  var : :class:`Argument`
+      Argument with respect to which the degree is determined.
+
+  Returns
+  -------
+  constant : :class:`Array`
+  linear : :class:`Array`
+  nonlinear : :class:`Array`
+      Arrays of the same shape as ``func`` that sum up to ``func``.
+  '''
+
+  func = asarray(func).simplified
+  parts = [], [], []
+  for term in _additiveterms(func, var._name):
+    if not _dependson(term, var._name):
+      parts[0].append(term)
+    elif not _dependson(derivative(term, var).simplified, var._name):
+      term0 = replace_arguments(term, {var._name: zeros(var.shape)}).simplified
+      if not iszero(term0):
+        parts[0].append(term0)
+        term -= term0
+      parts[1].append(term)
+    else:
+      parts[2].append(term)
+  return tuple(util.sum(terms).simplified if terms else zeros_like(func) for terms in parts)
+
+_linearops = InsertAxis, Transpose, Get, Sum, TakeDiag, Take, Inflate, Mask, Ravel, Unravel, Diagonalize, Multiply, Dot
+
+def _dependson(func, name):
+  return any(isinstance(arg, Argument) and arg._name == name for arg in func.dependencies)
+
+def _additiveterms(func, name):
+  if isinstance(func, (Add, BlockAdd)):
+    return [term for f in func.funcs for term in _additiveterms(f, name)]
+  if isinstance(func, _linearops):
+    args = [arg for arg in (func.funcs if isinstance(func, (Multiply, Dot)) else func._args) if isinstance(arg, Array) and _dependson(arg, name)]
+    if len(args) == 1:
+      arg, = args
+      return [func.edit(lambda f: term if f is arg else f) for term in _additiveterms(arg, name)]
+  return [func]
+
 def _eval_ast(ast, functions):
   '''evaluate ``ast`` generated by :func:`nutils.expression.parse`'''
 
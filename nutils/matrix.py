@@ -27,7 +27,7 @@ the ``export`` method.
 """
 
 from . import numpy, numeric, warnings, cache, types, config, util
-import abc, sys, ctypes, treelog as log
+import abc, sys, ctypes, hashlib, collections, treelog as log
 
 
 class MatrixError(Exception): pass
@@ -58,6 +58,13 @@ class Backend(metaclass=abc.ABCMeta):
     .. Note:: This function is abstract.
     '''
 
+  @classmethod
+  def isavailable(cls):
+    '''Return ``True`` if the dependencies of this backend are available,
+    importing or loading them on first use rather than at module import.'''
+
+    return True
+
 class Matrix(metaclass=types.CacheMeta):
   'matrix base class'
 
@@ -109,9 +116,11 @@ class Matrix(metaclass=types.CacheMeta):
 
     Args
     ----
-    rhs : :class:`float` vector or :any:`None`
-        Right hand side vector. `None` implies all zeros.
-    lhs0 : class:`float` vector or :any:`None`
+    rhs : :class:`float` vector, two dimensional array, or :any:`None`
+        Right hand side vector. `None` implies all zeros. A two dimensional
+        array of shape ``(n, k)`` represents ``k`` right hand sides that are
+        solved simultaneously, reusing factorizations and preconditioners.
+    lhs0 : class:`float` vector, two dimensional array, or :any:`None`
         Initial values. `None` implies all zeros.
     constrain : :class:`float` or :class:`bool` array, or :any:`None`
         Column constraints. For float values, a number signifies a constraint,
@@ -122,11 +131,16 @@ class Matrix(metaclass=types.CacheMeta):
         Row constrains. A True value signifies a constrains, a False value a free
         dof. `None` implies that the constraints follow those defined in
         `constrain` (by implication the matrix must be square).
+    reuse : :class:`bool`
+        Retain the factorization of a direct solver, such that subsequent
+        solves with the same matrix and constraints skip it. Defaults to
+        false.
 
     Returns
     -------
     :class:`numpy.ndarray`
-        Left hand side vector.
+        Left hand side vector, or array of shape ``(n, k)`` for ``k`` right
+        hand sides.
     '''
 
   @abc.abstractmethod
@@ -167,11 +181,13 @@ def preparesolvearguments(wrapped):
 
   def solve(self, rhs=None, *, lhs0=None, constrain=None, rconstrain=None, **solverargs):
     nrows, ncols = self.shape
+    nrhs = numpy.shape(rhs)[1:] if rhs is not None else numpy.shape(lhs0)[1:] if lhs0 is not None else ()
+    assert len(nrhs) <= 1, 'right hand side should be a vector or a two dimensional array'
     if lhs0 is None:
-      x = numpy.zeros(ncols)
+      x = numpy.zeros((ncols,)+nrhs)
     else:
       x = numpy.array(lhs0, dtype=float)
-      assert x.shape == (ncols,)
+      assert x.shape == (ncols,)+nrhs
     if constrain is None:
       J = numpy.ones(ncols, dtype=bool)
     else:
@@ -180,7 +196,7 @@ def preparesolvearguments(wrapped):
         J = ~constrain
       else:
         J = numpy.isnan(constrain)
-        x[~J] = constrain[~J]
+        x[~J] = constrain[~J].reshape((-1,)+(1,)*len(nrhs))
     if rconstrain is None:
       assert nrows == ncols
       I = J
@@ -192,7 +208,19 @@ def preparesolvearguments(wrapped):
       rhs = 0.
     b = (rhs - self.matvec(x))[J]
     if b.any():
-      x[J] += wrapped(self if I.all() and J.all() else self.submatrix(I, J), b, **solverargs)
+      if I.all() and J.all():
+        A = self
+      elif not solverargs.get('reuse'):
+        A = self.submatrix(I, J)
+      else:
+        # retain the last submatrix such that repeated solves with identical
+        # constraints can reuse its factorization
+        key = numpy.packbits(I).tobytes() + numpy.packbits(J).tobytes()
+        lastkey, A = getattr(self, '_lastsubmatrix', (None, None))
+        if key != lastkey:
+          A = self.submatrix(I, J)
+          self._lastsubmatrix = key, A
+      x[J] += wrapped(A, b, **solverargs)
       if not numpy.isfinite(x).all():
         raise MatrixError('solver returned non-finite left hand side')
       log.info('solver returned with residual {:.0e}'.format(numpy.linalg.norm((rhs - self.matvec(x))[J])))
@@ -254,7 +282,7 @@ class NumpyMatrix(Matrix):
     return numpy.greater(abs(self.core), tol).any(axis=1)
 
   @preparesolvearguments
-  def solve(self, rhs):
+  def solve(self, rhs, reuse=False):
     try:
       return numpy.linalg.solve(self.core, rhs)
     except numpy.linalg.LinAlgError as e:
@@ -266,78 +294,97 @@ class NumpyMatrix(Matrix):
 
 ## SCIPY BACKEND
 
-try:
-  import scipy.sparse.linalg
-except ImportError:
-  pass
-else:
-
-  class Scipy(Backend):
-    '''matrix backend based on scipy's sparse matrices'''
-
-    def assemble(self, data, index, shape):
-      if len(shape) < 2:
-        return numeric.accumulate(data, index, shape)
-      if len(shape) == 2:
-        csr = scipy.sparse.csr_matrix((data, index), shape)
-        return ScipyMatrix(csr)
-      raise MatrixError('{}d data not supported by scipy backend'.format(len(shape)))
-
-  class ScipyMatrix(Matrix):
-    '''matrix based on any of scipy's sparse matrices'''
-
-    def __init__(self, core):
-      self.core = core
-      super().__init__(core.shape)
-
-    def __add__(self, other):
-      if not isinstance(other, ScipyMatrix) or self.shape != other.shape:
-        return NotImplemented
-      return ScipyMatrix(self.core + other.core)
-
-    def __sub__(self, other):
-      if not isinstance(other, ScipyMatrix) or self.shape != other.shape:
-        return NotImplemented
-      return ScipyMatrix(self.core - other.core)
-
-    def __mul__(self, other):
-      if not numeric.isnumber(other):
-        return NotImplemented
-      return ScipyMatrix(self.core * other)
-
-    def __neg__(self):
-      return ScipyMatrix(-self.core)
-
-    def matvec(self, vec):
-      return self.core.dot(vec)
-
-    def export(self, form):
-      if form == 'dense':
-        return self.core.toarray()
-      if form == 'csr':
-        csr = self.core.tocsr()
-        return csr.data, csr.indices, csr.indptr
-      if form == 'coo':
-        coo = self.core.tocoo()
-        return coo.data, (coo.row, coo.col)
-      raise NotImplementedError('cannot export NumpyMatrix to {!r}'.format(form))
-
-    @property
-    def T(self):
-      return ScipyMatrix(self.core.transpose())
-
-    @preparesolvearguments
-    def solve(self, rhs, atol=0, solver='spsolve', callback=None, precon=None, **solverargs):
-      if solver == 'spsolve':
-        log.info('solving system using sparse direct solver')
-        return scipy.sparse.linalg.spsolve(self.core, rhs)
-      assert atol, 'tolerance must be specified for iterative solver'
-      rhsnorm = numpy.linalg.norm(rhs)
+class Scipy(Backend):
+  '''matrix backend based on scipy's sparse matrices'''
+
+  @classmethod
+  def isavailable(cls):
+    try:
+      import scipy.sparse.linalg
+    except ImportError:
+      return False
+    return True
+
+  def assemble(self, data, index, shape):
+    import scipy.sparse.linalg
+    if len(shape) < 2:
+      return numeric.accumulate(data, index, shape)
+    if len(shape) == 2:
+      csr = scipy.sparse.csr_matrix((data, index), shape)
+      return ScipyMatrix(csr)
+    raise MatrixError('{}d data not supported by scipy backend'.format(len(shape)))
+
+class ScipyMatrix(Matrix):
+  '''matrix based on any of scipy's sparse matrices'''
+
+  _factors = False
+
+  def __init__(self, core):
+    self.core = core
+    super().__init__(core.shape)
+
+  def __add__(self, other):
+    if not isinstance(other, ScipyMatrix) or self.shape != other.shape:
+      return NotImplemented
+    return ScipyMatrix(self.core + other.core)
+
+  def __sub__(self, other):
+    if not isinstance(other, ScipyMatrix) or self.shape != other.shape:
+      return NotImplemented
+    return ScipyMatrix(self.core - other.core)
+
+  def __mul__(self, other):
+    if not numeric.isnumber(other):
+      return NotImplemented
+    return ScipyMatrix(self.core * other)
+
+  def __neg__(self):
+    return ScipyMatrix(-self.core)
+
+  def matvec(self, vec):
+    return self.core.dot(vec)
+
+  def export(self, form):
+    if form == 'dense':
+      return self.core.toarray()
+    if form == 'csr':
+      csr = self.core.tocsr()
+      return csr.data, csr.indices, csr.indptr
+    if form == 'coo':
+      coo = self.core.tocoo()
+      return coo.data, (coo.row, coo.col)
+    raise NotImplementedError('cannot export NumpyMatrix to {!r}'.format(form))
+
+  @property
+  def T(self):
+    return ScipyMatrix(self.core.transpose())
+
+  @preparesolvearguments
+  def solve(self, rhs, atol=0, solver='spsolve', callback=None, precon=None, reuse=False, **solverargs):
+    import scipy.sparse.linalg
+    if solver == 'spsolve':
+      log.info('solving system using sparse direct solver')
+      if not reuse:
+        return scipy.sparse.linalg.spsolve(self.core, rhs).reshape(rhs.shape)
+      if self._factors:
+        log.info('reusing existing factorization')
+      else:
+        try:
+          self._factors = scipy.sparse.linalg.splu(self.core.tocsc())
+        except RuntimeError as e:
+          raise MatrixError(e) from e
+      return self._factors.solve(rhs)
+    assert atol, 'tolerance must be specified for iterative solver'
+    M = self.getprecon(precon) if isinstance(precon, str) else precon(self.core) if callable(precon) else precon
+    solverfun = getattr(scipy.sparse.linalg, solver)
+    lhs = numpy.zeros(rhs.shape)
+    # multiple right hand sides are solved consecutively, reusing the preconditioner
+    for i in numpy.ndindex(rhs.shape[1:]):
+      rhsnorm = numpy.linalg.norm(rhs[(slice(None),)+i])
       if rhsnorm <= atol:
-        return numpy.zeros(self.shape[1])
+        continue
       log.info('solving system using {} iterative solver'.format(solver))
-      solverfun = getattr(scipy.sparse.linalg, solver)
-      myrhs = rhs / rhsnorm # normalize right hand side vector for best control over scipy's stopping criterion
+      myrhs = rhs[(slice(None),)+i] / rhsnorm # normalize right hand side vector for best control over scipy's stopping criterion
       mytol = atol / rhsnorm
       niter = numpy.array(0)
       def mycallback(arg):
@@ -348,223 +395,585 @@ else:
           callback(res)
         with log.context('residual {:.2e} ({:.0f}%)'.format(res, 100. * numpy.log10(res) / numpy.log10(mytol) if res > 0 else 0)):
           pass
-      M = self.getprecon(precon) if isinstance(precon, str) else precon(self.core) if callable(precon) else precon
       mylhs, status = solverfun(self.core, myrhs, M=M, tol=mytol, callback=mycallback, **solverargs)
       if status != 0:
         raise MatrixError('{} solver failed with status {}'.format(solver, status))
       log.info('solver converged in {} iterations'.format(niter))
-      return mylhs * rhsnorm
+      lhs[(slice(None),)+i] = mylhs * rhsnorm
+    return lhs
+
+  def getprecon(self, name):
+    import scipy.sparse.linalg
+    name = name.lower()
+    assert self.shape[0] == self.shape[1], 'constrained matrix must be square'
+    log.info('building {} preconditioner'.format(name))
+    if name == 'splu':
+      try:
+        precon = scipy.sparse.linalg.splu(self.core.tocsc()).solve
+      except RuntimeError as e:
+        raise MatrixError(e) from e
+    elif name == 'spilu':
+      try:
+        precon = scipy.sparse.linalg.spilu(self.core.tocsc(), drop_tol=1e-5, fill_factor=None, drop_rule=None, permc_spec=None, diag_pivot_thresh=None, relax=None, panel_size=None, options=None).solve
+      except RuntimeError as e:
+        raise MatrixError(e) from e
+    elif name == 'diag':
+      diag = self.core.diagonal()
+      if not diag.all():
+        raise MatrixError("building 'diag' preconditioner: diagonal has zero entries")
+      precon = numpy.reciprocal(diag).__mul__
+    elif name == 'amg':
+      precon = _multigrid(self.core, _aggregation_prolongators(self.core.tocsr()), nsmooth=2, relax=2/3).matvec
+    else:
+      raise MatrixError('invalid preconditioner {!r}'.format(name))
+    return scipy.sparse.linalg.LinearOperator(self.shape, precon, dtype=float)
 
-    def getprecon(self, name):
-      name = name.lower()
-      assert self.shape[0] == self.shape[1], 'constrained matrix must be square'
-      log.info('building {} preconditioner'.format(name))
-      if name == 'splu':
-        try:
-          precon = scipy.sparse.linalg.splu(self.core.tocsc()).solve
-        except RuntimeError as e:
-          raise MatrixError(e) from e
-      elif name == 'spilu':
-        try:
-          precon = scipy.sparse.linalg.spilu(self.core.tocsc(), drop_tol=1e-5, fill_factor=None, drop_rule=None, permc_spec=None, diag_pivot_thresh=None, relax=None, panel_size=None, options=None).solve
-        except RuntimeError as e:
-          raise MatrixError(e) from e
-      elif name == 'diag':
-        diag = self.core.diagonal()
-        if not diag.all():
-          raise MatrixError("building 'diag' preconditioner: diagonal has zero entries")
-        precon = numpy.reciprocal(diag).__mul__
-      else:
-        raise MatrixError('invalid preconditioner {!r}'.format(name))
-      return scipy.sparse.linalg.LinearOperator(self.shape, precon, dtype=float)
+  def submatrix(self, rows, cols):
+    return ScipyMatrix(self.core[rows,:][:,cols])
+
+class MatrixFree(ScipyMatrix):
+  '''matrix-free operator defined by its action on a vector
+
+  The operator stores no entries but forms every matrix-vector product via
+  the ``matvec`` callable, which makes it suitable for the iterative solvers
+  of :class:`ScipyMatrix` only. Preconditioning is limited to callables and
+  to ``'diag'``, which requires the ``diagonal`` to be provided, unless an
+  assembled ``approximation`` of the operator is provided from which all
+  named preconditioners are built.'''
+
+  def __init__(self, shape, matvec, diagonal=None, approximation=None):
+    import scipy.sparse.linalg
+    assert diagonal is None or numpy.shape(diagonal) == (min(shape),)
+    assert approximation is None or approximation.shape == shape
+    if approximation is not None and not isinstance(approximation, ScipyMatrix):
+      approximation = ScipyMatrix(scipy.sparse.csr_matrix(approximation.export('csr'), shape=shape))
+    self._matvec = matvec
+    self.diagonal = diagonal
+    self.approximation = approximation
+    super().__init__(scipy.sparse.linalg.LinearOperator(shape, matvec, dtype=float))
+
+  @staticmethod
+  def _getdiagonal(mat):
+    return mat.diagonal if isinstance(mat, MatrixFree) else mat.core.diagonal()
+
+  @staticmethod
+  def _getapproximation(mat):
+    return mat.approximation if isinstance(mat, MatrixFree) else mat
+
+  def __add__(self, other):
+    if not isinstance(other, ScipyMatrix) or self.shape != other.shape:
+      return NotImplemented
+    diag1 = self._getdiagonal(self)
+    diag2 = self._getdiagonal(other)
+    approx1 = self._getapproximation(self)
+    approx2 = self._getapproximation(other)
+    return MatrixFree(self.shape, lambda vec: self.matvec(vec) + other.matvec(vec), None if diag1 is None or diag2 is None else diag1 + diag2,
+      None if approx1 is None or approx2 is None else approx1 + approx2)
 
-    def submatrix(self, rows, cols):
-      return ScipyMatrix(self.core[rows,:][:,cols])
+  __radd__ = __add__
+
+  def __sub__(self, other):
+    if not isinstance(other, ScipyMatrix) or self.shape != other.shape:
+      return NotImplemented
+    return self + (-other)
+
+  def __rsub__(self, other):
+    if not isinstance(other, ScipyMatrix) or self.shape != other.shape:
+      return NotImplemented
+    return (-self) + other
+
+  def __mul__(self, other):
+    if not numeric.isnumber(other):
+      return NotImplemented
+    return MatrixFree(self.shape, lambda vec: self.matvec(vec) * other, None if self.diagonal is None else self.diagonal * other,
+      None if self.approximation is None else self.approximation * other)
+
+  def __neg__(self):
+    return self * -1
+
+  @property
+  def T(self):
+    raise NotImplementedError('cannot transpose MatrixFree')
+
+  def matvec(self, vec):
+    if numpy.ndim(vec) == 2:
+      return numpy.stack([self._matvec(v) for v in numpy.transpose(vec)], axis=1)
+    return self._matvec(vec)
+
+  def export(self, form):
+    if form == 'dense':
+      return numpy.stack([self.matvec(e) for e in numpy.eye(self.shape[1])], axis=1)
+    raise NotImplementedError('cannot export MatrixFree to {!r}'.format(form))
+
+  def solve(self, rhs=None, *, solver='gmres', **solverargs):
+    if solver == 'spsolve':
+      raise MatrixError('matrix-free operator requires an iterative solver')
+    return super().solve(rhs, solver=solver, **solverargs)
+
+  def getprecon(self, name):
+    import scipy.sparse.linalg
+    name = name.lower()
+    if self.approximation is not None and (name != 'diag' or self.diagonal is None):
+      return self.approximation.getprecon(name)
+    if name != 'diag':
+      raise MatrixError('preconditioner {!r} requires an assembled matrix'.format(name))
+    if self.diagonal is None:
+      raise MatrixError("building 'diag' preconditioner: diagonal is not available")
+    if not self.diagonal.all():
+      raise MatrixError("building 'diag' preconditioner: diagonal has zero entries")
+    log.info('building diag preconditioner')
+    return scipy.sparse.linalg.LinearOperator(self.shape, numpy.reciprocal(self.diagonal).__mul__, dtype=float)
+
+  def submatrix(self, rows, cols):
+    rows = numpy.arange(self.shape[0])[rows]
+    cols = numpy.arange(self.shape[1])[cols]
+    def matvec(vec):
+      x = numpy.zeros(self.shape[1])
+      x[cols] = vec
+      return self.matvec(x)[rows]
+    return MatrixFree((len(rows), len(cols)), matvec, self.diagonal[rows] if self.diagonal is not None and numpy.array_equal(rows, cols) else None,
+      None if self.approximation is None else self.approximation.submatrix(rows, cols))
+
+def _multigrid(core, prolongators, nsmooth, relax):
+  '''V-cycle preconditioner with damped Jacobi smoothing.
+
+  The coarse level operators follow from Galerkin projection with the
+  prolongators, ordered from fine to coarse. The coarsest level is solved
+  directly.'''
+
+  import scipy.sparse.linalg
+
+  core = core.tocsr()
+  levels = []
+  A = core
+  for P in prolongators:
+    diag = A.diagonal()
+    if not diag.all():
+      raise MatrixError('building multigrid preconditioner: diagonal has zero entries')
+    levels.append((A, relax / diag, P))
+    A = P.T.dot(A.dot(P)).tocsr()
+  try:
+    coarsesolve = scipy.sparse.linalg.splu(A.tocsc()).solve
+  except RuntimeError as e:
+    raise MatrixError(e) from e
+  log.info('multigrid hierarchy of {} levels with {} coarse dofs'.format(len(levels)+1, A.shape[0]))
+  def vcycle(rhs, ilevel=0):
+    if ilevel == len(levels):
+      return coarsesolve(rhs)
+    A, invdiag, P = levels[ilevel]
+    lhs = invdiag * rhs
+    for i in range(nsmooth-1):
+      lhs += invdiag * (rhs - A.dot(lhs))
+    lhs += P.dot(vcycle(P.T.dot(rhs - A.dot(lhs)), ilevel+1))
+    for i in range(nsmooth):
+      lhs += invdiag * (rhs - A.dot(lhs))
+    return lhs
+  return scipy.sparse.linalg.LinearOperator(core.shape, lambda rhs: vcycle(numpy.ravel(rhs)), dtype=float)
+
+_aggregation_cache = collections.OrderedDict()
+
+def _aggregation_prolongators(core, theta=.08, maxcoarse=500, cachesize=4):
+  '''Prolongators of smoothed aggregation algebraic multigrid.
+
+  Aggregates are formed greedily from the strongly connected neighbourhoods
+  of the matrix graph; the piecewise constant tentative prolongator is
+  smoothed by a single damped Jacobi step. The result is cached per sparsity
+  pattern, such that repeated solves of matrices with different values but
+  identical structure, as in Newton iterations or time stepping, reuse the
+  hierarchy.'''
+
+  key = hashlib.sha1('{}x{}'.format(*core.shape).encode())
+  key.update(core.indptr.astype(numpy.int64).tobytes())
+  key.update(core.indices.astype(numpy.int64).tobytes())
+  key = key.digest()
+  try:
+    prolongators = _aggregation_cache.pop(key)
+  except KeyError:
+    log.info('building aggregation hierarchy')
+    prolongators = []
+    A = core
+    while A.shape[0] > maxcoarse:
+      P = _smoothed_aggregation(A, theta)
+      if P.shape[1] >= A.shape[0]:
+        break
+      prolongators.append(P)
+      A = P.T.dot(A.dot(P)).tocsr()
+    prolongators = tuple(prolongators)
+  else:
+    log.info('reusing aggregation hierarchy')
+  _aggregation_cache[key] = prolongators
+  while len(_aggregation_cache) > cachesize:
+    _aggregation_cache.popitem(last=False)
+  return prolongators
+
+def _smoothed_aggregation(A, theta):
+  import scipy.sparse.linalg
+  n = A.shape[0]
+  diag = A.diagonal()
+  if not diag.all():
+    raise MatrixError("building 'amg' preconditioner: diagonal has zero entries")
+  # strength of connection: |a_ij| >= theta sqrt(|a_ii a_jj|)
+  coo = A.tocoo()
+  strong = (coo.row != coo.col) & (numpy.abs(coo.data) >= theta * numpy.sqrt(numpy.abs(diag[coo.row] * diag[coo.col])))
+  S = scipy.sparse.csr_matrix((numpy.ones(strong.sum()), (coo.row[strong], coo.col[strong])), shape=A.shape)
+  # pass 1: aggregate nodes of which the entire strong neighbourhood is free;
+  # this greedy sweep is inherently sequential and runs on plain lists, which
+  # avoids the overhead of numpy indexing in every iteration
+  indptr, indices = S.indptr.tolist(), S.indices.tolist()
+  aggregate = [-1] * n
+  naggregates = 0
+  for i in range(n):
+    if aggregate[i] == -1:
+      neighbours = indices[indptr[i]:indptr[i+1]]
+      if all(aggregate[j] == -1 for j in neighbours):
+        aggregate[i] = naggregates
+        for j in neighbours:
+          aggregate[j] = naggregates
+        naggregates += 1
+  aggregate = numpy.array(aggregate, dtype=int)
+  # pass 2: add remaining nodes to the aggregate of their first strongly
+  # connected neighbour that was aggregated in pass 1
+  row = numpy.repeat(numpy.arange(n), numpy.diff(S.indptr))
+  connected = (aggregate[row] == -1) & (aggregate[S.indices] != -1)
+  row, col = row[connected], S.indices[connected]
+  first = numpy.ones(len(row), dtype=bool)
+  first[1:] = row[1:] != row[:-1]
+  aggregate[row[first]] = aggregate[col[first]]
+  # pass 3: nodes that are left, if any, form aggregates of their own
+  left, = numpy.where(aggregate == -1)
+  aggregate[left] = naggregates + numpy.arange(len(left))
+  naggregates += len(left)
+  # piecewise constant tentative prolongator with orthonormal columns
+  T = scipy.sparse.csr_matrix((1 / numpy.sqrt(numpy.bincount(aggregate)[aggregate]), (numpy.arange(n), aggregate)), shape=(n, naggregates))
+  # smoothing by damped jacobi, with weight 4/3 over the estimated spectral radius of inv(D) A
+  DinvA = scipy.sparse.diags(1/diag).dot(A).tocsr()
+  x = numpy.sin(numpy.arange(1, n+1)) # "random" start vector for power iteration
+  for i in range(10):
+    x = DinvA.dot(x)
+    rho = numpy.linalg.norm(x)
+    x /= rho
+  return (T - (4/3/rho) * DinvA.dot(T)).tocsr()
+
+def multigrid(prolongators, constrain=None, *, nsmooth=2, relax=2/3):
+  '''Geometric multigrid preconditioner.
+
+  Create a preconditioner for the iterative solvers of :class:`ScipyMatrix`
+  from a hierarchy of nested function spaces, to be passed as the ``precon``
+  argument of :meth:`ScipyMatrix.solve`. The prolongators are typically
+  formed by :meth:`nutils.topology.Topology.prolongation`. Every application
+  of the preconditioner performs a single V-cycle, of which the cost scales
+  linearly in the number of dofs.
+
+  Args
+  ----
+  prolongators : sequence of :class:`Matrix`
+      Prolongation operators ordered from coarse to fine, where operator
+      ``i`` maps level ``i`` to level ``i+1``; the last operator maps to the
+      space of the matrix that is being solved.
+  constrain : :class:`float` or :class:`bool` array, or :any:`None`
+      Constraints on the finest level, identical to the ``constrain`` argument
+      of :meth:`Matrix.solve`.
+  nsmooth : :class:`int`
+      Number of pre- and post-smoothing steps per level.
+  relax : :class:`float`
+      Relaxation factor of the damped Jacobi smoother.
+
+  Returns
+  -------
+  :any:`callable`
+      Function that builds a :class:`scipy.sparse.linalg.LinearOperator` from
+      the (constrained) sparse matrix.
+  '''
+
+  import scipy.sparse.linalg
+
+  Ps = []
+  keep = None if constrain is None \
+    else ~constrain if constrain.dtype == bool \
+    else numpy.isnan(constrain)
+  for P in reversed(prolongators):
+    P = scipy.sparse.csr_matrix(P.export('csr'), shape=P.shape)
+    if keep is not None:
+      P = P[keep]
+    keep = P.getnnz(axis=0) > 0
+    Ps.append(P[:,keep])
+  def precon(core):
+    if core.shape[0] != Ps[0].shape[0]:
+      raise MatrixError('multigrid preconditioner expects a {0}x{0} matrix but got {1}x{2}'.format(Ps[0].shape[0], *core.shape))
+    return _multigrid(core, Ps, nsmooth, relax)
+  return precon
 
 
 ## INTEL MKL BACKEND
 
-libmkl = util.loadlib(linux='libmkl_rt.so', darwin='libmkl_rt.dylib', win32='mkl_rt.dll')
-if libmkl is not None:
+# typedefs
+c_int = types.c_array[numpy.int32]
+c_long = types.c_array[numpy.int64]
+c_double = types.c_array[numpy.float64]
 
-  # typedefs
-  c_int = types.c_array[numpy.int32]
-  c_long = types.c_array[numpy.int64]
-  c_double = types.c_array[numpy.float64]
+_libnames = dict(
+  mkl=dict(linux='libmkl_rt.so', darwin='libmkl_rt.dylib', win32='mkl_rt.dll'),
+  tbb=dict(linux='libtbb.so.2', darwin='libtbb.dylib', win32='tbb.dll'))
+_libs = {}
 
-  libtbb = util.loadlib(linux='libtbb.so.2', darwin='libtbb.dylib', win32='tbb.dll')
+def _loadlib(name):
+  # Returns the dynamic library `name` listed in `_libnames`, which is loaded
+  # on first use, or `None` if the library is not available.
+  if name not in _libs:
+    _libs[name] = util.loadlib(**_libnames[name])
+  return _libs[name]
 
-  class MKL(Backend):
-    '''matrix backend based on Intel's Math Kernel Library'''
+class MKL(Backend):
+  '''matrix backend based on Intel's Math Kernel Library'''
 
-    def __enter__(self):
-      super().__enter__()
-      usethreads = config.nprocs > 1
-      libmkl.mkl_set_threading_layer(c_long(4 if usethreads else 1)) # 1:SEQUENTIAL, 4:TBB
-      if usethreads and libtbb:
-        self.tbbhandle = ctypes.c_void_p()
-        libtbb._ZN3tbb19task_scheduler_init10initializeEim(ctypes.byref(self.tbbhandle), ctypes.c_int(config.nprocs), ctypes.c_int(2))
-      else:
-        self.tbbhandle = None
-      return self
-
-    def __exit__(self, etype, value, tb):
-      if self.tbbhandle:
-        libtbb._ZN3tbb19task_scheduler_init9terminateEv(ctypes.byref(self.tbbhandle))
-      super().__exit__(etype, value, tb)
-
-    @staticmethod
-    def assemble(data, index, shape):
-      if len(shape) < 2:
-        return numeric.accumulate(data, index, shape)
-      if len(shape) == 2:
-        return MKLMatrix(data, index, shape)
-      raise MatrixError('{}d data not supported by scipy backend'.format(len(shape)))
-
-  class Pardiso:
-    '''simple wrapper for libmkl.pardiso
-
-    https://software.intel.com/en-us/mkl-developer-reference-c-pardiso
-    '''
+  @classmethod
+  def isavailable(cls):
+    return _loadlib('mkl') is not None
+
+  def __enter__(self):
+    if not self.isavailable():
+      raise MatrixError('MKL is not available')
+    super().__enter__()
+    usethreads = config.nprocs > 1
+    _loadlib('mkl').mkl_set_threading_layer(c_long(4 if usethreads else 1)) # 1:SEQUENTIAL, 4:TBB
+    libtbb = _loadlib('tbb')
+    if usethreads and libtbb:
+      self.tbbhandle = ctypes.c_void_p()
+      libtbb._ZN3tbb19task_scheduler_init10initializeEim(ctypes.byref(self.tbbhandle), ctypes.c_int(config.nprocs), ctypes.c_int(2))
+    else:
+      self.tbbhandle = None
+    return self
 
-    _pardiso = libmkl.pardiso
-    _errorcodes = {
-      -1: 'input inconsistent',
-      -2: 'not enough memory',
-      -3: 'reordering problem',
-      -4: 'zero pivot, numerical factorization or iterative refinement problem',
-      -5: 'unclassified (internal) error',
-      -6: 'reordering failed (matrix types 11 and 13 only)',
-      -7: 'diagonal matrix is singular',
-      -8: '32-bit integer overflow problem',
-      -9: 'not enough memory for OOC',
-     -10: 'error opening OOC files',
-     -11: 'read/write error with OOC files',
-     -12: 'pardiso_64 called from 32-bit library',
-    }
-
-    def __init__(self):
-      self.pt = numpy.zeros(64, numpy.int64) # handle to data structure
-
-    @types.apply_annotations
-    def __call__(self, *, phase:c_int, iparm:c_int, maxfct:c_int=1, mnum:c_int=1, mtype:c_int=0, n:c_int=0, a:c_double=None, ia:c_int=None, ja:c_int=None, perm:c_int=None, nrhs:c_int=0, msglvl:c_int=0, b:c_double=None, x:c_double=None):
-      error = ctypes.c_int32(1)
-      self._pardiso(self.pt.ctypes, maxfct, mnum, mtype, phase, n, a, ia, ja, perm, nrhs, iparm, msglvl, b, x, ctypes.byref(error))
-      if error.value:
-        raise MatrixError(self._errorcodes.get(error.value, 'unknown error {}'.format(error.value)))
-
-    def __del__(self):
-      if self.pt.any(): # release all internal memory for all matrices
-        self(phase=-1, iparm=numpy.zeros(64, dtype=numpy.int32))
-        assert not self.pt.any(), 'it appears that Pardiso failed to release its internal memory'
-
-  class MKLMatrix(Matrix):
-    '''matrix implementation based on sorted coo data'''
-
-    __cache__ = 'indptr',
-
-    _factors = False
-
-    def __init__(self, data, index, shape):
-      assert index.shape == (2, len(data))
-      if len(data):
+  def __exit__(self, etype, value, tb):
+    if self.tbbhandle:
+      _loadlib('tbb')._ZN3tbb19task_scheduler_init9terminateEv(ctypes.byref(self.tbbhandle))
+    super().__exit__(etype, value, tb)
+
+  @staticmethod
+  def assemble(data, index, shape):
+    if len(shape) < 2:
+      return numeric.accumulate(data, index, shape)
+    if len(shape) == 2:
+      return MKLMatrix(data, index, shape)
+    raise MatrixError('{}d data not supported by scipy backend'.format(len(shape)))
+
+class Pardiso:
+  '''simple wrapper for libmkl.pardiso
+
+  https://software.intel.com/en-us/mkl-developer-reference-c-pardiso
+  '''
+
+  _errorcodes = {
+    -1: 'input inconsistent',
+    -2: 'not enough memory',
+    -3: 'reordering problem',
+    -4: 'zero pivot, numerical factorization or iterative refinement problem',
+    -5: 'unclassified (internal) error',
+    -6: 'reordering failed (matrix types 11 and 13 only)',
+    -7: 'diagonal matrix is singular',
+    -8: '32-bit integer overflow problem',
+    -9: 'not enough memory for OOC',
+   -10: 'error opening OOC files',
+   -11: 'read/write error with OOC files',
+   -12: 'pardiso_64 called from 32-bit library',
+  }
+
+  def __init__(self):
+    self.pt = numpy.zeros(64, numpy.int64) # handle to data structure
+
+  @types.apply_annotations
+  def __call__(self, *, phase:c_int, iparm:c_int, maxfct:c_int=1, mnum:c_int=1, mtype:c_int=0, n:c_int=0, a:c_double=None, ia:c_int=None, ja:c_int=None, perm:c_int=None, nrhs:c_int=0, msglvl:c_int=0, b:c_double=None, x:c_double=None):
+    error = ctypes.c_int32(1)
+    _loadlib('mkl').pardiso(self.pt.ctypes, maxfct, mnum, mtype, phase, n, a, ia, ja, perm, nrhs, iparm, msglvl, b, x, ctypes.byref(error))
+    if error.value:
+      raise MatrixError(self._errorcodes.get(error.value, 'unknown error {}'.format(error.value)))
+
+  def __del__(self):
+    if self.pt.any(): # release all internal memory for all matrices
+      self(phase=-1, iparm=numpy.zeros(64, dtype=numpy.int32))
+      assert not self.pt.any(), 'it appears that Pardiso failed to release its internal memory'
+
+class SparseHandle:
+  '''simple wrapper for libmkl's inspector-executor sparse matrix handle
+
+  https://software.intel.com/en-us/mkl-developer-reference-c-inspector-executor-sparse-blas-routines
+  '''
+
+  class _descr(ctypes.Structure):
+    _fields_ = ('type', ctypes.c_int), ('mode', ctypes.c_int), ('diag', ctypes.c_int)
+
+  _general = _descr(20, 40, 50) # SPARSE_MATRIX_TYPE_GENERAL, SPARSE_FILL_MODE_LOWER (ignored), SPARSE_DIAG_NON_UNIT
+  _errorcodes = {
+    1: 'empty handle or matrix arrays',
+    2: 'internal memory allocation failed',
+    3: 'input parameters contain an invalid value',
+    4: 'execution failed',
+    5: 'an error in algorithm implementation occurred',
+    6: 'the requested operation is not supported',
+  }
+
+  def __init__(self, data, indices, indptr, shape):
+    self._arrays = data, indices, indptr # referenced, not copied, by mkl
+    self.handle = ctypes.c_void_p()
+    self._check(_loadlib('mkl').mkl_sparse_d_create_csr(ctypes.byref(self.handle), ctypes.c_int(0), # SPARSE_INDEX_BASE_ZERO
+      ctypes.c_int32(shape[0]), ctypes.c_int32(shape[1]), indptr[:-1].ctypes, indptr[1:].ctypes, indices.ctypes, data.ctypes))
+
+  def _check(self, status):
+    if status:
+      raise MatrixError(self._errorcodes.get(status, 'unknown error {}'.format(status)))
+
+  def mv(self, x, y, alpha=1., beta=0.):
+    'y = alpha A x + beta y'
+
+    self._check(_loadlib('mkl').mkl_sparse_d_mv(ctypes.c_int(10), ctypes.c_double(alpha), self.handle, self._general, x.ctypes, ctypes.c_double(beta), y.ctypes)) # SPARSE_OPERATION_NON_TRANSPOSE
+
+  def mm(self, x, y, alpha=1., beta=0.):
+    'Y = alpha A X + beta Y for row major X, Y'
+
+    ncols = ctypes.c_int32(x.shape[1])
+    self._check(_loadlib('mkl').mkl_sparse_d_mm(ctypes.c_int(10), ctypes.c_double(alpha), self.handle, self._general, ctypes.c_int(101), # SPARSE_OPERATION_NON_TRANSPOSE, SPARSE_LAYOUT_ROW_MAJOR
+      x.ctypes, ncols, ncols, ctypes.c_double(beta), y.ctypes, ncols))
+
+  def __del__(self):
+    if self.handle:
+      _loadlib('mkl').mkl_sparse_destroy(self.handle)
+
+class MKLMatrix(Matrix):
+  '''matrix implementation based on sorted coo data'''
+
+  __cache__ = 'indptr', 'sparsehandle'
+
+  _factors = False
+
+  def __init__(self, data, index, shape, *, issorted=False):
+    assert index.shape == (2, len(data))
+    if len(data):
+      if not issorted:
         # sort rows, columns
         reorder = numpy.lexsort(index[::-1])
         index = index[:,reorder]
         data = data[reorder]
-        # sum duplicate entries
-        keep = numpy.empty(len(reorder), dtype=bool)
-        keep[0] = True
-        numpy.not_equal(index[:,1:], index[:,:-1]).any(axis=0, out=keep[1:])
-        if not keep.all():
-          index = index[:,keep]
-          data = numeric.accumulate(data, [keep.cumsum()-1], [index.shape[1]])
-        if not data.all():
-          nz = data.astype(bool)
-          data = data[nz]
-          index = index[:,nz]
-      self.data = numpy.ascontiguousarray(data, dtype=numpy.float64)
-      self.index = numpy.ascontiguousarray(index, dtype=numpy.int32)
-      super().__init__(shape)
-
-    @property
-    def indptr(self):
-      return self.index[0].searchsorted(numpy.arange(self.shape[0]+1)).astype(numpy.int32, copy=False)
-
-    def __add__(self, other):
-      if not isinstance(other, MKLMatrix) or self.shape != other.shape:
-        return NotImplemented
-      return MKLMatrix(numpy.concatenate([self.data, other.data]), numpy.concatenate([self.index, other.index], axis=1), self.shape)
-
-    def __sub__(self, other):
-      if not isinstance(other, MKLMatrix) or self.shape != other.shape:
-        return NotImplemented
-      return MKLMatrix(numpy.concatenate([self.data, -other.data]), numpy.concatenate([self.index, other.index], axis=1), self.shape)
-
-    def __mul__(self, other):
-      if not numeric.isnumber(other):
-        return NotImplemented
-      return MKLMatrix(self.data * other, self.index, self.shape)
-
-    def __neg__(self):
-      return MKLMatrix(-self.data, self.index, self.shape)
-
-    @property
-    def T(self):
-      return MKLMatrix(self.data, self.index[::-1], self.shape[::-1])
-
-    def matvec(self, vec):
-      rows, cols = self.index
-      return numeric.accumulate(self.data * vec[cols], [rows], [self.shape[0]])
-
-    def export(self, form):
-      if form == 'dense':
-        return numeric.accumulate(self.data, self.index, self.shape)
-      if form == 'csr':
-        return self.data, self.index[1], self.indptr
-      if form == 'coo':
-        return self.data, self.index
-      raise NotImplementedError('cannot export MKLMatrix to {!r}'.format(form))
-
-    def submatrix(self, rows, cols):
-      I, J = self.index
-      keep = numpy.logical_and(rows[I], cols[J])
-      csI = rows.cumsum()
-      csJ = cols.cumsum()
-      return MKLMatrix(self.data[keep], numpy.array([csI[I[keep]]-1, csJ[J[keep]]-1]), shape=(csI[-1], csJ[-1]))
-
-    @preparesolvearguments
-    def solve(self, rhs):
-      log.info('solving {0}x{0} system using MKL Pardiso'.format(self.shape[0]))
-      if self._factors:
-        log.info('reusing existing factorization')
-        pardiso, iparm, mtype = self._factors
-        phase = 33 # solve, iterative refinement
-      else:
-        pardiso = Pardiso()
-        iparm = numpy.zeros(64, dtype=numpy.int32) # https://software.intel.com/en-us/mkl-developer-reference-c-pardiso-iparm-parameter
-        iparm[0] = 1 # supply all values in components iparm[1:64]
-        iparm[1] = 2 # fill-in reducing ordering for the input matrix: nested dissection algorithm from the METIS package
-        iparm[9] = 13 # pivoting perturbation threshold 1e-13 (default for nonsymmetric)
-        iparm[10] = 1 # enable scaling vectors (default for nonsymmetric)
-        iparm[12] = 1 # enable improved accuracy using (non-) symmetric weighted matching (default for nonsymmetric)
-        iparm[34] = 1 # zero base indexing
-        mtype = 11 # real and nonsymmetric
-        phase = 13 # analysis, numerical factorization, solve, iterative refinement
-        self._factors = pardiso, iparm, mtype
-      lhs = numpy.empty(self.shape[1], dtype=numpy.float64)
-      pardiso(phase=phase, mtype=mtype, iparm=iparm, n=self.shape[0], nrhs=1, b=rhs, x=lhs, a=self.data, ia=self.indptr, ja=self.index[1])
-      return lhs
+      # sum duplicate entries
+      keep = numpy.empty(len(data), dtype=bool)
+      keep[0] = True
+      numpy.not_equal(index[:,1:], index[:,:-1]).any(axis=0, out=keep[1:])
+      if not keep.all():
+        index = index[:,keep]
+        data = numeric.accumulate(data, [keep.cumsum()-1], [index.shape[1]])
+      if not data.all():
+        nz = data.astype(bool)
+        data = data[nz]
+        index = index[:,nz]
+    self.data = numpy.ascontiguousarray(data, dtype=numpy.float64)
+    self.index = numpy.ascontiguousarray(index, dtype=numpy.int32)
+    super().__init__(shape)
+
+  @property
+  def indptr(self):
+    return self.index[0].searchsorted(numpy.arange(self.shape[0]+1)).astype(numpy.int32, copy=False)
+
+  @property
+  def sparsehandle(self):
+    return SparseHandle(self.data, self.index[1], self.indptr, self.shape)
+
+  def _add(self, other, sign):
+    if self.index is other.index or numpy.array_equal(self.index, other.index):
+      # identical sparsity patterns: add data without reordering
+      return MKLMatrix(self.data + sign * other.data, self.index, self.shape, issorted=True)
+    # merge two sorted sequences; a stable sort detects and merges the two runs in linear time
+    index = numpy.concatenate([self.index, other.index], axis=1)
+    reorder = numpy.argsort(index[0].astype(numpy.int64) * self.shape[1] + index[1], kind='mergesort')
+    return MKLMatrix(numpy.concatenate([self.data, sign * other.data])[reorder], index[:,reorder], self.shape, issorted=True)
+
+  def __add__(self, other):
+    if not isinstance(other, MKLMatrix) or self.shape != other.shape:
+      return NotImplemented
+    return self._add(other, 1)
+
+  def __sub__(self, other):
+    if not isinstance(other, MKLMatrix) or self.shape != other.shape:
+      return NotImplemented
+    return self._add(other, -1)
+
+  def __mul__(self, other):
+    if not numeric.isnumber(other):
+      return NotImplemented
+    return MKLMatrix(self.data * other, self.index, self.shape, issorted=True)
+
+  def __neg__(self):
+    return MKLMatrix(-self.data, self.index, self.shape, issorted=True)
+
+  @property
+  def T(self):
+    return MKLMatrix(self.data, self.index[::-1], self.shape[::-1])
+
+  def matvec(self, vec):
+    vec = numpy.ascontiguousarray(vec, dtype=numpy.float64)
+    assert vec.shape[:1] == self.shape[1:] and vec.ndim <= 2
+    if not len(self.data) or not vec.size:
+      return numpy.zeros(self.shape[:1]+vec.shape[1:])
+    retval = numpy.empty(self.shape[:1]+vec.shape[1:], dtype=numpy.float64)
+    if vec.ndim == 1:
+      self.sparsehandle.mv(vec, retval)
+    else:
+      self.sparsehandle.mm(vec, retval)
+    return retval
+
+  def export(self, form):
+    if form == 'dense':
+      return numeric.accumulate(self.data, self.index, self.shape)
+    if form == 'csr':
+      return self.data, self.index[1], self.indptr
+    if form == 'coo':
+      return self.data, self.index
+    raise NotImplementedError('cannot export MKLMatrix to {!r}'.format(form))
+
+  def submatrix(self, rows, cols):
+    I, J = self.index
+    keep = numpy.logical_and(rows[I], cols[J])
+    csI = rows.cumsum()
+    csJ = cols.cumsum()
+    return MKLMatrix(self.data[keep], numpy.array([csI[I[keep]]-1, csJ[J[keep]]-1]), shape=(csI[-1], csJ[-1]))
+
+  @preparesolvearguments
+  def solve(self, rhs, reuse=False):
+    nrhs = rhs.shape[1] if rhs.ndim == 2 else 1
+    log.info('solving {0}x{0} system {1}using MKL Pardiso'.format(self.shape[0], 'with {} right hand sides '.format(nrhs) if rhs.ndim == 2 else ''))
+    if self._factors:
+      log.info('reusing existing factorization')
+      pardiso, iparm, mtype = self._factors
+      phase = 33 # solve, iterative refinement
+    else:
+      pardiso = Pardiso()
+      iparm = numpy.zeros(64, dtype=numpy.int32) # https://software.intel.com/en-us/mkl-developer-reference-c-pardiso-iparm-parameter
+      iparm[0] = 1 # supply all values in components iparm[1:64]
+      iparm[1] = 2 # fill-in reducing ordering for the input matrix: nested dissection algorithm from the METIS package
+      iparm[9] = 13 # pivoting perturbation threshold 1e-13 (default for nonsymmetric)
+      iparm[10] = 1 # enable scaling vectors (default for nonsymmetric)
+      iparm[12] = 1 # enable improved accuracy using (non-) symmetric weighted matching (default for nonsymmetric)
+      iparm[34] = 1 # zero base indexing
+      mtype = 11 # real and nonsymmetric
+      phase = 13 # analysis, numerical factorization, solve, iterative refinement
+      self._factors = pardiso, iparm, mtype
+    rhs = numpy.ascontiguousarray(rhs.T, dtype=numpy.float64) # pardiso expects right hand sides in column major order
+    lhs = numpy.empty(rhs.shape, dtype=numpy.float64)
+    pardiso(phase=phase, mtype=mtype, iparm=iparm, n=self.shape[0], nrhs=nrhs, b=rhs, x=lhs, a=self.data, ia=self.indptr, ja=self.index[1])
+    return lhs.T
 
 
 ## MODULE METHODS
 
 _current_backend = Numpy()
 
+def currentbackend():
+  'return the active matrix backend'
+
+  return _current_backend
+
 def backend(names):
   for name in names.lower().split(','):
     for cls in Backend.__subclasses__():
-      if cls.__name__.lower() == name:
+      if cls.__name__.lower() == name and cls.isavailable():
         return cls()
   raise RuntimeError('matrix backend {!r} is not available'.format(names))
 
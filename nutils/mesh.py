@@ -456,6 +456,11 @@ def gmsh(fname, name='gmsh'):
   for e in inodesbydim:
     e.sort(axis=1)
 
+  # freeze the parsed data such that it is shared rather than copied by the
+  # topology, the element transforms and the geometry
+  nodes = types.frozenarray(nodes, copy=False)
+  inodesbydim[ndims] = types.frozenarray(inodesbydim[ndims], copy=False)
+
   # create simplex topology
   root = transform.Identifier(ndims, name)
   topo = topology.SimplexTopology(inodesbydim[ndims], [(root, transform.Simplex(c)) for c in nodes[geomdofs]])
@@ -110,13 +110,63 @@ class Sample(types.Singleton):
     '''
 
     self, funcs = args
+    return self._integrate(funcs, None, arguments)
 
+  @log.withcontext
+  @util.positional_only('self', 'funcs', 'batch')
+  @util.single_or_multiple
+  @types.apply_annotations
+  @cache.function
+  def integrate_batch(*args, **arguments:argdict):
+    '''Integrate functions for a batch of argument values.
+
+    Args
+    ----
+    funcs : :class:`nutils.function.Array` object or :class:`tuple` thereof.
+        The integrand(s).
+    batch : :class:`str`
+        Name of an argument that is given a batch of values, stacked along a
+        new trailing axis. The element loop runs once for all batch members
+        and every integral becomes a :class:`tuple` of results, one for each
+        batch member.
+    arguments : :class:`dict` (default: None)
+        Optional arguments for function evaluation.
+    '''
+
+    self, funcs, batch = args
+    return self._integrate(funcs, types.strictstr(batch), arguments)
+
+  def _integrate(self, funcs, batch, arguments):
     # Functions may consist of several blocks, such as originating from
     # chaining. Here we make a list of all blocks consisting of triplets of
     # argument id, evaluable index, and evaluable values.
 
     funcs = [function.asarray(func).prepare_eval(ndims=self.ndims) for func in funcs]
     blocks = [(ifunc, function.Tuple(ind), f.simplified) for ifunc, func in enumerate(funcs) for ind, f in function.blocks(func)]
+
+    # For a batch of argument values the simplified blocks are duplicated for
+    # every batch member, with the batched argument renamed to a member
+    # specific argument. All subexpressions that do not depend on the batched
+    # argument are shared and thus evaluated only once per element.
+
+    if batch is not None:
+      nbatch, shapes = _batchsize(funcs, batch, arguments)
+      dependent = batch in shapes
+      batchfuncs = funcs
+      if dependent:
+        # Pick member specific names that differ from all given and used
+        # arguments.
+        prefix = batch
+        names = ['{}[{}]'.format(prefix, ibatch) for ibatch in range(nbatch)]
+        while not set(names).isdisjoint(set(arguments) | set(shapes)):
+          prefix += '[]'
+          names = ['{}[{}]'.format(prefix, ibatch) for ibatch in range(nbatch)]
+        arguments = dict(arguments)
+        batchvalue = arguments.pop(batch)
+        arguments.update((name, batchvalue[...,ibatch]) for ibatch, name in enumerate(names))
+        blocks = [(ifunc*nbatch+ibatch, _rename(ind, batch, name), _rename(f, batch, name)) for ifunc, ind, f in blocks for ibatch, name in enumerate(names)]
+        funcs = [func for func in funcs for name in names]
+
     block2func, indices, values = zip(*blocks) if blocks else ([],[],[])
 
     log.debug('integrating {} distinct blocks'.format('+'.join(
@@ -181,6 +231,8 @@ class Sample(types.Singleton):
     for i, func in enumerate(funcs):
       with log.context('assembling {}/{}'.format(i+1, len(funcs))):
         retvals.append(matrix.assemble(*data_index[i], shape=func.shape))
+    if batch is not None:
+      retvals = [tuple(retvals[ifunc*nbatch:(ifunc+1)*nbatch]) if dependent else (retvals[ifunc],) * nbatch for ifunc in range(len(batchfuncs))]
     return retvals
 
   def integral(self, func):
@@ -325,6 +377,7 @@ class Integral(types.Singleton):
   '''
 
   __slots__ = '_integrands', 'shape'
+  __cache__ = 'split',
 
   @types.apply_annotations
   def __init__(self, integrands:types.frozendict[strictsample, function.simplified]):
@@ -345,6 +398,17 @@ class Integral(types.Singleton):
     retval, = eval_integrals(self, **kwargs)
     return retval
 
+  @util.positional_only('self', 'batch')
+  def eval_batch(*args, **kwargs):
+    '''Evaluate integral for a batch of argument values.
+
+    Equivalent to :func:`eval_integrals_batch` (batch, self, ...).
+    '''
+
+    self, batch = args
+    retval, = eval_integrals_batch(batch, self, **kwargs)
+    return retval
+
   def derivative(self, target):
     '''Differentiate integral.
 
@@ -368,6 +432,70 @@ class Integral(types.Singleton):
     seen = {}
     return Integral([di, function.derivative(integrand, var=arg, seen=seen)] for di, integrand in self._integrands.items())
 
+  def split(self, target):
+    '''Split integral into parts of degree zero, one and higher in target.
+
+    Return a constant, linear and nonlinear integral that sum up to self, by
+    splitting all integrands with :func:`nutils.function.splitdegree`. This
+    allows the constant and linear parts to be assembled once in iterative
+    procedures, leaving only the nonlinear part for repeated evaluation.
+
+    Args
+    ----
+    target : :class:`str`
+        Name of the target.
+
+    Returns
+    -------
+    constant : :class:`Integral` or ``None``
+    linear : :class:`Integral` or ``None``
+    nonlinear : :class:`Integral` or ``None``
+        The respective parts, or ``None`` if a part vanishes.
+    '''
+
+    if not self.contains(target):
+      return self, None, None
+    arg = function.Argument(target, self._argshape(target))
+    parts = [], [], []
+    for di, integrand in self._integrands.items():
+      for items, part in zip(parts, function.splitdegree(integrand, arg)):
+        if not function.iszero(part):
+          items.append((di, part))
+    return tuple(Integral(items) if items else None for items in parts)
+
+  @types.apply_annotations
+  def matrixfree(self, **arguments:argdict):
+    '''Create matrix-free operator.
+
+    Return a :class:`nutils.matrix.MatrixFree` operator that represents the
+    (square) matrix integral without assembling it. Every matrix-vector product
+    is formed by element-wise evaluation of the integrand contracted with the
+    vector, which for a jacobian obtained via :func:`derivative` amounts to the
+    directional derivative of the residual. The diagonal, used by the ``'diag'``
+    preconditioner, is integrated element-wise up front.
+
+    Args
+    ----
+    arguments : :class:`dict` (default: None)
+        Optional arguments for function evaluation.
+
+    Returns
+    -------
+    operator : :class:`nutils.matrix.MatrixFree`
+    '''
+
+    if len(self.shape) != 2 or self.shape[0] != self.shape[1]:
+      raise ValueError('expected a square matrix integral but got shape {}'.format(self.shape))
+    vec = function.Argument('_matrixfree_vector', self.shape[1:])
+    if vec._name in arguments:
+      raise ValueError('argument {!r} is reserved'.format(vec._name))
+    products = [_vectorintegrator(di, function.dot(integrand, vec, axes=1)) for di, integrand in self._integrands.items()]
+    diagonal = sum(_vectorintegrator(di, function.takediag(integrand))(arguments) for di, integrand in self._integrands.items())
+    def matvec(v):
+      myarguments = dict(arguments, _matrixfree_vector=v)
+      return sum(product(myarguments) for product in products)
+    return matrix.MatrixFree(self.shape, matvec, diagonal)
+
   def replace(self, arguments):
     '''Return copy with arguments applied.
 
@@ -452,6 +580,24 @@ class Integral(types.Singleton):
 
 strictintegral = types.strict[Integral]
 
+def _vectorintegrator(sample, func):
+  '''Prepare repeated integration of a vector valued function.
+
+  Returns a function that integrates ``func`` over ``sample`` for a dictionary
+  of arguments. Unlike :func:`Sample.integrate` the evaluable is prepared only
+  once and the result is accumulated directly in a dense vector.'''
+
+  func = function.asarray(func).prepare_eval(ndims=sample.ndims)
+  assert func.ndim == 1
+  valueindexfunc = function.Tuple(function.Tuple([f.simplified, ind]) for (ind,), f in function.blocks(func))
+  def integrate(arguments):
+    retval = numpy.zeros(func.shape)
+    for transforms, points in zip(sample.transforms, sample.points):
+      for intdata, (index,) in valueindexfunc.eval(_transforms=transforms, _points=points.coords, **arguments):
+        numpy.add.at(retval, index, numeric.dot(points.weights, intdata))
+    return retval
+  return integrate
+
 @types.apply_annotations
 @cache.function
 def eval_integrals(*integrals: types.tuple[strictintegral], **arguments:argdict):
@@ -474,13 +620,72 @@ def eval_integrals(*integrals: types.tuple[strictintegral], **arguments:argdict)
   results : :class:`tuple` of arrays and/or :class:`nutils.matrix.Matrix` objects.
   '''
 
+  return _eval_integrals(integrals, None, arguments)
+
+@util.positional_only('batch', keep_varpositional=True)
+@types.apply_annotations
+@cache.function
+def eval_integrals_batch(*args, **arguments:argdict):
+  '''Evaluate integrals for a batch of argument values.
+
+  Evaluate one or several postponed integrals like :func:`eval_integrals`, for
+  all members of a batch of values of a single argument in one element loop as
+  described in :func:`Sample.integrate_batch`.
+
+  Args
+  ----
+  batch : :class:`str`
+      Name of an argument that is given a batch of values, stacked along a new
+      trailing axis.
+  integrals : :class:`tuple` of integrals
+      Integrals to be evaluated.
+  arguments : :class:`dict` (default: None)
+      Optional arguments for function evaluation.
+
+  Returns
+  -------
+  results : :class:`tuple` of :class:`tuple`\\s of arrays and/or :class:`nutils.matrix.Matrix` objects.
+      A :class:`tuple` of results for every integral, one for each batch
+      member.
+  '''
+
+  batch, *integrals = args
+  return _eval_integrals(tuple(map(strictintegral, integrals)), types.strictstr(batch), arguments)
+
+def _eval_integrals(integrals, batch, arguments):
   retvals = [None] * len(integrals)
   for sample, iints in util.gather((di, iint) for iint, integral in enumerate(integrals) for di in integral._integrands):
-    for iint, retval in zip(iints, sample.integrate([integrals[iint]._integrands[sample] for iint in iints], **arguments)):
+    funcs = [integrals[iint]._integrands[sample] for iint in iints]
+    for iint, retval in zip(iints, sample.integrate(funcs, **arguments) if batch is None else sample.integrate_batch(funcs, batch, **arguments)):
       if retvals[iint] is None:
         retvals[iint] = retval
+      elif batch is not None:
+        retvals[iint] = tuple(a + b for a, b in zip(retvals[iint], retval))
       else:
-        retvals[iint] += retval
+        retvals[iint] = retvals[iint] + retval
   return retvals
 
+def _batchsize(funcs, batch, arguments):
+  '''Determine the number of values of a batched argument.
+
+  Returns the length of the trailing axis of the value of argument ``batch``,
+  and the shapes of all arguments ``funcs`` depend on by name. If ``funcs``
+  depend on ``batch``, the remaining axes of the value should match its
+  shape.'''
+
+  if batch not in arguments:
+    raise ValueError('batched argument {!r} is not given'.format(batch))
+  value = arguments[batch]
+  if not value.ndim:
+    raise ValueError('batched argument {!r} requires a trailing batch axis'.format(batch))
+  shapes = {func._name: func.shape[:func.ndim-func._nderiv] for func in function.Tuple(funcs).dependencies if isinstance(func, function.Argument)}
+  if batch in shapes and value.shape[:-1] != shapes[batch]:
+    raise ValueError('expected batch of values of shape {} for argument {!r} but got {}'.format(shapes[batch], batch, value.shape))
+  return value.shape[-1], shapes
+
+@function.replace
+def _rename(obj, oldname, newname):
+  if isinstance(obj, function.Argument) and obj._name == oldname:
+    return function.Argument(newname, obj.shape, obj._nderiv)
+
 # vim:sw=2:sts=2:et
@@ -49,8 +49,8 @@ In addition to ``solve_linear`` the solver module defines ``newton`` and
 time dependent problems.
 """
 
-from . import function, cache, log, numeric, sample, types, util, matrix
-import numpy, itertools, functools, numbers, collections
+from . import function, cache, log, numeric, sample, types, util, matrix, config, parallel, points
+import numpy, itertools, functools, numbers, collections, os, signal, traceback, multiprocessing.connection
 
 
 argdict = types.frozendict[types.strictstr,types.frozenarray]
@@ -61,9 +61,17 @@ class SolverError(Exception): pass
 
 @types.apply_annotations
 @cache.function
-def solve_linear(target:types.strictstr, residual:sample.strictintegral, constrain:types.frozenarray=None, *, arguments:argdict={}, solveargs:types.frozendict={}):
+def solve_linear(target:types.strictstr, residual:sample.strictintegral, constrain:types.frozenarray=None, *, condense:bool=False, arguments:argdict={}, solveargs:types.frozendict={}):
   '''solve linear problem
 
+  With ``condense`` the degrees of freedom that are supported on a single
+  element, as defined by the :class:`nutils.function.DofMap` of the bases in
+  the jacobian, are eliminated element by element (static condensation). Only
+  the condensed system of the remaining skeleton dofs is passed to the matrix
+  solver, after which the element interior values are recovered. Dofs that
+  are constrained, or that couple to the interior of another element such as
+  via interface integrals, are kept in the skeleton.
+
   Parameters
   ----------
   target : :class:`str`
@@ -72,6 +80,8 @@ def solve_linear(target:types.strictstr, residual:sample.strictintegral, constra
       Residual integral, depends on ``target``
   constrain : :class:`numpy.ndarray` with dtype :class:`float`
       Defines the fixed entries of the coefficient vector
+  condense : :class:`bool`
+      Eliminate element interior dofs prior to solving. Defaults to false.
   arguments : :class:`collections.abc.Mapping`
       Defines the values for :class:`nutils.function.Argument` objects in
       `residual`.  The ``target`` should not be present in ``arguments``.
@@ -88,6 +98,8 @@ def solve_linear(target:types.strictstr, residual:sample.strictintegral, constra
   assert target not in arguments, '`target` should not be defined in `arguments`'
   argshape = residual._argshape(target)
   res, jac = sample.eval_integrals(residual, jacobian, **{target: numpy.zeros(argshape)}, **arguments)
+  if condense:
+    return _condensed_solve(jac, -res, constrain, _elementdofs(jacobian, len(res)), solveargs)
   return jac.solve(-res, constrain=constrain, **solveargs)
 
 
@@ -167,6 +179,10 @@ class newton(RecursionWithSolve, length=1):
 
   Generates targets such that residual approaches 0 using Newton procedure with
   line search based on the residual norm. Suitable to be used inside ``solve``.
+  Except for full newton steps, line search trials evaluate only the residual
+  and its directional derivative; the jacobian is assembled once a step is
+  accepted. Unless a ``jacobian`` is specified, contributions to the residual
+  that are constant or linear in the target are assembled only once.
 
   An optimal relaxation value is computed based on the following cubic
   assumption::
@@ -203,6 +219,23 @@ class newton(RecursionWithSolve, length=1):
       contribute to the value of the functional.
   failrelax : :class:`float`
       Fail with exception if relaxation reaches this lower limit.
+  jacobian_update : :class:`str`
+      Policy for updating the jacobian: ``'full'`` assembles (and factorizes)
+      the jacobian in every iteration; ``'modified'`` reuses it for
+      ``jacobian_interval`` iterations; ``'broyden'`` does the same but applies
+      low-rank Broyden updates to the existing factorization in between. In the
+      latter two cases the jacobian is assembled anew whenever a stale jacobian
+      fails to reduce the residual.
+  jacobian_interval : :class:`int`
+      Maximum number of iterations a jacobian is reused for if
+      ``jacobian_update`` is ``'modified'`` or ``'broyden'``.
+  maxforcing : :class:`float`
+      Upper bound for the Eisenstat-Walker forcing term, which requires
+      ``solveargs`` to specify an absolute tolerance ``atol`` for an iterative
+      solver. If positive, the linear systems are solved only to within this
+      fraction of the current residual norm, tightening as the iterations
+      converge, with ``atol`` retained as a lower bound. Defaults to zero,
+      which disables the adaptive tolerance.
   arguments : :class:`collections.abc.Mapping`
       Defines the values for :class:`nutils.function.Argument` objects in
       `residual`.  The ``target`` should not be present in ``arguments``.
@@ -214,67 +247,174 @@ class newton(RecursionWithSolve, length=1):
       Coefficient vector that approximates residual==0 with increasing accuracy
   '''
 
+  __cache__ = '_linearparts'
+
+  _anticipate = True
+
   @types.apply_annotations
-  def __init__(self, target:types.strictstr, residual:sample.strictintegral, jacobian:sample.strictintegral=None, lhs0:types.frozenarray[types.strictfloat]=None, constrain:types.frozenarray=None, searchrange:types.tuple[float]=(.01,2/3), droptol:types.strictfloat=None, rebound:types.strictfloat=2., failrelax:types.strictfloat=1e-6, arguments:argdict={}, solveargs:types.frozendict={}):
+  def __init__(self, target:types.strictstr, residual:sample.strictintegral, jacobian:sample.strictintegral=None, lhs0:types.frozenarray[types.strictfloat]=None, constrain:types.frozenarray=None, searchrange:types.tuple[float]=(.01,2/3), droptol:types.strictfloat=None, rebound:types.strictfloat=2., failrelax:types.strictfloat=1e-6, jacobian_update:types.strictstr='full', jacobian_interval:types.strictint=5, maxforcing:types.strictfloat=0., arguments:argdict={}, solveargs:types.frozendict={}):
     super().__init__()
     if target in arguments:
       raise ValueError('`target` should not be defined in `arguments`')
+    if any(name.startswith('_newton_direction') for name in arguments):
+      raise ValueError('`_newton_direction` is a reserved argument')
+    if jacobian_update not in ('full', 'modified', 'broyden'):
+      raise ValueError('invalid jacobian update policy {!r}'.format(jacobian_update))
+    if jacobian_interval < 1:
+      raise ValueError('`jacobian_interval` should be a positive integer')
+    if not 0 <= maxforcing < 1:
+      raise ValueError('`maxforcing` should be in [0,1)')
+    if maxforcing and 'atol' not in solveargs:
+      raise ValueError('`maxforcing` requires an iterative solver with absolute tolerance `atol` in `solveargs`')
     self.target = target
     self.residual = residual
-    self.jacobian = _derivative(residual, target, jacobian)
+    self.constant, self.linear, self.nonlinear, self.jacobian = _split(residual, target, jacobian)
+    self.directional = _directional(self.nonlinear, target, '_newton_direction') if self.nonlinear is not None else None
     self.lhs0, self.constrain = _parse_lhs_cons(lhs0, constrain, residual.shape)
     self.minscale, self.maxscale = searchrange
     self.rebound = rebound
     self.droptol = droptol
     self.failrelax = failrelax
+    self.jacobian_update = jacobian_update
+    self.jacobian_interval = jacobian_interval
+    self.maxforcing = maxforcing
     self.arguments = arguments
     self.solveargs = solveargs
-    self.islinear = not self.jacobian.contains(self.target)
+    self.islinear = self.jacobian is None or not self.jacobian.contains(self.target)
+
+  @property
+  def _linearparts(self):
+    cres = _assemble(self.constant, self.arguments) if self.constant is not None else 0.
+    ljac = _assemble(self.linear, self.arguments) if self.linear is not None else None
+    return cres, ljac
 
   def _eval(self, lhs):
-    return sample.eval_integrals(self.residual, self.jacobian, **{self.target: lhs}, **self.arguments)
+    cres, ljac = self._linearparts
+    if self.nonlinear is None:
+      return cres + ljac.matvec(lhs), ljac
+    res, jac = sample.eval_integrals(self.nonlinear, self.jacobian, **{self.target: lhs}, **self.arguments)
+    if ljac is None:
+      return cres + res, jac
+    return cres + ljac.matvec(lhs) + res, ljac + jac
+
+  def _eval_residual(self, lhs):
+    cres, ljac = self._linearparts
+    res = cres if ljac is None else cres + ljac.matvec(lhs)
+    if self.nonlinear is not None:
+      nres, = sample.eval_integrals(self.nonlinear, **{self.target: lhs}, **self.arguments)
+      res = res + nres
+    return res
+
+  def _eval_directional(self, lhs, dlhs):
+    cres, ljac = self._linearparts
+    res, slope = sample.eval_integrals(self.nonlinear, self.directional, **{self.target: lhs, '_newton_direction': dlhs}, **self.arguments) if self.nonlinear is not None else (0., 0.)
+    if ljac is not None:
+      res = res + ljac.matvec(lhs)
+      slope = slope + ljac.matvec(dlhs)
+    return cres + res, slope
+
+  def _eval_jacobian(self, lhs):
+    cres, ljac = self._linearparts
+    if self.nonlinear is None:
+      return ljac
+    jac, = sample.eval_integrals(self.jacobian, **{self.target: lhs}, **self.arguments)
+    return jac if ljac is None else ljac + jac
+
+  def _solve(self, jac, updates, res, constrain, solveargs):
+    # apply the inverse jacobian, followed by the broyden updates of the form
+    # inv(J) <- (I + u s^T) inv(J), to the residual vector; a jacobian that is
+    # reused in subsequent iterations retains its factorization
+    if self.jacobian_update != 'full':
+      solveargs = dict(solveargs, reuse=True)
+    dlhs = jac.solve(res, constrain=constrain, **solveargs)
+    for s, u in updates:
+      dlhs += u * numpy.dot(s, dlhs)
+    return dlhs
+
+  def _info(self, resnorm, relax, jaclhs, jacage, updates, forcing):
+    info = dict(resnorm=resnorm, relax=relax)
+    if self.jacobian_update != 'full':
+      # the stale jacobian is part of the state of the recursion
+      info.update(jacobian_lhs=jaclhs, jacobian_age=jacage, jacobian_updates=tuple(updates))
+    if self.maxforcing:
+      info.update(forcing=forcing)
+    return types.attributes(**info)
 
   def resume(self, history):
     if history:
       lhs, info = history[-1]
       if self.droptol is not None:
         lhs = numpy.choose(numpy.isnan(lhs), [lhs, self.lhs0])
-      res, jac = self._eval(lhs)
+      if self.jacobian_update == 'full' or not info.jacobian_age:
+        res, jac = self._eval(lhs)
+        jaclhs, jacage, updates = lhs, 0, []
+      else:
+        res = self._eval_residual(lhs)
+        jaclhs, jacage, updates = info.jacobian_lhs, info.jacobian_age, list(info.jacobian_updates)
+        jac = self._eval_jacobian(jaclhs)
       resnorm = numpy.linalg.norm(res[~self.constrain])
       assert resnorm == info.resnorm
       relax = info.relax
+      forcing = getattr(info, 'forcing', self.maxforcing)
     else:
       lhs = self.lhs0
       res, jac = self._eval(lhs)
       resnorm = numpy.linalg.norm(res[~self.constrain])
       relax = 1
+      jaclhs, jacage, updates = lhs, 0, []
+      forcing = self.maxforcing
       nosupp = self.droptol is not None and ~(jac.rowsupp(self.droptol)|self.constrain)
-      yield _nan_at(lhs, nosupp), types.attributes(resnorm=resnorm, relax=relax)
+      yield _nan_at(lhs, nosupp), self._info(resnorm, relax, jaclhs, jacage, updates, forcing)
 
     while resnorm:
       nosupp = self.droptol is not None and ~(jac.rowsupp(self.droptol)|self.constrain)
-      dlhs = -jac.solve(res, constrain=self.constrain|nosupp, **self.solveargs)
       if self.islinear:
-        yield _nan_at(lhs+dlhs, nosupp), types.attributes(resnorm=0, relax=1)
+        dlhs = -self._solve(jac, updates, res, self.constrain|nosupp, self.solveargs)
+        yield _nan_at(lhs+dlhs, nosupp), self._info(0, 1, jaclhs, jacage, updates, forcing)
         return
+      solveargs = _inexact(self.solveargs, forcing * resnorm)
+      dlhs = -self._solve(jac, updates, res, self.constrain|nosupp, solveargs)
+      assemble = self.jacobian_update == 'full' or jacage+1 >= self.jacobian_interval
+      # for an exact newton step res(lhs).jac(lhs).dlhs equals -|res(lhs)|^2;
+      # a stale, updated or inexactly solved jacobian requires the actual
+      # directional derivative
+      if jacage:
+        slope = self._eval_directional(lhs, dlhs)[1]
+      elif forcing:
+        slope = jac.matvec(dlhs)
+      else:
+        slope = None
+      resslope = -resnorm**2 if slope is None else numpy.dot(slope[~self.constrain], res[~self.constrain])
       for irelax in itertools.count():
         newlhs = lhs+relax*dlhs
-        res, jac = self._eval(newlhs)
-        newresnorm = numpy.linalg.norm(res[~self.constrain])
+        if assemble and self._anticipate and not irelax and relax == 1:
+          # anticipate that a full newton step is accepted by evaluating
+          # residual and jacobian jointly
+          newres, newjac = self._eval(newlhs)
+          newslope = newjac.matvec(dlhs)
+        else:
+          newres, newslope = self._eval_directional(newlhs, dlhs)
+          newjac = None
+        newresnorm = numpy.linalg.norm(newres[~self.constrain])
         if not numpy.isfinite(newresnorm):
           log.info('residual norm {} / {}'.format(newresnorm, round(relax, 5)))
           relax *= self.minscale
           continue
+        if jacage and newresnorm >= resnorm:
+          log.info('residual norm {:+.2f}% / {} with stale jacobian'.format(100*(newresnorm/resnorm-1), round(relax, 5)))
+          newlhs = None
+          break
         # To determine optimal relaxation we create a polynomial estimation for the residual norm:
         #   P(scale) = A + B scale + C scale^2 + D scale^3 ~= |res(lhs+scale*relax*dlhs)|^2
         # We determine A, B, C and D based on the following constraints:
         #   P(0) = |res(lhs)|^2
-        #   P'(0) = 2 relax res(lhs).jac(lhs).dlhs = -2 relax |res(lhs)|^2
+        #   P'(0) = 2 relax res(lhs).jac(lhs).dlhs
         #   P(1) = |res(lhs+relax*dlhs)|^2
         #   P'(1) = 2 relax res(lhs+relax*dlhs).jac(lhs+relax*dlhs).dlhs
+        # The slope jac(lhs+relax*dlhs).dlhs follows from the directional derivative.
         A = resnorm**2
-        B = -2 * A * relax
-        C = 3 * newresnorm**2 - 2 * numpy.dot(jac.matvec(dlhs)[~self.constrain], res[~self.constrain]) * relax - 3 * A - 2 * B
+        B = 2 * resslope * relax
+        C = 3 * newresnorm**2 - 2 * numpy.dot(newslope[~self.constrain], newres[~self.constrain]) * relax - 3 * A - 2 * B
         D = newresnorm**2 - A - B - C
         # Minimizing P:
         #   B + 2 C scale + 3 D scale^2 = 0 => scale = (-C +/- sqrt(C^2 - 3 B D)) / (3 D)
@@ -291,8 +431,119 @@ class newton(RecursionWithSolve, length=1):
         relax *= max(scale, self.minscale)
         if not numpy.isfinite(relax) or relax <= self.failrelax:
           raise SolverError('stuck in local minimum')
-      yield _nan_at(newlhs, nosupp), types.attributes(resnorm=newresnorm, relax=relax)
-      lhs, resnorm = newlhs, newresnorm
+      if newlhs is None: # stale jacobian failed to reduce the residual
+        jac = self._eval_jacobian(lhs)
+        jaclhs, jacage, updates = lhs, 0, []
+        continue
+      if assemble:
+        jac = newjac if newjac is not None else self._eval_jacobian(newlhs)
+        jaclhs, jacage, updates = newlhs, 0, []
+      else:
+        jacage += 1
+        if self.jacobian_update == 'broyden':
+          # good broyden update of the inverse jacobian:
+          #   inv(J) <- inv(J) + (s - inv(J) y) s^T inv(J) / (s^T inv(J) y)
+          s = newlhs - lhs
+          Jy = self._solve(jac, updates, newres - res, self.constrain|nosupp, solveargs)
+          sJy = numpy.dot(s, Jy)
+          if sJy:
+            updates.append((s, (s - Jy) / sJy))
+      forcing = _forcing(forcing, resnorm, newresnorm, self.maxforcing)
+      yield _nan_at(newlhs, nosupp), self._info(newresnorm, relax, jaclhs, jacage, updates, forcing)
+      lhs, res, resnorm = newlhs, newres, newresnorm
+
+class newton_krylov(newton):
+  '''iteratively solve nonlinear problem by jacobian-free newton-krylov
+
+  Generates targets such that residual approaches 0 using the Newton procedure
+  and line search of :class:`newton`, without ever assembling the jacobian.
+  The linear systems are solved by an iterative solver (by default gmres) of
+  which every matrix-vector product is formed by evaluating the directional
+  derivative of the residual. Suitable to be used inside ``solve``.
+
+  Parameters
+  ----------
+  target : :class:`str`
+      Name of the target: a :class:`nutils.function.Argument` in ``residual``.
+  residual : :class:`nutils.sample.Integral`
+  lhs0 : :class:`numpy.ndarray`
+      Coefficient vector, starting point of the iterative procedure.
+  constrain : :class:`numpy.ndarray` with dtype :class:`bool` or :class:`float`
+      Equal length to ``lhs0``, masks the free vector entries as ``False``
+      (boolean) or NaN (float). In the remaining positions the values of
+      ``lhs0`` are returned unchanged (boolean) or overruled by the values in
+      `constrain` (float).
+  preconditioner : :class:`nutils.sample.Integral`
+      Optional matrix integral that approximates the jacobian, for instance
+      the jacobian of a simplified problem, from which the preconditioner
+      named in ``solveargs`` is built. It is assembled in every iteration
+      unless it does not depend on ``target``, in which case it is assembled
+      only once.
+  searchrange : :class:`tuple` of two floats
+      The lower bound (>=0) and upper bound (<=1) for line search relaxation
+      updates. See :class:`newton`.
+  rebound : :class:`float`
+      Factor by which the relaxation value grows after every update until it
+      reaches unity.
+  failrelax : :class:`float`
+      Fail with exception if relaxation reaches this lower limit.
+  maxforcing : :class:`float`
+      Upper bound for the Eisenstat-Walker forcing term. See :class:`newton`.
+  arguments : :class:`collections.abc.Mapping`
+      Defines the values for :class:`nutils.function.Argument` objects in
+      `residual`.  The ``target`` should not be present in ``arguments``.
+      Optional.
+  solveargs : :class:`collections.abc.Mapping`
+      Arguments for :meth:`nutils.matrix.MatrixFree.solve`, which should
+      contain the absolute tolerance ``atol``.
+
+  Yields
+  ------
+  :class:`numpy.ndarray`
+      Coefficient vector that approximates residual==0 with increasing accuracy
+  '''
+
+  __cache__ = '_constant_preconditioner'
+
+  _anticipate = False # the operator is free but its action is not
+
+  @types.apply_annotations
+  def __init__(self, target:types.strictstr, residual:sample.strictintegral, lhs0:types.frozenarray[types.strictfloat]=None, constrain:types.frozenarray=None, preconditioner:sample.strictintegral=None, searchrange:types.tuple[float]=(.01,2/3), rebound:types.strictfloat=2., failrelax:types.strictfloat=1e-6, maxforcing:types.strictfloat=0., arguments:argdict={}, solveargs:types.frozendict={}):
+    if 'atol' not in solveargs:
+      raise ValueError('`solveargs` should specify the absolute tolerance `atol`')
+    if preconditioner is not None and preconditioner.shape != residual.shape * 2:
+      raise ValueError('expected `preconditioner` with shape {} but got {}'.format(residual.shape * 2, preconditioner.shape))
+    super().__init__(target, residual, lhs0=lhs0, constrain=constrain, searchrange=searchrange, rebound=rebound, failrelax=failrelax, maxforcing=maxforcing, arguments=arguments, solveargs=solveargs)
+    self.preconditioner = preconditioner
+    self.isvariable = preconditioner is not None and preconditioner.contains(target)
+
+  @property
+  def _constant_preconditioner(self):
+    if self.preconditioner is None:
+      return None
+    precon, = sample.eval_integrals(self.preconditioner, **self.arguments)
+    return precon
+
+  def _operator(self, lhs, precon):
+    cres, ljac = self._linearparts
+    def matvec(vec):
+      dres = numpy.zeros_like(vec)
+      if vec.any():
+        if self.nonlinear is not None:
+          dres += sample.eval_integrals(self.directional, **{self.target: lhs, '_newton_direction': vec}, **self.arguments)[0]
+        if ljac is not None:
+          dres += ljac.matvec(vec)
+      return dres
+    return matrix.MatrixFree(self.residual.shape*2, matvec, approximation=precon)
+
+  def _eval(self, lhs):
+    return self._eval_residual(lhs), self._eval_jacobian(lhs)
+
+  def _eval_jacobian(self, lhs):
+    if not self.isvariable:
+      return self._operator(lhs, self._constant_preconditioner)
+    precon, = sample.eval_integrals(self.preconditioner, **{self.target: lhs}, **self.arguments)
+    return self._operator(lhs, precon)
 
 
 class minimize(RecursionWithSolve, length=1, version=1):
@@ -335,6 +586,8 @@ class minimize(RecursionWithSolve, length=1, version=1):
       contribute to the value of the functional.
   failrelax : :class:`float`
       Fail with exception if relaxation reaches this lower limit.
+  maxforcing : :class:`float`
+      Upper bound for the Eisenstat-Walker forcing term. See :class:`newton`.
   arguments : :class:`collections.abc.Mapping`
       Defines the values for :class:`nutils.function.Argument` objects in
       `residual`.  The ``target`` should not be present in ``arguments``.
@@ -347,12 +600,16 @@ class minimize(RecursionWithSolve, length=1, version=1):
   '''
 
   @types.apply_annotations
-  def __init__(self, target:types.strictstr, energy:sample.strictintegral, lhs0:types.frozenarray[types.strictfloat]=None, constrain:types.frozenarray=None, searchrange:types.tuple[float]=(.01,.5), rebound:types.strictfloat=2., droptol:types.strictfloat=None, failrelax:types.strictfloat=1e-6, arguments:argdict={}, solveargs:types.frozendict={}):
+  def __init__(self, target:types.strictstr, energy:sample.strictintegral, lhs0:types.frozenarray[types.strictfloat]=None, constrain:types.frozenarray=None, searchrange:types.tuple[float]=(.01,.5), rebound:types.strictfloat=2., droptol:types.strictfloat=None, failrelax:types.strictfloat=1e-6, maxforcing:types.strictfloat=0., arguments:argdict={}, solveargs:types.frozendict={}):
     super().__init__()
     if target in arguments:
       raise ValueError('`target` should not be defined in `arguments`')
     if energy.shape != ():
       raise ValueError('`energy` should be scalar')
+    if not 0 <= maxforcing < 1:
+      raise ValueError('`maxforcing` should be in [0,1)')
+    if maxforcing and 'atol' not in solveargs:
+      raise ValueError('`maxforcing` requires an iterative solver with absolute tolerance `atol` in `solveargs`')
     self.target = target
     self.energy = energy
     self.residual = energy.derivative(target)
@@ -362,6 +619,7 @@ class minimize(RecursionWithSolve, length=1, version=1):
     self.rebound = rebound
     self.droptol = droptol
     self.failrelax = failrelax
+    self.maxforcing = maxforcing
     self.arguments = arguments
     self.solveargs = solveargs
     self.islinear = not self.jacobian.contains(target)
@@ -369,6 +627,11 @@ class minimize(RecursionWithSolve, length=1, version=1):
   def _eval(self, lhs):
     return sample.eval_integrals(self.energy, self.residual, self.jacobian, **{self.target: lhs}, **self.arguments)
 
+  def _info(self, forcing, **info):
+    if self.maxforcing:
+      info.update(forcing=forcing)
+    return types.attributes(**info)
+
   def resume(self, history):
     if history:
       lhs, info = history[-1]
@@ -379,13 +642,15 @@ class minimize(RecursionWithSolve, length=1, version=1):
       resnorm = numpy.linalg.norm(res[~self.constrain])
       assert resnorm == info.resnorm
       relax = info.relax
+      forcing = getattr(info, 'forcing', self.maxforcing)
     else:
       lhs = self.lhs0
       nrg, res, jac = self._eval(lhs)
       resnorm = numpy.linalg.norm(res[~self.constrain])
       relax = 1
+      forcing = self.maxforcing
       nosupp = self.droptol is not None and ~(jac.rowsupp(self.droptol)|self.constrain)
-      yield _nan_at(lhs, nosupp), types.attributes(resnorm=resnorm, energy=nrg, relax=relax, shift=0)
+      yield _nan_at(lhs, nosupp), self._info(forcing, resnorm=resnorm, energy=nrg, relax=relax, shift=0)
 
     # To minimize the energy in the direction of the search vector we need to
     # minimize a 5th degree polynomial, which is done by sampling the polynomial
@@ -404,10 +669,12 @@ class minimize(RecursionWithSolve, length=1, version=1):
 
     while resnorm:
       nosupp = self.droptol is not None and ~(jac.rowsupp(self.droptol)|self.constrain)
-      dlhs = -jac.solve(res, constrain=self.constrain|nosupp, **self.solveargs)
       if self.islinear:
-        yield _nan_at(lhs+dlhs, nosupp), types.attributes(resnorm=0, energy=nrg+.5*res.dot(dlhs), relax=1, shift=0)
+        dlhs = -jac.solve(res, constrain=self.constrain|nosupp, **self.solveargs)
+        yield _nan_at(lhs+dlhs, nosupp), self._info(forcing, resnorm=0, energy=nrg+.5*res.dot(dlhs), relax=1, shift=0)
         return
+      solveargs = _inexact(self.solveargs, forcing * resnorm)
+      dlhs = -jac.solve(res, constrain=self.constrain|nosupp, **solveargs)
       shift = 0
       while res.dot(dlhs) > 0:
         # Energy is locally increasing, an adjustment is required to maintain
@@ -424,13 +691,13 @@ class minimize(RecursionWithSolve, length=1, version=1):
         # reciprocal lower bound for at least one negative eigenvalue of jac.
         shift += res.dot(res) / res.dot(dlhs)
         log.warning('negative eigenvalue detected; shifting spectrum by {:.2e}'.format(shift))
-        dlhs = -(jac + shift * matrix.eye(len(dlhs))).solve(res, constrain=self.constrain|nosupp, **self.solveargs)
+        dlhs = -(jac + shift * matrix.eye(len(dlhs))).solve(res, constrain=self.constrain|nosupp, **solveargs)
       if not shift:
         relax = min(relax, 1)
       for irelax in itertools.count():
         newlhs = lhs+relax*dlhs
         newnrg, newres, newjac = self._eval(newlhs)
-        resnorm = numpy.linalg.norm(newres[~self.constrain])
+        newresnorm = numpy.linalg.norm(newres[~self.constrain])
         if not numpy.isfinite(newnrg):
           log.info('energy {} / {}'.format(newnrg, round(relax, 5)))
           relax *= self.minscale
@@ -467,8 +734,9 @@ class minimize(RecursionWithSolve, length=1, version=1):
           raise SolverError('stuck in local minimum')
       else:
         log.warning('failed to', 'decrease' if newnrg > nrg else 'optimize', 'energy')
-      yield _nan_at(newlhs, nosupp), types.attributes(resnorm=resnorm, energy=newnrg, relax=relax, shift=shift)
-      nrg, res, jac = newnrg, newres, newjac
+      forcing = _forcing(forcing, resnorm, newresnorm, self.maxforcing)
+      yield _nan_at(newlhs, nosupp), self._info(forcing, resnorm=newresnorm, energy=newnrg, relax=relax, shift=shift)
+      nrg, res, jac, resnorm = newnrg, newres, newjac, newresnorm
       lhs = numpy.choose(nosupp, [newlhs, self.lhs0])
 
 
@@ -477,7 +745,9 @@ class pseudotime(RecursionWithSolve, length=1):
 
   Generates targets such that residual approaches 0 using hybrid of Newton and
   time stepping. Requires an inertia term and initial timestep. Suitable to be
-  used inside ``solve``.
+  used inside ``solve``. Contributions to the residual that are constant or
+  linear in the target, as well as the jacobian of a linear inertia term, are
+  assembled only once.
 
   Parameters
   ----------
@@ -494,6 +764,8 @@ class pseudotime(RecursionWithSolve, length=1):
       (boolean) or NaN (float). In the remaining positions the values of
       ``lhs0`` are returned unchanged (boolean) or overruled by the values in
       `constrain` (float).
+  maxforcing : :class:`float`
+      Upper bound for the Eisenstat-Walker forcing term. See :class:`newton`.
   arguments : :class:`collections.abc.Mapping`
       Defines the values for :class:`nutils.function.Argument` objects in
       `residual`.  The ``target`` should not be present in ``arguments``.
@@ -505,25 +777,53 @@ class pseudotime(RecursionWithSolve, length=1):
       Tuple of coefficient vector and residual norm
   '''
 
+  __cache__ = '_linearparts'
+
   @types.apply_annotations
-  def __init__(self, target:types.strictstr, residual:sample.strictintegral, inertia:sample.strictintegral, timestep:types.strictfloat, lhs0:types.frozenarray[types.strictfloat]=None, constrain:types.frozenarray=None, arguments:argdict={}, solveargs:types.frozendict={}):
+  def __init__(self, target:types.strictstr, residual:sample.strictintegral, inertia:sample.strictintegral, timestep:types.strictfloat, lhs0:types.frozenarray[types.strictfloat]=None, constrain:types.frozenarray=None, maxforcing:types.strictfloat=0., arguments:argdict={}, solveargs:types.frozendict={}):
     super().__init__()
     if target in arguments:
       raise ValueError('`target` should not be defined in `arguments`')
     if inertia.shape != residual.shape:
       raise ValueError('expected `inertia` with shape {} but got {}'.format(residual.shape, inertia.shape))
+    if not 0 <= maxforcing < 1:
+      raise ValueError('`maxforcing` should be in [0,1)')
+    if maxforcing and 'atol' not in solveargs:
+      raise ValueError('`maxforcing` requires an iterative solver with absolute tolerance `atol` in `solveargs`')
     self.target = target
     self.residual = residual
-    self.jacobian = _derivative(residual, target)
+    self.constant, self.linear, self.nonlinear, self.jacobian = _split(residual, target)
     self.inertia = inertia
     self.jacobiant = _derivative(inertia, target)
     self.lhs0, self.constrain = _parse_lhs_cons(lhs0, constrain, residual.shape)
     self.timestep = timestep
+    self.maxforcing = maxforcing
     self.arguments = arguments
     self.solveargs = solveargs
 
+  @property
+  def _linearparts(self):
+    cres = _assemble(self.constant, self.arguments) if self.constant is not None else 0.
+    ljac = _assemble(self.linear, self.arguments) if self.linear is not None else None
+    jact = _assemble(self.jacobiant, self.arguments) if not self.jacobiant.contains(self.target) else None
+    return cres, ljac, jact
+
   def _eval(self, lhs, timestep):
-    return sample.eval_integrals(self.residual, self.jacobian+self.jacobiant/timestep, **{self.target: lhs}, **self.arguments)
+    res, jac, jact = self._linearparts
+    if jac is not None:
+      res = res + jac.matvec(lhs)
+    if self.nonlinear is not None:
+      nres, njac = sample.eval_integrals(self.nonlinear, self.jacobian, **{self.target: lhs}, **self.arguments)
+      res = res + nres
+      jac = njac if jac is None else jac + njac
+    if jact is None:
+      jact, = sample.eval_integrals(self.jacobiant, **{self.target: lhs}, **self.arguments)
+    return res, jac + jact / timestep
+
+  def _info(self, forcing, **info):
+    if self.maxforcing:
+      info.update(forcing=forcing)
+    return types.attributes(**info)
 
   def resume(self, history):
     if history:
@@ -533,21 +833,25 @@ class pseudotime(RecursionWithSolve, length=1):
       res, jac = self._eval(lhs, timestep)
       resnorm = numpy.linalg.norm(res[~self.constrain])
       assert resnorm == info.resnorm
+      forcing = getattr(info, 'forcing', self.maxforcing)
     else:
       lhs = self.lhs0
       timestep = self.timestep
       res, jac = self._eval(lhs, timestep)
       resnorm = resnorm0 = numpy.linalg.norm(res[~self.constrain])
-      yield numpy.array(lhs), types.attributes(resnorm=resnorm, timestep=timestep, resnorm0=resnorm0)
+      forcing = self.maxforcing
+      yield numpy.array(lhs), self._info(forcing, resnorm=resnorm, timestep=timestep, resnorm0=resnorm0)
 
     lhs = numpy.array(lhs)
     while True:
-      lhs -= jac.solve(res, constrain=self.constrain, **self.solveargs)
+      lhs -= jac.solve(res, constrain=self.constrain, **_inexact(self.solveargs, forcing * resnorm))
       timestep = self.timestep * (resnorm0/resnorm)
       log.info('timestep: {:.0e}'.format(timestep))
       res, jac = self._eval(lhs, timestep)
-      resnorm = numpy.linalg.norm(res[~self.constrain])
-      yield lhs.copy(), types.attributes(resnorm=resnorm, timestep=timestep, resnorm0=resnorm0)
+      newresnorm = numpy.linalg.norm(res[~self.constrain])
+      forcing = _forcing(forcing, resnorm, newresnorm, self.maxforcing)
+      resnorm = newresnorm
+      yield lhs.copy(), self._info(forcing, resnorm=resnorm, timestep=timestep, resnorm0=resnorm0)
 
 
 class thetamethod(RecursionWithSolve, length=1):
@@ -585,7 +889,7 @@ class thetamethod(RecursionWithSolve, length=1):
       Coefficient vector for all timesteps after the initial condition.
   '''
 
-  __cache__ = '_res_jac'
+  __cache__ = '_residual', '_operatorcache'
 
   @types.apply_annotations
   def __init__(self, target:types.strictstr, residual:sample.strictintegral, inertia:sample.strictintegral, timestep:types.strictfloat, lhs0:types.frozenarray, theta:types.strictfloat, target0:types.strictstr='_thetamethod_target0', constrain:types.frozenarray=None, newtontol:types.strictfloat=1e-10, arguments:argdict={}, newtonargs:types.frozendict={}):
@@ -606,16 +910,43 @@ class thetamethod(RecursionWithSolve, length=1):
     self.theta = theta
     self.timestep = timestep
 
-  def _res_jac(self, timestep):
-    res = self.residual * self.theta + self.inertia / timestep \
+  @property
+  def _operatorcache(self):
+    # assembled operators by timestep and matrix backend, see `_operators`
+    return collections.OrderedDict()
+
+  def _residual(self, timestep):
+    return self.residual * self.theta + self.inertia / timestep \
         + (self.residual * (1-self.theta) - self.inertia / timestep).replace({self.target: function.Argument(self.target0, self.lhs0.shape)})
-    return res, res.derivative(self.target)
+
+  def _operators(self, timestep):
+    # assembled operators of the residual of a timestep, which are shared by
+    # all steps of this size: the matrix of the part that is linear in the
+    # target, and the constant vector and matrix of the remainder that are
+    # independent of and linear in the previous solution; retained for the
+    # last few timesteps and keyed on the matrix backend that formed them
+    key = timestep, type(matrix.currentbackend())
+    try:
+      operators = self._operatorcache.pop(key)
+    except KeyError:
+      constant, linear, nonlinear, jacobian = _split(self._residual(timestep), self.target)
+      ljac = _assemble(linear, self.arguments) if linear is not None and not linear.contains(self.target0) else None
+      if constant is not None and constant.contains(self.target0):
+        constant0, linear0, nonlinear0, jacobian0 = _split(constant, self.target0)
+        cres = _assemble(constant0, self.arguments) if constant0 is not None else 0.
+        lres = _assemble(linear0, self.arguments) if linear0 is not None else None
+      else:
+        cres = _assemble(constant, self.arguments) if constant is not None else 0.
+        lres = nonlinear0 = None
+      operators = ljac, cres, lres, nonlinear0
+    self._operatorcache[key] = operators
+    while len(self._operatorcache) > 4:
+      self._operatorcache.popitem(last=False)
+    return operators
 
   def _step(self, lhs, timestep):
-    res, jac = self._res_jac(timestep)
     try:
-      return newton(self.target, residual=res, jacobian=jac, lhs0=lhs, constrain=self.constrain,
-        arguments=collections.ChainMap(self.arguments, {self.target0: lhs}), **self.newtonargs).solve(tol=self.newtontol)
+      return _thetastep(self, timestep, lhs).solve(tol=self.newtontol)
     except (SolverError, matrix.MatrixError) as e:
       log.error('error: {}; retrying with timestep {}'.format(e, timestep/2))
       return self._step(self._step(lhs, timestep/2), timestep/2)
@@ -634,6 +965,150 @@ impliciteuler = functools.partial(thetamethod, theta=1)
 cranknicolson = functools.partial(thetamethod, theta=0.5)
 
 
+class _thetastep(newton):
+  # newton solver for a single step of thetamethod, which takes the assembled
+  # operators of the residual that do not depend on the target from the
+  # thetamethod instance, such that these are shared between steps
+
+  __cache__ = '_linearparts'
+
+  @types.apply_annotations
+  def __init__(self, theta, timestep:types.strictfloat, lhs0:types.frozenarray[types.strictfloat]):
+    super().__init__(theta.target, residual=theta._residual(timestep), lhs0=lhs0, constrain=theta.constrain,
+      arguments=collections.ChainMap(theta.arguments, {theta.target0: lhs0}), **theta.newtonargs)
+    self.theta = theta
+    self.timestep = timestep
+
+  @property
+  def _linearparts(self):
+    if self.constant is None and self.linear is None:
+      return 0., None
+    ljac, cres, lres, nonlinear0 = self.theta._operators(self.timestep)
+    if self.linear is not None and ljac is None:
+      ljac = _assemble(self.linear, self.arguments)
+    lhs0 = self.arguments[self.theta.target0]
+    if lres is not None:
+      cres = cres + lres.matvec(lhs0)
+    if nonlinear0 is not None:
+      cres = cres + _assemble(nonlinear0, self.arguments)
+    return cres, ljac
+
+  def _solve(self, jac, updates, res, constrain, solveargs):
+    if self.islinear:
+      # the jacobian is the operator that is shared by all steps, which
+      # retains its factorization
+      solveargs = dict(solveargs, reuse=True)
+    return super()._solve(jac, updates, res, constrain, solveargs)
+
+
+class adaptivethetamethod(thetamethod):
+  '''solve time dependent problem using the theta method with adaptive timesteps
+
+  The local error of every timestep is estimated by step doubling: the result
+  of a single step is compared with that of two steps of half size, the latter
+  of which is retained. Steps with an estimated error above ``timetol`` are
+  repeated with half the timestep, whereas the timestep is doubled for the
+  next step if doubling is expected to keep the error within bounds. Limiting
+  timesteps to powers of two times the initial timestep allows the systems of
+  subsequent steps to share assembled constant and linear contributions.
+
+  Parameters
+  ----------
+  target : :class:`str`
+      Name of the target: a :class:`nutils.function.Argument` in ``residual``.
+  residual : :class:`nutils.sample.Integral`
+  inertia : :class:`nutils.sample.Integral`
+  timestep : :class:`float`
+      Initial time step.
+  lhs0 : :class:`numpy.ndarray`
+      Coefficient vector, starting point of the iterative procedure.
+  theta : :class:`float`
+      Theta value (theta=1 for implicit Euler, theta=0.5 for Crank-Nicolson)
+  timetol : :class:`float`
+      Tolerance for the estimated local error of a timestep, measured in the
+      euclidean norm of the coefficient vector.
+  target0 : :class:`str`
+      Name of the :class:`nutils.function.Argument` that holds the coefficient
+      vector of the previous timestep in the residual of a step. Needs to be
+      changed only if it clashes with an argument of ``residual``.
+  constrain : :class:`numpy.ndarray` with dtype :class:`bool` or :class:`float`
+      Equal length to ``lhs0``, masks the free vector entries as ``False``
+      (boolean) or NaN (float). In the remaining positions the values of
+      ``lhs0`` are returned unchanged (boolean) or overruled by the values in
+      `constrain` (float).
+  newtontol : :class:`float`
+      Residual tolerance of individual timesteps
+  mintimestep : :class:`float`
+      Fail with exception if the timestep needs to drop below this limit.
+      Defaults to the initial timestep divided by ``2**20``.
+  maxtimestep : :class:`float`
+      Upper bound for the timestep.
+  arguments : :class:`collections.abc.Mapping`
+      Defines the values for :class:`nutils.function.Argument` objects in
+      `residual`.  The ``target`` should not be present in ``arguments``.
+      Optional.
+  newtonargs : :class:`collections.abc.Mapping`
+      Additional arguments for the :class:`newton` solver of every timestep,
+      such as ``solveargs`` or ``jacobian_update``.
+
+  Yields
+  ------
+  :class:`numpy.ndarray`
+      Coefficient vector for all timesteps, starting with the initial condition.
+  :class:`types.attributes`
+      Attributes ``time``, ``error`` (the estimated local error of the last
+      step) and ``timestep`` (the size of the next step).
+  '''
+
+  @types.apply_annotations
+  def __init__(self, target:types.strictstr, residual:sample.strictintegral, inertia:sample.strictintegral, timestep:types.strictfloat, lhs0:types.frozenarray, theta:types.strictfloat, timetol:types.strictfloat, target0:types.strictstr='_thetamethod_target0', constrain:types.frozenarray=None, newtontol:types.strictfloat=1e-10, mintimestep:types.strictfloat=None, maxtimestep:types.strictfloat=float('inf'), arguments:argdict={}, newtonargs:types.frozendict={}):
+    super().__init__(target, residual, inertia, timestep, lhs0, theta, target0=target0, constrain=constrain, newtontol=newtontol, arguments=arguments, newtonargs=newtonargs)
+    if timetol <= 0:
+      raise ValueError('`timetol` should be positive')
+    if mintimestep is not None and mintimestep <= 0:
+      raise ValueError('`mintimestep` should be positive')
+    self.timetol = timetol
+    self.mintimestep = mintimestep if mintimestep is not None else timestep / 2**20
+    self.maxtimestep = maxtimestep
+    self.order = 2 if theta == .5 else 1
+
+  def resume(self, history):
+    if history:
+      (lhs, info), = history
+      time = info.time
+      timestep = info.timestep
+    else:
+      lhs = self.lhs0
+      time = 0.
+      timestep = self.timestep
+      yield lhs, types.attributes(time=time, timestep=timestep, error=0.)
+    full = None
+    while True:
+      if full is None:
+        full = self._step(lhs, timestep)
+      # the first half step is the full step of a retry with half the timestep
+      firsthalf = self._step(lhs, timestep/2)
+      half = self._step(firsthalf, timestep/2)
+      # the local error of the two half steps follows from Richardson
+      # extrapolation for a method of order p: |half - full| / (2^p - 1)
+      error = numpy.linalg.norm(half - full) / (2**self.order - 1)
+      if error > self.timetol:
+        if timestep/2 < self.mintimestep:
+          raise SolverError('timestep drops below minimum')
+        log.info('error {:.1e} exceeds tolerance; retrying with timestep {}'.format(error, timestep/2))
+        timestep /= 2
+        full = firsthalf
+        continue
+      lhs = half
+      full = None
+      time += timestep
+      # the local error scales with timestep^(p+1)
+      if error * 2**(self.order+1) <= self.timetol and timestep*2 <= self.maxtimestep:
+        timestep *= 2
+      log.info('time {:g}, error {:.1e}, next timestep {}'.format(time, error, timestep))
+      yield lhs, types.attributes(time=time, timestep=timestep, error=error)
+
+
 @log.withcontext
 def optimize(target:types.strictstr, functional:sample.strictintegral, *, newtontol:types.strictfloat=0., arguments:argdict={}, **kwargs):
   '''find the minimizer of a given functional
@@ -665,8 +1140,434 @@ def optimize(target:types.strictstr, functional:sample.strictintegral, *, newton
   return lhs
 
 
+def sweep(solve, arguments, *, nprocs=None):
+  '''solve a parametric problem for a sequence of argument values
+
+  Calls ``solve`` for every item in ``arguments`` and yields ``(index,
+  result)`` pairs in order of completion. The first item is solved in the
+  current process, which prepares and simplifies the function trees.
+  Subsequently ``nprocs-1`` worker processes are forked that share these
+  function trees read-only, claim the remaining items from a shared
+  :class:`nutils.parallel.range`, and stream their results back as they
+  finish. Every item is assembled anew. On platforms that do not support
+  ``fork``, or for ``nprocs=1``, the items are solved serially. An exception
+  raised by ``solve`` in a worker process is logged with its traceback and
+  raised again in the current process.
+
+  Parameters
+  ----------
+  solve : :class:`collections.abc.Callable`
+      Function that takes a single argument dictionary and returns a
+      picklable result, typically ``lambda args: newton(...,
+      arguments=args).solve(tol)``.
+  arguments : :class:`collections.abc.Sequence`
+      Argument dictionaries to be passed to ``solve``.
+  nprocs : :class:`int`
+      Number of processes, defaults to :attr:`nutils.config.nprocs`.
+
+  Yields
+  ------
+  :class:`int`
+      Index of the argument dictionary in ``arguments``.
+  :class:`object`
+      Result of ``solve``.
+  '''
+
+  arguments = tuple(arguments)
+  if not arguments:
+    return
+  if nprocs is None:
+    nprocs = config.nprocs
+  nprocs = min(nprocs, len(arguments))
+  with log.context('sweep 0'):
+    result = solve(arguments[0])
+  yield 0, result
+  if nprocs == 1 or parallel.procid is not None or not hasattr(os, 'fork'):
+    if nprocs > 1 and parallel.procid is None:
+      log.warning('fork is unavailable on this platform')
+    for i in range(1, len(arguments)):
+      with log.context('sweep {}'.format(i)):
+        result = solve(arguments[i])
+      yield i, result
+    return
+  indices = parallel.range(len(arguments))
+  next(indices) # claim the item solved in the current process
+  readers = {}
+  try:
+    for procid in range(1, nprocs):
+      reader, writer = multiprocessing.Pipe(duplex=False)
+      pid = os.fork()
+      if not pid:
+        reader.close()
+        _sweep_worker(solve, arguments, indices, writer, procid)
+      writer.close()
+      readers[reader] = pid
+    while readers:
+      for reader in multiprocessing.connection.wait(list(readers)):
+        try:
+          i, failed, result = reader.recv()
+        except EOFError:
+          os.waitpid(readers.pop(reader), 0)
+          reader.close()
+          continue
+        if failed:
+          exc, tb = result
+          log.error('sweep failed for item {}:\n{}'.format(i, tb))
+          raise exc
+        log.info('received result {} of {}'.format(i, len(arguments)))
+        yield i, result
+  finally:
+    for reader, pid in readers.items():
+      os.kill(pid, signal.SIGTERM)
+      os.waitpid(pid, 0)
+      reader.close()
+
+
+def pod(snapshots, *, nmodes=None, tol=0.):
+  '''proper orthogonal decomposition of solution snapshots
+
+  Returns an orthonormal basis, in the form of an array with one column per
+  mode, for the dominant subspace of a collection of coefficient vectors. The
+  number of modes is the smallest for which the relative truncation error,
+  measured as the square root of the discarded fraction of the snapshot
+  energy, does not exceed ``tol``, and at most ``nmodes``.
+
+  Parameters
+  ----------
+  snapshots : :class:`collections.abc.Sequence` of :class:`numpy.ndarray`
+      Coefficient vectors of equal length.
+  nmodes : :class:`int`
+      Maximum number of modes. Optional.
+  tol : :class:`float`
+      Relative truncation error. Defaults to zero, retaining all modes with a
+      nonzero singular value.
+
+  Returns
+  -------
+  :class:`numpy.ndarray`
+      Basis of shape ``(len(snapshots[0]), nmodes)``.
+  '''
+
+  U, s, Vt = numpy.linalg.svd(numpy.array(snapshots, dtype=float).T, full_matrices=False)
+  # discarded[n] is the relative energy of all modes from n onward
+  discarded = numpy.sqrt(numpy.cumsum((s**2)[::-1])[::-1] / (s**2).sum()) if s.any() else numpy.zeros_like(s)
+  n = numpy.sum(discarded > max(tol, numpy.finfo(float).eps * len(s)))
+  if nmodes is not None:
+    n = min(n, nmodes)
+  log.info('retaining {} of {} modes, truncation error {:.1e}'.format(n, len(s), discarded[n] if n < len(s) else 0.))
+  return U[:,:n]
+
+
+class reducedorder:
+  '''reduced-order model from solution snapshots
+
+  Approximates coefficient vectors of ``target`` by ``lift + basis a``, where
+  ``lift`` is the mean of the snapshots, ``basis`` follows from a proper
+  orthogonal decomposition (:func:`pod`) of their deviations from the mean,
+  and ``a`` is a short vector of reduced coefficients that is available as a
+  new argument ``reducedtarget``. Integrals are projected onto the basis by
+  :meth:`project`, after which any of the solvers in this module can be used
+  to solve for the reduced coefficients. Since all snapshots satisfy the same
+  constraints, the lift does so too while all modes vanish at constrained
+  entries, so that the reduced problem is unconstrained.
+
+  The projected integrals are evaluated on the full samples by default. For
+  ``hypertol`` a hyper-reduction is performed by empirical cubature, which
+  selects a subset of elements and positive element weights that reproduce
+  the projected residual of all snapshots up to the given relative
+  tolerance. The projected integrals are then assembled on the selected
+  elements only, which makes the cost of an online solve independent of the
+  size of the full problem.
+
+  Parameters
+  ----------
+  target : :class:`str`
+      Name of the target: a :class:`nutils.function.Argument` in ``residual``.
+  residual : :class:`nutils.sample.Integral`
+  snapshots : :class:`collections.abc.Sequence` of :class:`numpy.ndarray`
+      Solutions for ``target``, for instance collected from :class:`newton` or
+      :class:`thetamethod`.
+  snapshotarguments : :class:`collections.abc.Sequence` of :class:`dict`
+      Arguments for ``residual`` that correspond to the snapshots. Only
+      required for hyper-reduction of a parametric residual.
+  nmodes : :class:`int`
+      Maximum number of modes, see :func:`pod`.
+  tol : :class:`float`
+      Relative truncation error, see :func:`pod`.
+  hypertol : :class:`float`
+      Relative tolerance of the empirical cubature. Optional; by default no
+      hyper-reduction is performed.
+  reducedtarget : :class:`str`
+      Name of the reduced target. Defaults to ``target`` followed by
+      ``'_reduced'``.
+  '''
+
+  @types.apply_annotations
+  def __init__(self, target:types.strictstr, residual:sample.strictintegral, snapshots:types.frozenarray[float], *, snapshotarguments=None, nmodes:types.strictint=None, tol:types.strictfloat=0., hypertol:types.strictfloat=None, reducedtarget:types.strictstr=None):
+    if snapshots.ndim != 2 or len(snapshots) == 0:
+      raise ValueError('expected a nonempty sequence of snapshot vectors')
+    if snapshotarguments is None:
+      snapshotarguments = [{}] * len(snapshots)
+    elif len(snapshotarguments) != len(snapshots):
+      raise ValueError('expected {} snapshot arguments but got {}'.format(len(snapshots), len(snapshotarguments)))
+    self.target = target
+    self.reducedtarget = reducedtarget or target + '_reduced'
+    self.lift = types.frozenarray(numpy.mean(snapshots, axis=0), copy=False)
+    deviations = numpy.subtract(snapshots, self.lift)
+    basis = pod(deviations, nmodes=nmodes, tol=tol)
+    basis[~deviations.any(axis=0)] = 0 # keep constrained entries exact
+    self.basis = types.frozenarray(basis, copy=False)
+    self._samples = {}
+    self.residual = self.project(residual)
+    if hypertol is not None:
+      self._samples = _empiricalcubature(self.residual, [dict(arguments, **{self.reducedtarget: self.reduce(snapshot)}) for snapshot, arguments in zip(snapshots, snapshotarguments)], hypertol)
+      self.residual = self.project(residual)
+
+  def project(self, integral):
+    '''Project vector integral onto the reduced basis.
+
+    Replaces ``target`` by its reduced approximation and contracts the first
+    axis with the basis, for the residual as well as for instance the inertia
+    of a time dependent problem. If a hyper-reduction was performed, the
+    integral is moved to the reduced samples.
+
+    Args
+    ----
+    integral : :class:`nutils.sample.Integral`
+        Integral of shape ``(len(lift),)``.
+
+    Returns
+    -------
+    projected : :class:`nutils.sample.Integral`
+        Integral in ``reducedtarget`` of shape ``(nmodes,)``.
+    '''
+
+    if integral.shape != self.lift.shape:
+      raise ValueError('expected an integral of shape {} but got {}'.format(self.lift.shape, integral.shape))
+    basis = function.asarray(self.basis)
+    integral = integral.replace({self.target: self.lift + function.matmat(basis, function.Argument(self.reducedtarget, basis.shape[1:]))})
+    projected = [(self._samples.get(di, di), function.matmat(basis.T, integrand)) for di, integrand in integral._integrands.items()]
+    return sample.Integral([(di, integrand) for di, integrand in projected if di is not None])
+
+  def reduce(self, lhs):
+    '''Return the reduced coefficients of the best approximation of ``lhs``.'''
+
+    return self.basis.T.dot(lhs - self.lift)
+
+  def expand(self, reducedlhs):
+    '''Return the coefficient vector that corresponds to ``reducedlhs``.'''
+
+    return self.lift + self.basis.dot(reducedlhs)
+
+  def solve(self, tol, *, arguments={}, **kwargs):
+    '''Solve the reduced problem by :class:`newton`.
+
+    Args
+    ----
+    tol : :class:`float`
+        Target residual norm of the reduced problem.
+    arguments : :class:`dict`
+        Arguments for the residual.
+    **kwargs
+        Additional arguments for :class:`newton`.
+
+    Returns
+    -------
+    lhs : :class:`numpy.ndarray`
+        Expanded coefficient vector.
+    '''
+
+    reducedlhs = newton(self.reducedtarget, self.residual, arguments=arguments, **kwargs).solve(tol)
+    return self.expand(reducedlhs)
+
+
 ## HELPER FUNCTIONS
 
+def _empiricalcubature(integral, snapshotarguments, tol):
+  # select elements and positive weights that integrate the vector integral
+  # for all snapshot arguments up to relative tolerance `tol`, by solving for
+  # non-negative element weights with a greedy active set method (Hernandez et
+  # al, 2017, The empirical cubature method); returns a map from sample to
+  # reduced sample, or to None if no elements of the sample are selected
+  samples = tuple(integral._integrands)
+  blocks = []
+  for di in samples:
+    values = numpy.array([di.eval(integral._integrands[di], **arguments) for arguments in snapshotarguments]) # nsnapshots x npoints x nmodes
+    blocks.append(numpy.array([numpy.einsum('p,spm->sm', p.weights, values[:,index]).ravel() for p, index in zip(di.points, di.index)]).T)
+  # since the projected residual vanishes at the snapshots the element
+  # contributions sum to zero; rather than the sum, the weights reproduce the
+  # integrals of an orthonormal basis of the contributions, plus the volume
+  U, s, Vt = numpy.linalg.svd(numpy.concatenate(blocks, axis=1), full_matrices=False) # nsnapshots*nmodes x nelems
+  A = numpy.concatenate([Vt[:numpy.sum(s > tol * s[0])], numpy.ones((1, Vt.shape[1])) / numpy.sqrt(Vt.shape[1])])
+  scale = numpy.linalg.norm(A, axis=0)
+  elemweights = _nnls(A / scale, A.sum(axis=1), tol) / scale
+  reduced = {}
+  offset = 0
+  for di in samples:
+    myweights = elemweights[offset:offset+di.nelems]
+    offset += di.nelems
+    ielems, = myweights.nonzero()
+    if not len(ielems):
+      reduced[di] = None
+      continue
+    mask = numpy.zeros(di.npoints, dtype=bool)
+    for ielem in ielems:
+      mask[di.index[ielem]] = True
+    subset = di.subset(mask)
+    reduced[di] = sample.Sample(subset.transforms, [points.CoordsWeightsPoints(p.coords, p.weights * w) for p, w in zip(subset.points, myweights[ielems])], subset.index)
+  return reduced
+
+def _sweep_worker(solve, arguments, indices, writer, procid):
+  signal.signal(signal.SIGINT, signal.SIG_IGN) # disable sigint (ctrl+c) handler
+  parallel.procid = procid # block nested forks
+  status = 1
+  try:
+    with log.set(log.NullLog()):
+      for i in indices:
+        try:
+          writer.send((i, False, solve(arguments[i])))
+        except Exception as e:
+          tb = traceback.format_exc()
+          try:
+            writer.send((i, True, (e, tb)))
+          except Exception: # unpicklable exception
+            writer.send((i, True, (SolverError('sweep failed for item {}'.format(i)), tb)))
+          break
+      else:
+        status = 0
+  finally:
+    writer.close()
+    os._exit(status) # never return to the caller's stack in a forked process
+
+def _nnls(A, b, tol):
+  # non-negative least squares by the active set method of Lawson and Hanson,
+  # terminated as soon as the relative residual drops below `tol` so that the
+  # solution is sparse
+  x = numpy.zeros(A.shape[1])
+  passive = numpy.zeros(A.shape[1], dtype=bool)
+  norm = numpy.linalg.norm(b)
+  residual = b
+  for iiter in range(3 * A.shape[1]):
+    if numpy.linalg.norm(residual) <= tol * norm:
+      break
+    gradient = A.T.dot(residual)
+    gradient[passive] = -numpy.inf
+    j = numpy.argmax(gradient)
+    if gradient[j] <= 0:
+      break # optimal
+    passive[j] = True
+    while True:
+      z = numpy.zeros_like(x)
+      z[passive] = numpy.linalg.lstsq(A[:,passive], b, rcond=None)[0]
+      if (z[passive] > 0).all():
+        break
+      # move towards z until the first passive entry hits zero
+      blocking = passive & (z <= 0)
+      alpha = numpy.min(x[blocking] / (x[blocking] - z[blocking]))
+      x += alpha * (z - x)
+      passive &= x > numpy.finfo(float).eps * x.max()
+      x[~passive] = 0
+    x = z
+    residual = b - A.dot(x)
+  else:
+    raise SolverError('empirical cubature failed to converge')
+  error = numpy.linalg.norm(residual) / norm if norm else 0.
+  log.info('selected {} of {} elements, cubature error {:.1e}'.format(passive.sum(), len(x), error))
+  if error > tol:
+    raise SolverError('empirical cubature failed to reach tolerance: {:.1e}'.format(error))
+  return x
+
+def _elementdofs(integral, ndofs):
+  # label dofs that are supported on a single element by the element index,
+  # and all other dofs by -1, based on the dof maps of all bases of length
+  # ndofs in the integral
+  dofmaps = {func.dofmap for func in function.Tuple(tuple(integral._integrands.values())).dependencies
+    if isinstance(func, function.Inflate) and isinstance(func.dofmap, function.DofMap) and func.length == ndofs}
+  count = numpy.zeros(ndofs, dtype=int)
+  label = numpy.empty(ndofs, dtype=int)
+  offset = 0
+  for dofmap in dofmaps:
+    for ielem, dofs in enumerate(dofmap.dofs):
+      dofs = numpy.unique(dofs)
+      count[dofs] += 1
+      label[dofs] = offset + ielem
+    offset += len(dofmap.dofs)
+  return numpy.where(count == 1, label, -1)
+
+def _condensed_solve(jac, rhs, constrain, label, solveargs):
+  # solve jac lhs = rhs subject to constrain by static condensation of the
+  # dofs with a nonnegative label, where the dofs that share a label form a
+  # block that is eliminated at once; the condensation is exact as long as
+  # interior dofs of different blocks do not couple, and it is vectorized over
+  # all blocks with the same number of interior and skeleton dofs
+  n = len(rhs)
+  if constrain is not None:
+    label = numpy.where(constrain if constrain.dtype == bool else ~numpy.isnan(constrain), -1, label)
+  data, indices, indptr = jac.export('csr')
+  rows = numpy.repeat(numpy.arange(n), numpy.diff(indptr))
+  cross = (data != 0) & (label[rows] >= 0) & (label[indices] >= 0) & (label[rows] != label[indices])
+  label[rows[cross]] = -1
+  label[indices[cross]] = -1
+  interior = label >= 0
+  # number the blocks and the interior dofs within each block
+  blocklabels, dofblock = numpy.unique(label[interior], return_inverse=True)
+  nblocks = len(blocklabels)
+  block = numpy.full(n, -1)
+  block[interior] = dofblock
+  order = numpy.flatnonzero(interior)[numpy.argsort(dofblock, kind='stable')]
+  ninterior = numpy.bincount(dofblock, minlength=nblocks)
+  interiorstart = numpy.cumsum(ninterior) - ninterior
+  localindex = numpy.empty(n, dtype=int)
+  localindex[order] = numpy.arange(len(order)) - interiorstart[block[order]]
+  # the skeleton dofs of a block are those that couple to its interior dofs
+  touch = interior[rows] | interior[indices]
+  erows, ecols, edata = rows[touch], indices[touch], data[touch]
+  eblock = numpy.where(interior[erows], block[erows], block[ecols])
+  keys = numpy.unique(numpy.concatenate([eblock[~interior[erows]] * n + erows[~interior[erows]], eblock[~interior[ecols]] * n + ecols[~interior[ecols]]]))
+  skeletondofs = keys % n
+  nskeleton = numpy.bincount(keys // n, minlength=nblocks)
+  skeletonstart = numpy.cumsum(nskeleton) - nskeleton
+  def local(dofs):
+    return numpy.where(interior[dofs], localindex[dofs], ninterior[eblock] + numpy.searchsorted(keys, eblock * n + dofs) - skeletonstart[eblock])
+  elocal = local(erows), local(ecols)
+  condensed = rhs.copy()
+  schurdata, schurindex, recover = [], [], []
+  signature = ninterior * ((nskeleton.max() if len(nskeleton) else 0) + 1) + nskeleton
+  for sig in numpy.unique(signature):
+    blocks, = numpy.equal(signature, sig).nonzero()
+    k, s = ninterior[blocks[0]], nskeleton[blocks[0]]
+    batch = numpy.full(nblocks, -1)
+    batch[blocks] = numpy.arange(len(blocks))
+    select = batch[eblock] >= 0
+    A = numpy.zeros((len(blocks), k+s, k+s))
+    numpy.add.at(A, (batch[eblock[select]], elocal[0][select], elocal[1][select]), edata[select])
+    D = order[interiorstart[blocks,numpy.newaxis] + numpy.arange(k)]
+    S = skeletondofs[skeletonstart[blocks,numpy.newaxis] + numpy.arange(s)]
+    B = numpy.concatenate([A[:,:k,k:], rhs[D,numpy.newaxis]], axis=2)
+    try:
+      Xy = numpy.linalg.solve(A[:,:k,:k], B)
+    except numpy.linalg.LinAlgError: # keep singular blocks in the skeleton
+      regular = numpy.array([numpy.linalg.matrix_rank(Aii) == k for Aii in A[:,:k,:k]], dtype=bool)
+      interior[D[~regular].ravel()] = False
+      A, D, S, B = A[regular], D[regular], S[regular], B[regular]
+      Xy = numpy.linalg.solve(A[:,:k,:k], B)
+    ASi = A[:,k:,:k]
+    schurdata.append(-numpy.einsum('bij,bjk->bik', ASi, Xy[:,:,:s]).ravel())
+    schurindex.append(numpy.array([numpy.repeat(S, s, axis=1).ravel(), numpy.tile(S, (1, s)).ravel()]))
+    numpy.add.at(condensed, S, -numpy.einsum('bij,bj->bi', ASi, Xy[:,:,s]))
+    recover.append((D, S, Xy))
+  keep = ~interior
+  log.info('condensed {} interior dofs, solving for {} skeleton dofs'.format(n - keep.sum(), keep.sum()))
+  renumber = numpy.cumsum(keep) - 1
+  skeletonentries = keep[rows] & keep[indices]
+  data = numpy.concatenate([data[skeletonentries]] + schurdata)
+  index = renumber[numpy.concatenate([numpy.array([rows[skeletonentries], indices[skeletonentries]])] + schurindex, axis=1)]
+  lhs = numpy.empty(n)
+  lhs[keep] = matrix.assemble(data, index, shape=(keep.sum(),)*2).solve(condensed[keep], constrain=constrain[keep] if constrain is not None else None, **solveargs)
+  for D, S, Xy in recover:
+    lhs[D] = Xy[:,:,-1] - numpy.einsum('bij,bj->bi', Xy[:,:,:-1], lhs[S])
+  return lhs
+
 def _nan_at(vec, where):
   copy = vec.copy()
   if where is not False:
@@ -694,6 +1595,50 @@ def _parse_lhs_cons(lhs0, constrain, shape):
     raise ValueError('`constrain` should have dtype bool or float but got {}'.format(constrain.dtype))
   return lhs0, constrain
 
+def _inexact(solveargs, atol):
+  # relax the absolute tolerance of an iterative linear solver, retaining the
+  # user specified value as a lower bound
+  if 'atol' not in solveargs or atol <= solveargs['atol']:
+    return solveargs
+  return dict(solveargs, atol=atol)
+
+def _forcing(forcing, resnorm, newresnorm, maxforcing, gamma=.9, alpha=2.):
+  # Eisenstat-Walker forcing term, choice 2, with the safeguard against a too
+  # rapid decrease: S.C. Eisenstat and H.F. Walker, Choosing the forcing terms
+  # in an inexact Newton method, SIAM J. Sci. Comput. 17 (1996) 16-32.
+  if not maxforcing:
+    return 0.
+  newforcing = gamma * (newresnorm / resnorm)**alpha
+  safeguard = gamma * forcing**alpha
+  if safeguard > .1:
+    newforcing = max(newforcing, safeguard)
+  return min(newforcing, maxforcing)
+
+def _split(residual, target, jacobian=None):
+  # split the residual into a constant vector and linear operator that are
+  # assembled once, and the nonlinear remainder along with its jacobian; the
+  # latter is the complete residual if a jacobian is specified
+  if jacobian is not None:
+    return None, None, residual, _derivative(residual, target, jacobian)
+  if not residual.contains(target):
+    raise ValueError('`residual` does not depend on `target`')
+  constant, linear, nonlinear = residual.split(target)
+  if linear is not None:
+    linear = linear.derivative(target)
+  return constant, linear, nonlinear, nonlinear.derivative(target) if nonlinear is not None else None
+
+def _assemble(integral, arguments):
+  retval, = sample.eval_integrals(integral, **arguments)
+  return retval
+
+def _directional(residual, target, direction):
+  # forward mode directional derivative d/dh residual(target + h direction) at
+  # h=0, which unlike the contraction of the jacobian does not involve any
+  # element matrices
+  argshape = residual._argshape(target)
+  h = function.Argument(direction+'_scale', ())
+  return residual.replace({target: function.Argument(target, argshape) + h * function.Argument(direction, argshape)}).derivative(h._name).replace({h._name: 0.})
+
 def _derivative(residual, target, jacobian=None):
   if jacobian is None:
     jacobian = residual.derivative(target)
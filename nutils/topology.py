@@ -40,6 +40,15 @@ import numpy, functools, collections.abc, itertools, functools, operator, number
 
 _identity = lambda x: x
 
+def _collect_blocks(val_ind, npoints, shape):
+  # Combine the evaluated blocks of a basis into the local dofs and a matrix
+  # with one column per local dof and one row per point and trailing index.
+  dofs = numpy.unique(numpy.concatenate([idofs for val, ((idofs,), *irest) in val_ind]))
+  local = numpy.zeros((npoints, len(dofs))+tuple(shape))
+  for val, ((idofs,), *irest) in val_ind:
+    numpy.add.at(local, numpy.ix_(numpy.arange(npoints), dofs.searchsorted(idofs), *[ii for (ii,) in irest]), val)
+  return dofs, numpy.moveaxis(local, 1, -1).reshape(-1, len(dofs))
+
 class Topology(types.Singleton):
   'topology base class'
 
@@ -470,6 +479,95 @@ class Topology(types.Singleton):
 
     return extractions
 
+  @log.withcontext
+  def prolongation(self, coarse, fine, degree, *, droptol=1e-12, arguments=None):
+    '''Prolongation operator between nested function spaces.
+
+    Construct the matrix ``P`` that maps coefficients of basis ``coarse`` to
+    coefficients of basis ``fine``, such that ``fine.dot(P.matvec(c))`` equals
+    ``coarse.dot(c)`` on this topology for any coefficient vector ``c``. This
+    requires the space spanned by ``coarse`` to be contained in the space
+    spanned by ``fine``, as is the case for a basis defined on a topology and a
+    basis of the same kind defined on its :attr:`refined` topology, or on a
+    finer level of a hierarchical topology. Evaluation of ``coarse`` on the
+    elements of this topology follows the parent-child transforms of the
+    refinement hierarchy.
+
+    The entries of every column follow from a least squares fit of the coarse
+    basis function by the fine basis functions that overlap with it, in the
+    points of a gauss scheme on the elements that support any of these fine
+    basis functions. This makes the construction exact for hierarchical bases,
+    which are not linearly independent on individual elements. The result
+    forms the building block of the geometric multigrid preconditioner
+    :func:`nutils.matrix.multigrid`.
+
+    Args
+    ----
+    coarse : :class:`nutils.function.Array`
+        Basis of the coarse space.
+    fine : :class:`nutils.function.Array`
+        Basis of the fine space, of equal shape beyond the first axis.
+    degree : :class:`int`
+        Degree of the gauss scheme, which should be sufficient to distinguish
+        all fine basis functions on an element.
+    droptol : :class:`float`
+        Threshold below which entries are dropped from the sparse result.
+    arguments : :class:`dict` (default: None)
+        Optional arguments for function evaluation.
+
+    Returns
+    -------
+    :class:`nutils.matrix.Matrix`
+        Matrix of shape ``len(fine)`` by ``len(coarse)``.
+    '''
+
+    if coarse.shape[1:] != fine.shape[1:]:
+      raise ValueError('bases have incompatible shapes {} and {}'.format(coarse.shape, fine.shape))
+    if arguments is None:
+      arguments = {}
+    blocks = function.Tuple([function.Tuple([function.Tuple((f.simplified, function.Tuple(ind)))
+      for ind, f in function.blocks(function.asarray(basis).prepare_eval(ndims=self.ndims))])
+        for basis in (coarse, fine)])
+    smp = self.sample('gauss', degree)
+    elemdata = []
+    celems = [[] for i in range(len(coarse))]
+    felems = [[] for i in range(len(fine))]
+    for ielem in range(smp.nelems):
+      with log.context('elem', ielem, '({:.0f}%)'.format(100*ielem/smp.nelems)):
+        (cdofs, C), (fdofs, F) = [_collect_blocks(val_ind, smp.points[ielem].npoints, fine.shape[1:]) for val_ind in blocks.eval(_transforms=smp.transforms[ielem], _points=smp.points[ielem].coords, **arguments)]
+      elemdata.append((cdofs, C, fdofs, F))
+      for idof in cdofs:
+        celems[idof].append(ielem)
+      for idof in fdofs:
+        felems[idof].append(ielem)
+    data = []
+    index = []
+    maxerr = 0.
+    for icoarse, ielems in enumerate(celems):
+      if not ielems:
+        continue
+      fdofs = numpy.unique(numpy.concatenate([elemdata[ielem][2] for ielem in ielems]))
+      A = []
+      b = []
+      for ielem in numpy.unique(numpy.concatenate([felems[idof] for idof in fdofs])):
+        cdofs_, C_, fdofs_, F_ = elemdata[ielem]
+        where = numpy.minimum(fdofs.searchsorted(fdofs_), len(fdofs)-1)
+        overlap = numpy.equal(fdofs[where], fdofs_)
+        A_ = numpy.zeros((len(F_), len(fdofs)))
+        A_[:,where[overlap]] = F_[:,overlap]
+        A.append(A_)
+        b.append(C_[:,cdofs_.searchsorted(icoarse)] if icoarse in cdofs_ else numpy.zeros(len(C_)))
+      A = numpy.concatenate(A)
+      b = numpy.concatenate(b)
+      x = numpy.linalg.lstsq(A, b, rcond=None)[0]
+      maxerr = max(maxerr, abs(A.dot(x) - b).max())
+      keep = numpy.greater(abs(x), droptol)
+      data.append(x[keep])
+      index.append([fdofs[keep], numpy.repeat(icoarse, keep.sum())])
+    if maxerr > numpy.sqrt(droptol):
+      log.warning('coarse basis is not contained in the fine space: error {:.2e}'.format(maxerr))
+    return matrix.assemble(numpy.concatenate(data), numpy.concatenate(index, axis=1), shape=(len(fine), len(coarse)))
+
   @log.withcontext
   def volume(self, geometry, ischeme='gauss', degree=1, *, arguments=None):
     return self.integrate(function.J(geometry, self.ndims), ischeme=ischeme, degree=degree, arguments=arguments)
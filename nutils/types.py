@@ -22,7 +22,8 @@
 Module with general purpose types.
 """
 
-import inspect, functools, hashlib, builtins, numbers, collections.abc, itertools, abc, sys
+from . import config
+import inspect, functools, hashlib, builtins, numbers, collections.abc, itertools, abc, sys, contextlib
 import numpy
 
 def aspreprocessor(apply):
@@ -63,6 +64,25 @@ def aspreprocessor(apply):
     return wrapper
   return preprocessor
 
+def _canonicaltypes(annotation):
+  # Returns a collection of classes of which instances are returned unmodified
+  # by `annotation`, or `None`.  See `apply_annotations`.
+  canonical = getattr(annotation, '__canonical__', None)
+  if canonical is None:
+    return (annotation,) if isinstance(annotation, type) else None
+  return (canonical,) if isinstance(canonical, type) else canonical
+
+def _canonical_check(name, annotation, add_local):
+  # Returns a python expression (as `str`) that evaluates to `True` if
+  # argument `name` is already canonical with respect to `annotation`, or
+  # `None` if there is no such check.
+  canonical = _canonicaltypes(annotation)
+  if canonical is None:
+    return None
+  if isinstance(canonical, builtins.tuple) and len(canonical) == 1:
+    return 'type({}) is {}'.format(name, add_local(canonical[0]))
+  return 'type({}) in {}'.format(name, add_local(canonical))
+
 def _build_apply_annotations(signature):
   try:
     # Find a prefix for internal variables that is guaranteed to be
@@ -131,12 +151,17 @@ def _build_apply_annotations(signature):
       else:
         raise ValueError('Cannot create function definition with parameter {}.'.format(param))
       if param.annotation is param.empty:
-        pass
-      elif param.default is None:
+        continue
+      ann = add_local(param.annotation)
+      check = _canonical_check(name, param.annotation, add_local)
+      if param.default is None:
         # Omit the annotation if the argument is the default is None.
-        body.append('  {arg} = None if {arg} is None else {ann}({arg})\n'.format(arg=name, ann=add_local(param.annotation)))
+        body.append('  if {arg} is not None{check}: {arg} = {ann}({arg})\n'.format(arg=name, ann=ann, check=' and not '+check if check else ''))
+      elif check:
+        # Skip the annotation if the argument is already canonical.
+        body.append('  if not {check}: {arg} = {ann}({arg})\n'.format(arg=name, ann=ann, check=check))
       else:
-        body.append('  {arg} = {ann}({arg})\n'.format(arg=name, ann=add_local(param.annotation)))
+        body.append('  {arg} = {ann}({arg})\n'.format(arg=name, ann=ann))
     f = 'def apply({params}):\n{body}  return ({args}), {{{kwargs}}}\n'.format(params=','.join(params), body=''.join(body), args=''.join(arg+',' for arg in args), kwargs=','.join(kwargs))
     exec(f, l)
     apply = l['apply']
@@ -205,6 +230,12 @@ def apply_annotations(wrapped):
 
   >>> g(1)
   2
+
+  Arguments that are already canonical are passed without calling the
+  annotation: if the annotation is a class, this applies to arguments of
+  exactly this class; otherwise the annotation may define an attribute
+  ``__canonical__``, a class or a collection of classes that the annotation
+  returns unmodified.  Subclasses are not considered in either case.
   '''
   signature = inspect.signature(wrapped)
   if all(param.annotation is param.empty for param in signature.parameters.values()):
@@ -335,6 +366,28 @@ class _CacheMeta_property:
   def __delete__(self, instance):
     raise AttributeError("can't delete attribute")
 
+class _CacheMeta_hashproperty(_CacheMeta_property):
+  '''
+  Memoizing ``__nutils_hash__`` property used by :class:`CacheMeta`.  The
+  cached value is keyed on :attr:`nutils.config.hashalgorithm`, which affects
+  the hash of :class:`frozenarray` and therefore of all objects containing one.
+  '''
+
+  def __get__(self, instance, owner):
+    if instance is None:
+      return self
+    algorithm = config.hashalgorithm
+    try:
+      cached_algorithm, value = getattr(instance, self.cache_attr)
+    except AttributeError:
+      pass
+    else:
+      if cached_algorithm == algorithm:
+        return value
+    value = self.fget(instance)
+    setattr(instance, self.cache_attr, (algorithm, value))
+    return value
+
 def _CacheMeta_method(func, cache_attr):
   '''
   Memoizing method decorator used by :class:`CacheMeta`.
@@ -501,7 +554,9 @@ class CacheMeta(abc.ABCMeta):
         if attr not in namespace:
           raise TypeError('Attribute listed in __cache__ is undefined: {}'.format(attr))
         value = namespace[attr]
-        if isinstance(value, property):
+        if isinstance(value, property) and attr == '__nutils_hash__':
+          namespace[attr] = _CacheMeta_hashproperty(value, cache_attr)
+        elif isinstance(value, property):
           namespace[attr] = _CacheMeta_property(value, cache_attr)
         elif inspect.isfunction(value) and not inspect.isgeneratorfunction(value):
           namespace[attr] = _CacheMeta_method(value, cache_attr)
@@ -515,8 +570,19 @@ class CacheMeta(abc.ABCMeta):
           assert cache_attr not in slots, 'Private attribute for caching is listed in __slots__: {}'.format(cache_attr)
           slots.append(cache_attr)
         namespace['__slots__'] = tuple(slots)
+      # Record the private attributes for `memoryusage` and `purgecache`.
+      namespace['_CacheMeta__cache_attrs'] = builtins.tuple(zip(cache, cache_attrs))
     return super().__new__(mcls, name, bases, namespace, **kwargs)
 
+  def _cache_attrs(cls):
+    # Returns a `dict` of attributes listed in `__cache__` of `cls` or any of
+    # its bases and the private attributes that hold the cached values.
+    cache_attrs = {}
+    for base in reversed(cls.__mro__):
+      for attr, cache_attr in vars(base).get('_CacheMeta__cache_attrs', ()):
+        cache_attrs.setdefault(attr, []).append(cache_attr)
+    return cache_attrs
+
 class ImmutableMeta(CacheMeta):
 
   def __new__(mcls, name, bases, namespace, *, version=0, **kwargs):
@@ -537,6 +603,18 @@ class ImmutableMeta(CacheMeta):
     if not pre_init or not getattr(pre_init[-1], 'returns_canonical_arguments', False):
       pre_init.append(argument_canonicalizer(inspect.signature(init)))
     cls._pre_init = tuple(pre_init)
+    # If the only preprocessor is generated by `apply_annotations` or
+    # `argument_canonicalizer`, replace it by an equivalent function for the
+    # signature without `self`, which is called directly by `__call__`.
+    if len(pre_init) == 1 and getattr(pre_init[0], 'returns_canonical_arguments', False):
+      signature = inspect.signature(init)
+      if init is cls.__init__:
+        # The preprocessor is generated by `argument_canonicalizer`, which
+        # ignores annotations.
+        signature = signature.replace(parameters=[param.replace(annotation=param.empty) for param in signature.parameters.values()])
+      cls._canonicalize = _build_apply_annotations(signature.replace(parameters=builtins.tuple(signature.parameters.values())[1:]))
+    else:
+      cls._canonicalize = None
     cls._init = init
     cls._version = version
     return cls
@@ -546,16 +624,23 @@ class ImmutableMeta(CacheMeta):
 
   def __call__(*args, **kwargs):
     cls = args[0]
-    # Use `None` as temporary `self` argument, apply preprocessors and
-    # remove the temporary `self`.
-    args = None, *args[1:]
-    for preprocess in cls._pre_init:
-      args, kwargs = preprocess(*args, **kwargs)
-    args = args[1:]
+    if cls._canonicalize is not None:
+      args, kwargs = cls._canonicalize(*args[1:], **kwargs)
+    else:
+      # Use `None` as temporary `self` argument, apply preprocessors and
+      # remove the temporary `self`.
+      args = None, *args[1:]
+      for preprocess in cls._pre_init:
+        args, kwargs = preprocess(*args, **kwargs)
+      args = args[1:]
     assert not kwargs
+    if _constructionstats is not None:
+      _constructionstats[cls][0] += 1
     return cls._new(*args)
 
   def _new(cls, *args):
+    if _constructionstats is not None:
+      _constructionstats[cls][1] += 1
     self = cls.__new__(cls)
     self._args = args
     self._hash = hash(args)
@@ -651,12 +736,41 @@ if hasattr(sys, 'getrefcount'):
     def __setitem__(self, item, value):
       super().__setitem__(item, value)
       if len(self) > self.__cleanup_threshold:
-        for key in tuple(key for key, value in self.items() if sys.getrefcount(value) <= 4):
-          del self[key]
-        self.__cleanup_threshold = __class__.__cleanup_threshold + len(self)
+        self.cleanup()
+    def cleanup(self):
+      # Remove all values that are referenced by this dictionary only and
+      # return the number of removed values.
+      keys = tuple(key for key, value in self.items() if sys.getrefcount(value) <= 4)
+      for key in keys:
+        del self[key]
+      self.__cleanup_threshold = __class__.__cleanup_threshold + len(self)
+      return len(keys)
 else:
   import weakref
-  _weakref_dict = weakref.WeakValueDictionary
+  class _weakref_dict(weakref.WeakValueDictionary):
+    def cleanup(self):
+      return 0
+
+_constructionstats = None
+
+@contextlib.contextmanager
+def constructionstats():
+  '''
+  Context manager that counts the construction of :class:`Immutable` (and
+  :class:`Singleton`) instances per class.  Yields a :class:`dict` that maps
+  classes to a :class:`list` of the number of constructor calls and the
+  number of created instances.  For subclasses of :class:`Singleton` the
+  difference between the two is the number of calls served from the cache.
+  Instances created while unpickling are counted as created only.
+  '''
+
+  global _constructionstats
+  old = _constructionstats
+  stats = _constructionstats = collections.defaultdict(lambda: [0, 0])
+  try:
+    yield stats
+  finally:
+    _constructionstats = old
 
 class SingletonMeta(ImmutableMeta):
 
@@ -711,6 +825,143 @@ class Singleton(Immutable, metaclass=SingletonMeta):
   __hash__ = Immutable.__hash__
   __eq__ = object.__eq__
 
+def _singletonclasses(cls):
+  # Returns `cls` and all of its subclasses.
+  if not isinstance(cls, SingletonMeta):
+    raise ValueError('expected a subclass of Singleton but got {!r}'.format(cls))
+  classes = [cls]
+  for cls in classes:
+    classes.extend(subcls for subcls in cls.__subclasses__() if subcls not in classes)
+  return classes
+
+def _cleanup(classes):
+  # Removes unreferenced instances from the caches of `classes`.  Since a
+  # removed instance may hold the last reference to other instances, this is
+  # repeated until nothing is removed.
+  while sum(cls._cache.cleanup() for cls in classes):
+    pass
+
+def _sizeof(value, seen):
+  # Returns the approximate number of bytes retained by `value`, excluding
+  # `Singleton` instances and objects with an `id` in `seen`, which is
+  # updated in place.
+  if isinstance(value, Singleton) or id(value) in seen:
+    return 0
+  seen.add(id(value))
+  size = sys.getsizeof(value)
+  if isinstance(value, frozenarray):
+    size += _sizeof(numpy.asarray(value), seen)
+  elif isinstance(value, numpy.ndarray):
+    base = value
+    while isinstance(base.base, numpy.ndarray):
+      base = base.base
+    if base.base is not None:
+      size += _sizeof(base.base, seen)
+    elif base is not value and id(base) not in seen:
+      seen.add(id(base))
+      size += sys.getsizeof(base)
+  elif isinstance(value, (str, bytes, bytearray)):
+    pass
+  elif isinstance(value, collections.abc.Mapping):
+    size += sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in value.items())
+  elif isinstance(value, (builtins.tuple, list, set, builtins.frozenset, frozenmultiset)):
+    size += sum(_sizeof(item, seen) for item in value)
+  return size
+
+def memoryusage(cls=Singleton):
+  '''
+  Returns the number of cached instances of :class:`Singleton` subclasses and
+  the approximate amount of memory they retain, including the values cached by
+  properties and methods listed in ``__cache__``.  Instances that are
+  referenced only by the cache of their class are removed prior to counting.
+
+  Shared data, e.g. arrays referenced by multiple instances, is attributed to
+  the first instance encountered only.  Other :class:`Singleton` instances
+  that are referenced by an instance or its cached values are not included,
+  as these are accounted for by their own class.
+
+  Parameters
+  ----------
+  cls : subclass of :class:`Singleton`
+      Restricts the report to ``cls`` and its subclasses.
+
+  Returns
+  -------
+  :class:`dict`
+      Maps classes to a :class:`tuple` of the number of cached instances, the
+      number of bytes retained by the instances including cached values and a
+      :class:`dict` that maps the names of cached attributes to a
+      :class:`tuple` of the number of instances with a cached value and the
+      number of bytes retained by the cached values.
+  '''
+
+  classes = _singletonclasses(cls)
+  _cleanup(classes)
+  seen = set()
+  usage = {}
+  for cls in classes:
+    instances = builtins.tuple(cls._cache.values())
+    if not instances:
+      continue
+    nbytes = 0
+    cached = {}
+    for attr, cache_attrs in cls._cache_attrs().items():
+      count = size = 0
+      for instance in instances:
+        values = [getattr(instance, cache_attr) for cache_attr in cache_attrs if hasattr(instance, cache_attr)]
+        if values:
+          count += 1
+          size += sum(_sizeof(value, seen) for value in values)
+      cached[attr] = count, size
+      nbytes += size
+    for instance in instances:
+      nbytes += sys.getsizeof(instance) + _sizeof(instance._args, seen)
+    usage[cls] = len(instances), nbytes, cached
+  return usage
+
+def purgecache(*attrs, cls=Singleton):
+  '''
+  Removes values cached by properties and methods listed in ``__cache__`` from
+  all cached instances of :class:`Singleton` subclasses, and subsequently
+  removes instances from the caches that are no longer referenced elsewhere.
+  Cached values are recomputed on demand.
+
+  Parameters
+  ----------
+  *attrs : :class:`str`
+      The names of the cached attributes to purge, e.g. ``'simplified'``.  If
+      absent, all cached attributes are purged.
+  cls : subclass of :class:`Singleton`
+      Restricts purging to ``cls`` and its subclasses.
+
+  Returns
+  -------
+  :class:`int`
+      The number of purged values.
+  '''
+
+  classes = _singletonclasses(cls)
+  npurged = 0
+  for cls in classes:
+    cache_attrs = [cache_attr for attr, cache_attrs in cls._cache_attrs().items() if not attrs or attr in attrs for cache_attr in cache_attrs]
+    if cache_attrs:
+      npurged += sum(_purge(instance, cache_attrs) for instance in builtins.tuple(cls._cache.values()))
+  _cleanup(classes)
+  return npurged
+
+def _purge(instance, cache_attrs):
+  # Deletes the private attributes `cache_attrs` from `instance` and returns
+  # the number of deleted attributes.
+  npurged = 0
+  for cache_attr in cache_attrs:
+    try:
+      delattr(instance, cache_attr)
+    except AttributeError:
+      pass
+    else:
+      npurged += 1
+  return npurged
+
 def strictint(value):
   '''
   Converts any type that is a subclass of :class:`numbers.Integral` (e.g.
@@ -741,6 +992,8 @@ def strictint(value):
     raise ValueError('not an integer: {!r}'.format(value))
   return builtins.int(value)
 
+strictint.__canonical__ = builtins.int
+
 def strictfloat(value):
   '''
   Converts any type that is a subclass of :class:`numbers.Real` (e.g.
@@ -770,6 +1023,8 @@ def strictfloat(value):
     raise ValueError('not a real number: {!r}'.format(value))
   return builtins.float(value)
 
+strictfloat.__canonical__ = builtins.float
+
 def strictstr(value):
   '''
   Returns ``value`` unmodified if it is a :class:`str`, and fails otherwise.
@@ -798,6 +1053,8 @@ def strictstr(value):
     raise ValueError("not a 'str': {!r}".format(value))
   return value
 
+strictstr.__canonical__ = str
+
 def _getname(value):
   name = []
   if hasattr(value, '__module__'):
@@ -856,9 +1113,18 @@ class strict(metaclass=_strictmeta):
 
 class _tuplemeta(type):
   def __getitem__(self, itemtype):
-    @_copyname(src=self, suffix='[{}]'.format(_getname(itemtype)))
-    def constructor(value):
-      return builtins.tuple(map(itemtype, value))
+    canonical = _canonicaltypes(itemtype)
+    if canonical is None:
+      @_copyname(src=self, suffix='[{}]'.format(_getname(itemtype)))
+      def constructor(value):
+        return builtins.tuple(map(itemtype, value))
+    else:
+      @_copyname(src=self, suffix='[{}]'.format(_getname(itemtype)))
+      def constructor(value):
+        value = builtins.tuple(value)
+        if all(type(item) in canonical for item in value):
+          return value
+        return builtins.tuple(map(itemtype, value))
     return constructor
   @staticmethod
   def __call__(*args, **kwargs):
@@ -984,9 +1250,19 @@ class frozendict(collections.abc.Mapping, metaclass=_frozendictmeta):
 
 class _frozenmultisetmeta(CacheMeta):
   def __getitem__(self, itemtype):
-    @_copyname(src=self, suffix='[{}]'.format(_getname(itemtype)))
-    def constructor(value):
-      return self(map(itemtype, value))
+    canonical = _canonicaltypes(itemtype)
+    if canonical is None:
+      @_copyname(src=self, suffix='[{}]'.format(_getname(itemtype)))
+      def constructor(value):
+        return self(map(itemtype, value))
+    else:
+      @_copyname(src=self, suffix='[{}]'.format(_getname(itemtype)))
+      def constructor(value):
+        if type(value) is not self:
+          value = builtins.tuple(value)
+        if all(type(item) in canonical for item in value):
+          return self(value)
+        return self(map(itemtype, value))
     return constructor
 
 class frozenmultiset(collections.abc.Container, metaclass=_frozenmultisetmeta):
@@ -1036,10 +1312,10 @@ class frozenmultiset(collections.abc.Container, metaclass=_frozenmultisetmeta):
   __cache__ = '__nutils_hash__',
 
   def __new__(cls, items):
-    if isinstance(items, frozenmultiset):
+    if type(items) is frozenmultiset or isinstance(items, frozenmultiset):
       return items
     self = object.__new__(cls)
-    self.__items = tuple(items)
+    self.__items = builtins.tuple(items)
     self.__key = frozenset((item, self.__items.count(item)) for item in self.__items)
     return self
 
@@ -1105,6 +1381,24 @@ class frozenmultiset(collections.abc.Container, metaclass=_frozenmultisetmeta):
 
   __repr__ = __str__ = lambda self: '{}({})'.format(type(self).__name__, list(self.__items))
 
+def _isreadonly(array):
+  # Returns `True` if `array` cannot be modified through any of its bases,
+  # i.e. if all arrays in the chain of bases are not writeable and the chain
+  # ends in a read-only buffer, as is the case for arrays that are memory
+  # mapped in read-only mode or created from `bytes`.  An array that owns its
+  # data can be made writeable again and is therefore not read-only.
+  while isinstance(array, numpy.ndarray):
+    if array.flags.writeable:
+      return False
+    array = array.base
+  if array is None:
+    return False
+  try:
+    with memoryview(array) as view:
+      return view.readonly
+  except TypeError:
+    return False
+
 class _frozenarraymeta(CacheMeta):
   def __getitem__(self, dtype):
     @_copyname(src=self, suffix='[{}]'.format(_getname(dtype)))
@@ -1137,7 +1431,9 @@ class frozenarray(collections.abc.Sequence, metaclass=_frozenarraymeta):
       If ``base`` is a :class:`frozenarray` and the ``dtype`` matches or is
       ``None``, this argument is ignored.  If ``base`` is a
       :class:`numpy.ndarray` and the ``dtype`` matches or is ``None`` and
-      ``copy`` is ``False``, ``base`` is stored as is.  Otherwise ``base`` is
+      ``copy`` is ``False``, ``base`` is stored as is.  The same holds
+      regardless of ``copy`` if ``base`` and all of its bases are read-only,
+      e.g. for arrays memory mapped in read-only mode.  Otherwise ``base`` is
       copied.
   '''
 
@@ -1173,8 +1469,19 @@ class frozenarray(collections.abc.Sequence, metaclass=_frozenarraymeta):
       if base.dtype == complex or base.dtype == float and dtype == int:
         raise ValueError('downcasting {!r} to {!r} is forbidden'.format(base.dtype, dtype))
     self = object.__new__(cls)
-    self.__base = numpy.array(base, dtype=dtype) if copy or not isinstance(base, numpy.ndarray) or dtype and dtype != base.dtype else base
-    self.__base.flags.writeable = False
+    if not isinstance(base, numpy.ndarray) or dtype and dtype != base.dtype:
+      base = numpy.array(base, dtype=dtype)
+    elif not copy:
+      pass
+    elif _isreadonly(base):
+      # Adopt read-only data without copying, dropping subclasses such as
+      # `numpy.memmap` like the copy would.
+      if type(base) is not numpy.ndarray:
+        base = base.view(numpy.ndarray)
+    else:
+      base = numpy.array(base)
+    base.flags.writeable = False
+    self.__base = base
     return self
 
   def __hash__(self):
@@ -1183,7 +1490,17 @@ class frozenarray(collections.abc.Sequence, metaclass=_frozenarraymeta):
   @property
   def __nutils_hash__(self):
     h = hashlib.sha1('{}.{}\0{} {}'.format(type(self).__module__, type(self).__qualname__, self.__base.shape, self.__base.dtype.str).encode())
-    h.update(self.__base.tobytes())
+    # The data buffer is hashed directly, without the copy made by `tobytes`,
+    # unless the array is not C-contiguous.
+    data = self.__base if self.__base.flags.c_contiguous else numpy.ascontiguousarray(self.__base)
+    if config.hashalgorithm == 'sha1':
+      h.update(data)
+    elif config.hashalgorithm == 'blake2b':
+      if not hasattr(hashlib, 'blake2b'):
+        raise ValueError("hash algorithm 'blake2b' requires Python 3.6 or newer")
+      h.update(b'blake2b\0' + hashlib.blake2b(data, digest_size=20).digest())
+    else:
+      raise ValueError('unsupported hash algorithm: {!r}'.format(config.hashalgorithm))
     return h.digest()
 
   @property
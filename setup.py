@@ -42,6 +42,9 @@ setup(
     matrix_mkl=['mkl','tbb;platform_system!="Windows"'],
     export_mpl=['matplotlib>=1.3','pillow>2.6'],
   ),
+  entry_points = dict(
+    console_scripts=['nutils=nutils.__main__:main'],
+  ),
   command_options = dict(
     test=dict(test_loader=('setup.py', 'unittest:TestLoader')),
   ),
@@ -1,6 +1,6 @@
 from nutils import *
 from nutils.testing import *
-import sys, contextlib, tempfile, pathlib, threading
+import sys, contextlib, tempfile, pathlib, threading, unittest.mock as mock
 
 @contextlib.contextmanager
 def tmpcache():
@@ -214,7 +214,8 @@ class function(TestCase):
       assert func() == 'spam'
       nsuccess += 1
 
-    with tmpcache() as cachedir:
+    # the in-memory tier does not lock, so it is disabled to test the file lock
+    with tmpcache() as cachedir, config(memcachesize=0):
 
       ncalls = 0
       nsuccess = 0
@@ -251,6 +252,422 @@ class function(TestCase):
       self.assertEqual(nsuccess, 2)
 
 
+class CacheTestCase(TestCase):
+  # Runs every test with configuration `settings` and, if `usetmpcache` is
+  # true, in a temporary cache directory `cachedir`.  Method `func` is a cached
+  # function that returns `value(n)` and counts its evaluations in `ncalls`.
+
+  settings = {}
+  usetmpcache = True
+
+  def setUpContext(self, stack):
+    super().setUpContext(stack)
+    if self.usetmpcache:
+      self.cachedir = stack.enter_context(tmpcache())
+    stack.enter_context(config(**self.settings))
+    self.ncalls = 0
+
+  def value(self, n):
+    return 'x' * n
+
+  def func(self, n):
+    @cache.function
+    def func(n):
+      self.ncalls += 1
+      return self.value(n)
+    return func(n)
+
+
+class memory(CacheTestCase):
+
+  usetmpcache = False
+
+  def setUpContext(self, stack):
+    super().setUpContext(stack)
+    self.memory = cache.MemoryCache()
+    stack.enter_context(mock.patch.object(cache, 'memory', self.memory))
+
+  def test_hit(self):
+    with tmpcache():
+      self.assertEqual(self.func(3), 'xxx')
+      self.assertEqual(self.func(3), 'xxx')
+      self.assertEqual(self.ncalls, 1)
+      self.assertEqual((self.memory.hits, self.memory.misses), (1, 0))
+
+  def test_hit_after_load(self):
+    with tmpcache():
+      self.func(3)
+      self.memory.clear()
+      self.func(3) # loaded from disk
+      self.func(3) # loaded from memory
+      self.assertEqual(self.ncalls, 1)
+      self.assertEqual((self.memory.hits, self.memory.misses), (1, 1))
+
+  def test_modified(self):
+    with tmpcache() as cachedir:
+      self.func(3)
+      cache_file, = cachedir.iterdir()
+      with cache_file.open('wb') as f:
+        f.write(b'bogus')
+      self.assertEqual(self.func(3), 'xxx')
+      self.assertEqual(self.ncalls, 2)
+
+  def test_directory(self):
+    with tmpcache():
+      self.func(3)
+    with tmpcache():
+      self.func(3)
+    self.assertEqual(self.ncalls, 2)
+
+  def test_eviction(self):
+    with tmpcache(), config(memcachesize=2500):
+      for n in range(1000, 1003):
+        self.func(n)
+      self.assertLessEqual(self.memory.size, 2500)
+      self.assertEqual(self.memory.evictions, 1)
+      self.func(1002)
+      self.assertEqual(self.memory.hits, 1)
+      self.func(1000) # evicted, loaded from disk
+      self.assertEqual(self.memory.hits, 1)
+      self.assertEqual(self.ncalls, 3)
+
+  def test_disabled(self):
+    with tmpcache(), config(memcachesize=0):
+      self.func(3)
+      self.func(3)
+      self.assertEqual(self.memory.size, 0)
+      self.assertEqual(self.memory.hits, 0)
+      self.assertEqual(self.ncalls, 1)
+
+  def test_stats(self):
+    self.assertEqual(self.memory.stats, 'not used')
+    with tmpcache():
+      self.func(3)
+      self.func(3)
+    self.assertTrue(self.memory.stats.startswith('effectivity 100%'))
+
+
+class disk(CacheTestCase):
+
+  settings = dict(memcachesize=0, cachesize=2**30)
+
+  def index(self):
+    index = cache.DiskIndex(self.cachedir)
+    index.update()
+    return index
+
+  def test_record(self):
+    self.func(1000)
+    self.func(1000)
+    self.func(2000)
+    index = self.index()
+    self.assertEqual(len(index.entries), 2)
+    self.assertEqual(sorted(count for size, atime, count in index.entries.values()), [1, 2])
+    self.assertEqual(index.size, sum(path.stat().st_size for path in self.cachedir.glob('[!.]*')))
+
+  def test_unbounded(self):
+    with config(cachesize=0):
+      self.func(1000)
+      self.func(1000)
+    self.assertFalse((self.cachedir/'.index').exists())
+    self.assertEqual(self.ncalls, 1)
+    index = cache.DiskIndex(self.cachedir)
+    index.rebuild()
+    self.assertEqual(len(index.entries), 1)
+
+  def test_unbounded_missing_index(self):
+    with config(cachesize=0):
+      for n in 1000, 1001, 1002:
+        self.func(n)
+    self.assertFalse((self.cachedir/'.index').exists())
+    self.assertEqual(len(self.index().entries), 3)
+    with config(cachesize=2500):
+      self.func(1003) # evicts the least recently stored files
+    self.assertLessEqual(self.index().size, 2500)
+    self.func(1003)
+    self.assertEqual(self.ncalls, 4)
+
+  def test_budget(self):
+    with config(cachesize=3500):
+      for n in 1000, 1001, 1002:
+        self.func(n)
+      self.func(1000)
+      self.func(1003) # evicts 1001 and 1002
+    self.assertEqual(self.ncalls, 4)
+    self.assertLessEqual(self.index().size, 3500)
+    self.func(1000)
+    self.func(1003)
+    self.assertEqual(self.ncalls, 4)
+    self.func(1001)
+    self.assertEqual(self.ncalls, 5)
+
+  def test_budget_memory(self):
+    with config(cachesize=3500, memcachesize=2**20):
+      for n in 1000, 1001, 1002:
+        self.func(n)
+      self.func(1000) # load from memory
+      self.func(1003) # evicts 1001 and 1002
+    self.assertEqual(self.ncalls, 4)
+    self.func(1000)
+    self.assertEqual(self.ncalls, 4)
+    self.func(1001)
+    self.assertEqual(self.ncalls, 5)
+
+  def test_prune_lru(self):
+    for n in 1000, 1001, 1002:
+      self.func(n)
+    self.func(1000)
+    self.assertEqual(self.index().prune(1500, 'lru'), 2)
+    self.func(1000)
+    self.assertEqual(self.ncalls, 3)
+
+  def test_prune_lfu(self):
+    for n in 1000, 1001, 1002:
+      self.func(n)
+    self.func(1001)
+    self.func(1001)
+    self.assertEqual(self.index().prune(1500, 'lfu'), 2)
+    self.func(1001)
+    self.assertEqual(self.ncalls, 3)
+
+  def test_recursion(self):
+    class R(cache.Recursion, length=1):
+      def resume(R_self, history):
+        yield from range(0 if not history else history[-1]+1, 10)
+    self.assertEqual(tuple(R()), tuple(range(10)))
+    index = self.index()
+    self.assertEqual(len(index.entries), 11)
+    index.prune(0)
+    self.assertEqual(tuple(self.cachedir.glob('*/[!.]*')), ())
+    self.assertEqual(tuple(R()), tuple(range(10)))
+
+  def test_rebuild(self):
+    for n in 1000, 1001:
+      self.func(n)
+    (self.cachedir/'.index').unlink()
+    index = cache.DiskIndex(self.cachedir)
+    index.rebuild()
+    self.assertEqual(len(index.entries), 2)
+    self.assertEqual(self.index().size, index.size)
+
+  def test_compact(self):
+    for i in range(3000):
+      self.func(10)
+    self.assertLess((self.cachedir/'.index').stat().st_size, 3000*20)
+    self.assertEqual(self.index().entries[next(iter(self.index().entries))][2], 3000)
+
+  def test_main(self):
+    from nutils import __main__
+    for n in 1000, 1001, 1002:
+      self.func(n)
+    with mock.patch('sys.stdout'):
+      self.assertEqual(__main__.main(['cache', 'prune', '--size', '2k', str(self.cachedir)]), 0)
+    self.assertEqual(len(self.index().entries), 1)
+    self.assertEqual(__main__._size('1.5M'), 3*2**19)
+    with mock.patch('sys.stderr'), self.assertRaises(SystemExit):
+      __main__.main(['cache', 'prune', str(self.cachedir)])
+    self.assertEqual(len(self.index().entries), 1)
+
+
+class outofband(CacheTestCase):
+
+  settings = dict(memcachesize=0, cachesize=2**30, cachemmapsize=1024)
+
+  def value(self, n):
+    return dict(small=numpy.arange(n//100), large=numpy.arange(n), matrix=matrix.NumpyMatrix(numpy.eye(n//10)))
+
+  def test_store(self):
+    self.func(1000)
+    self.assertEqual(sorted(path.name.split('.', 1)[1] for path in self.cachedir.glob('*.npy')), ['0.npy', '1.npy'])
+    index = cache.DiskIndex(self.cachedir)
+    index.update()
+    self.assertEqual(index.size, sum(path.stat().st_size for path in self.cachedir.glob('[!.]*')))
+
+  def test_load(self):
+    self.func(1000)
+    value = self.func(1000)
+    self.assertEqual(self.ncalls, 1)
+    numpy.testing.assert_array_equal(value['small'], numpy.arange(10))
+    numpy.testing.assert_array_equal(value['large'], numpy.arange(1000))
+    numpy.testing.assert_array_equal(value['matrix'].export('dense'), numpy.eye(100))
+    self.assertIsInstance(value['large'].base, numpy.memmap)
+    self.assertNotIsInstance(value['small'].base, numpy.memmap)
+
+  def test_readonly(self):
+    self.func(1000)
+    large = self.func(1000)['large']
+    with self.assertRaises(ValueError):
+      large[:] = 0
+    self.assertTrue(numpy.shares_memory(types.frozenarray(large), large))
+
+  def test_missing(self):
+    self.func(1000)
+    for path in self.cachedir.glob('*.npy'):
+      path.unlink()
+    numpy.testing.assert_array_equal(self.func(1000)['large'], numpy.arange(1000))
+    self.assertEqual(self.ncalls, 2)
+    self.func(1000)
+    self.assertEqual(self.ncalls, 2)
+
+  def test_evict(self):
+    self.func(1000)
+    cache.DiskIndex(self.cachedir).prune(0)
+    self.assertEqual(tuple(self.cachedir.glob('[!.]*')), ())
+
+  def test_rebuild(self):
+    self.func(1000)
+    index = cache.DiskIndex(self.cachedir)
+    index.update()
+    size = index.size
+    index.rebuild()
+    self.assertEqual(len(index.entries), 1)
+    self.assertEqual(index.size, size)
+
+  def test_disabled(self):
+    with config(cachemmapsize=0):
+      self.func(1000)
+    self.assertEqual(tuple(self.cachedir.glob('*.npy')), ())
+    self.assertIsInstance(self.func(1000)['large'], numpy.ndarray)
+    self.assertEqual(self.ncalls, 1)
+
+  def test_recursion(self):
+    class R(cache.Recursion, length=1):
+      def resume(R_self, history):
+        for i in range(len(history), 3):
+          yield numpy.full(1000, i)
+    for i in range(2):
+      self.assertEqual([v[0] for v in R()], [0, 1, 2])
+    self.assertEqual(len(tuple(self.cachedir.glob('*/*.npy'))), 3)
+
+
+@parametrize
+class compression(CacheTestCase):
+
+  @property
+  def settings(self):
+    return dict(memcachesize=0, cachecompression=self.method, cachecompresssize=1024)
+
+  def cachefile(self):
+    cachefile, = self.cachedir.glob('[!.]*')
+    return cachefile
+
+  def test_compressed(self):
+    self.assertEqual(self.func(10000), 'x' * 10000)
+    data = self.cachefile().read_bytes()
+    self.assertTrue(data.startswith('#{}\n'.format(self.method).encode()))
+    self.assertLess(len(data), 1000)
+    self.assertEqual(self.func(10000), 'x' * 10000)
+    self.assertEqual(self.ncalls, 1)
+
+  def test_threshold(self):
+    self.func(100)
+    self.assertFalse(self.cachefile().read_bytes().startswith(b'#'))
+
+  def test_uncompressed(self):
+    with config(cachecompression=''):
+      self.func(10000)
+    self.assertFalse(self.cachefile().read_bytes().startswith(b'#'))
+    self.assertEqual(self.func(10000), 'x' * 10000)
+    self.assertEqual(self.ncalls, 1)
+    with config(cachecompression=''):
+      self.assertEqual(self.func(10000), 'x' * 10000)
+    self.assertEqual(self.ncalls, 1)
+
+  def test_corruption(self):
+    self.func(10000)
+    data = self.cachefile().read_bytes()
+    self.cachefile().write_bytes(data[:len(data)//2])
+    self.assertEqual(self.func(10000), 'x' * 10000)
+    self.assertEqual(self.ncalls, 2)
+
+  def test_recursion(self):
+    class R(cache.Recursion, length=1):
+      def resume(R_self, history):
+        for i in range(len(history), 3):
+          yield str(i) * 10000
+    for i in range(2):
+      self.assertEqual([v[0] for v in R()], ['0', '1', '2'])
+    self.assertTrue(all(path.read_bytes().startswith(b'#') for path in self.cachedir.glob('*/000[012]')))
+
+compression(method='zlib')
+compression(method='lzma')
+
+
+class writeback(CacheTestCase):
+
+  settings = dict(memcachesize=0, cachewriteback=2**20, cachemmapsize=1024)
+  usetmpcache = False
+
+  def setUpContext(self, stack):
+    super().setUpContext(stack)
+    self.release = threading.Event()
+    write = cache._write
+    def _write(*args):
+      self.assertTrue(self.release.wait(timeout=5))
+      write(*args)
+    stack.enter_context(mock.patch.object(cache, '_write', _write))
+    stack.callback(self.release.set)
+
+  def value(self, n):
+    return numpy.arange(n)
+
+  def test_pending(self):
+    with tmpcache() as cachedir:
+      self.func(1000)
+      cachefile, = cachedir.glob('[!.]*')
+      self.assertEqual(cachefile.stat().st_size, 0)
+      self.assertIn(cachefile, cache.writeback.pending)
+      numpy.testing.assert_array_equal(self.func(1000), numpy.arange(1000))
+      self.assertEqual(self.ncalls, 1)
+      self.release.set()
+      cache.writeback.flush()
+      self.assertNotIn(cachefile, cache.writeback.pending)
+      self.assertGreater(cachefile.stat().st_size, 0)
+      numpy.testing.assert_array_equal(self.func(1000), numpy.arange(1000))
+      self.assertEqual(self.ncalls, 1)
+
+  @unittest.skipIf(cache._lock_file is not cache._lock_file_fcntl, 'platform does not support flock')
+  def test_locked(self):
+    import fcntl
+    with tmpcache() as cachedir:
+      self.func(1000)
+      cachefile, = cachedir.glob('[!.]*')
+      with cachefile.open('rb') as f:
+        with self.assertRaises(BlockingIOError):
+          fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      self.release.set()
+      cache.writeback.flush()
+      with cachefile.open('rb') as f:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+  def test_flush_on_exit(self):
+    self.release.set()
+    with tempfile.TemporaryDirectory() as cachedir:
+      with cache.enable(cachedir):
+        value = self.func(1000)
+        value[:] = 0 # should not affect the stored value
+      with cache.enable(cachedir):
+        numpy.testing.assert_array_equal(self.func(1000), numpy.arange(1000))
+    self.assertEqual(self.ncalls, 1)
+    self.assertEqual(cache.writeback.pending, {})
+
+  def test_recursion(self):
+    class R(cache.Recursion, length=1):
+      def resume(R_self, history):
+        self.ncalls += 1
+        for i in range(len(history), 3):
+          yield i
+    with tempfile.TemporaryDirectory() as cachedir:
+      with cache.enable(cachedir):
+        self.assertEqual(tuple(R()), (0, 1, 2))
+        self.assertEqual(tuple(R()), (0, 1, 2))
+        self.assertEqual(self.ncalls, 1)
+        self.release.set()
+      with cache.enable(cachedir):
+        self.assertEqual(tuple(R()), (0, 1, 2))
+    self.assertEqual(self.ncalls, 1)
+
+
 class Recursion(TestCase):
 
   def test_nocache(self):
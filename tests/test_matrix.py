@@ -1,11 +1,11 @@
-import numpy
+import numpy, unittest
 from nutils import matrix
 from nutils.testing import *
 
 @parametrize
 class solver(TestCase):
 
-  ifsupported = parametrize.skip_if(lambda backend, args: not hasattr(matrix, backend), reason='not supported')
+  ifsupported = parametrize.skip_if(lambda backend, args: not getattr(matrix, backend).isavailable(), reason='not supported')
   n = 100
 
   def setUp(self):
@@ -104,6 +104,18 @@ class solver(TestCase):
     sub = self.matrix - other
     numpy.testing.assert_equal(actual=sub.export('dense'), desired=self.exact - numpy.eye(self.n)[j]*v)
 
+  @ifsupported
+  def test_add_samepattern(self):
+    add = self.matrix + self.matrix * .5
+    numpy.testing.assert_equal(actual=add.export('dense'), desired=self.exact * 1.5)
+    sub = self.matrix - self.matrix * 2
+    numpy.testing.assert_equal(actual=sub.export('dense'), desired=-self.exact)
+
+  @ifsupported
+  def test_matvec(self):
+    vec = numpy.sin(numpy.arange(self.n)) # "random"
+    numpy.testing.assert_almost_equal(actual=self.matrix.matvec(vec), desired=self.exact.dot(vec), decimal=14)
+
   @ifsupported
   def test_transpose(self):
     asym = matrix.assemble(numpy.array([1,2,3,4], dtype=float), numpy.array([[0,0,1,1],[0,1,1,2]]), shape=(2,3))
@@ -124,6 +136,32 @@ class solver(TestCase):
     res = numpy.linalg.norm(self.matrix.matvec(lhs) - rhs)
     self.assertLess(res, self.tol)
 
+  @ifsupported
+  def test_solve_multiple(self):
+    rhs = numpy.arange(self.matrix.shape[0])[:,numpy.newaxis] ** numpy.arange(3) / self.n
+    lhs = self.matrix.solve(rhs, **self.args)
+    self.assertEqual(lhs.shape, rhs.shape)
+    for i in range(rhs.shape[1]):
+      res = numpy.linalg.norm(self.matrix.matvec(lhs[:,i]) - rhs[:,i])
+      self.assertLess(res, self.tol)
+    numpy.testing.assert_almost_equal(actual=self.matrix.matvec(lhs), desired=rhs, decimal=3)
+
+  @ifsupported
+  def test_constraints_multiple(self):
+    cons = numpy.empty(self.matrix.shape[0])
+    cons[:] = numpy.nan
+    cons[0] = 10
+    cons[-1] = 20
+    rhs = numpy.zeros((self.matrix.shape[0], 2))
+    rhs[1:-1,1] = 1
+    lhs = self.matrix.solve(rhs, constrain=cons, **self.args)
+    self.assertEqual(lhs.shape, rhs.shape)
+    numpy.testing.assert_equal(lhs[0], cons[0])
+    numpy.testing.assert_equal(lhs[-1], cons[-1])
+    for i in range(rhs.shape[1]):
+      res = numpy.linalg.norm(self.matrix.matvec(lhs[:,i])[1:-1] - rhs[1:-1,i])
+      self.assertLess(res, self.tol)
+
   @ifsupported
   def test_singular(self):
     singularmatrix = matrix.assemble(numpy.arange(self.n)-self.n//2, numpy.arange(self.n)[numpy.newaxis].repeat(2,0), shape=(self.n, self.n))
@@ -153,10 +191,52 @@ class solver(TestCase):
     res = numpy.linalg.norm(self.matrix.matvec(lhs)[1:-1])
     self.assertLess(res, self.tol)
 
+  @ifsupported
+  def test_constraints_changed(self):
+    for i in range(1, 3):
+      cons = numpy.empty(self.matrix.shape[0])
+      cons[:] = numpy.nan
+      cons[:i] = 10
+      lhs = self.matrix.solve(numpy.ones(self.matrix.shape[0]), constrain=cons, **self.args)
+      numpy.testing.assert_equal(lhs[:i], 10)
+      res = numpy.linalg.norm(self.matrix.matvec(lhs)[i:] - 1)
+      self.assertLess(res, self.tol)
+
 solver(backend='Numpy', args=dict())
 solver(backend='Scipy', args=dict())
+solver(backend='Scipy', args=dict(reuse=True))
 solver(backend='Scipy', args=dict(atol=1e-5, solver='gmres', restart=100, precon='spilu'))
 solver(backend='Scipy', args=dict(atol=1e-5, solver='gmres', precon='splu'))
 solver(backend='Scipy', args=dict(atol=1e-5, solver='cg', precon='diag'))
 solver(backend='Scipy', args=dict(atol=1e-5, solver='lgmres'))
 solver(backend='MKL', args=dict())
+solver(backend='Scipy', args=dict(atol=1e-5, solver='cg', precon='amg'))
+
+@unittest.skipIf(not matrix.Scipy.isavailable(), 'scipy is not available')
+class amg(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    # five point laplacian on a 40x40 grid, large enough to be coarsened
+    n = 40
+    i, j = numpy.divmod(numpy.arange(n**2), n)
+    mask = numpy.array([i>0, i<n-1, j>0, j<n-1])
+    offset = numpy.array([-n, n, -1, 1])
+    r = numpy.arange(n**2)
+    index = numpy.concatenate([[r, r]] + [[r[m], r[m]+d] for m, d in zip(mask, offset)], axis=1)
+    data = numpy.concatenate([numpy.repeat(4., n**2)] + [numpy.repeat(-1., m.sum()) for m in mask])
+    with matrix.backend('scipy'):
+      self.matrix = matrix.assemble(data, index, shape=(n**2, n**2))
+    self.rhs = numpy.sin(numpy.arange(n**2)) # "random"
+
+  def test_hierarchy(self):
+    prolongators = matrix._aggregation_prolongators(self.matrix.core.tocsr())
+    self.assertGreater(len(prolongators), 0)
+    self.assertLessEqual(prolongators[-1].shape[1], 500)
+    self.assertIs(matrix._aggregation_prolongators(self.matrix.core.tocsr()), prolongators)
+
+  def test_solve(self):
+    niter = []
+    lhs = self.matrix.solve(self.rhs, solver='cg', atol=1e-10, precon='amg', callback=lambda res: niter.append(res))
+    self.assertLess(numpy.linalg.norm(self.matrix.matvec(lhs) - self.rhs), 1e-10)
+    self.assertLess(len(niter), 20)
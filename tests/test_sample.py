@@ -1,5 +1,5 @@
 from nutils import *
-import random, itertools, functools
+import random, itertools, functools, unittest
 from nutils.testing import *
 
 class rectilinear(TestCase):
@@ -46,3 +46,136 @@ class rectilinear(TestCase):
     self.assertEqual(self.gauss2.eval(sampled).tolist(), values.tolist())
     arg = function.Argument('dofs', [2,3])
     self.assertEqual(function.derivative(sampled, arg), function.zeros_like(arg))
+
+@unittest.skipIf(not matrix.Scipy.isavailable(), 'scipy is not available')
+class matrixfree(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    domain, geom = mesh.rectilinear([numpy.linspace(0,1,5)]*2)
+    basis = domain.basis('std', degree=2)
+    u = basis.dot(function.Argument('dofs', [len(basis)]))
+    residual = domain.integral(((basis.grad(geom) * u.grad(geom)).sum(-1) + basis * u**2 - basis) * function.J(geom), degree=4)
+    self.jacobian = residual.derivative('dofs')
+    self.lhs = numpy.sin(numpy.arange(len(basis))) # "random"
+    self.vec = numpy.cos(numpy.arange(len(basis))) # "random"
+    with matrix.backend('scipy'):
+      self.assembled = self.jacobian.eval(dofs=self.lhs)
+      self.operator = self.jacobian.matrixfree(dofs=self.lhs)
+
+  def test_matvec(self):
+    numpy.testing.assert_almost_equal(self.operator.matvec(self.vec), self.assembled.matvec(self.vec), decimal=12)
+
+  def test_diagonal(self):
+    numpy.testing.assert_almost_equal(self.operator.diagonal, self.assembled.export('dense').diagonal(), decimal=12)
+
+  def test_arithmetic(self):
+    numpy.testing.assert_almost_equal((2*self.operator - self.assembled).export('dense'), self.assembled.export('dense'), decimal=12)
+    numpy.testing.assert_almost_equal((self.assembled + self.operator).diagonal, 2*self.operator.diagonal, decimal=12)
+
+  def test_solve(self):
+    cons = numpy.full(len(self.vec), numpy.nan)
+    cons[:5] = 0
+    lhs = self.operator.solve(self.vec, constrain=cons, atol=1e-10, precon='diag')
+    numpy.testing.assert_almost_equal(lhs, self.assembled.solve(self.vec, constrain=cons), decimal=8)
+
+  def test_direct(self):
+    with self.assertRaises(matrix.MatrixError):
+      self.operator.solve(self.vec, solver='spsolve')
+
+  def test_approximation(self):
+    cons = numpy.full(len(self.vec), numpy.nan)
+    cons[:5] = 0
+    operator = matrix.MatrixFree(self.operator.shape, self.operator.matvec, approximation=self.assembled)
+    residuals = []
+    lhs = operator.solve(self.vec, constrain=cons, atol=1e-10, precon='splu', callback=residuals.append)
+    numpy.testing.assert_almost_equal(lhs, self.assembled.solve(self.vec, constrain=cons), decimal=8)
+    self.assertLessEqual(len(residuals), 2)
+
+class split(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    ns = function.Namespace()
+    domain, ns.x = mesh.rectilinear([numpy.linspace(0,1,4)]*2)
+    ns.basis = domain.basis('std', degree=2)
+    ns.u = 'basis_n ?dofs_n'
+    self.residual = domain.integral('(basis_n,i u_,i + basis_n u^2 - basis_n + 3 basis_n u) d:x' @ ns, degree=4) \
+      + domain.boundary['left'].integral('basis_n (u - 1) d:x' @ ns, degree=4)
+    self.lhs = numpy.sin(numpy.arange(len(ns.basis))) # "random"
+    self.constant, self.linear, self.nonlinear = self.residual.split('dofs')
+
+  def test_dependencies(self):
+    self.assertFalse(self.constant.contains('dofs'))
+    self.assertFalse(self.linear.derivative('dofs').contains('dofs'))
+    self.assertTrue(self.nonlinear.derivative('dofs').contains('dofs'))
+
+  def test_sum(self):
+    numpy.testing.assert_almost_equal((self.constant + self.linear + self.nonlinear).eval(dofs=self.lhs), self.residual.eval(dofs=self.lhs), decimal=14)
+
+  def test_linear(self):
+    numpy.testing.assert_almost_equal(self.linear.eval(dofs=self.lhs), self.linear.derivative('dofs').eval().matvec(self.lhs), decimal=14)
+
+  def test_vanishing(self):
+    self.assertEqual(self.linear.split('dofs'), (None, self.linear, None))
+    self.assertEqual(self.constant.split('dofs'), (self.constant, None, None))
+
+
+class batch(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    ns = function.Namespace()
+    domain, ns.x = mesh.rectilinear([numpy.linspace(0,1,4)]*2)
+    ns.basis = domain.basis('std', degree=2)
+    ns.u = 'basis_n ?dofs_n'
+    self.residual = domain.integral('(basis_n,i u_,i + basis_n u^2 - basis_n ?f) d:x' @ ns, degree=4) \
+      + domain.boundary['left'].integral('basis_n (u - 1) d:x' @ ns, degree=4)
+    self.energy = domain.integral('u^2 d:x' @ ns, degree=4)
+    self.lhs = numpy.sin(numpy.arange(len(ns.basis)*3)).reshape(-1, 3) # "random"
+
+  def test_vector(self):
+    res = self.residual.eval_batch('dofs', dofs=self.lhs, f=numpy.array(2.))
+    self.assertEqual(len(res), self.lhs.shape[1])
+    for resi, lhs in zip(res, self.lhs.T):
+      numpy.testing.assert_almost_equal(resi, self.residual.eval(dofs=lhs, f=numpy.array(2.)), decimal=14)
+
+  def test_matrix(self):
+    jacs = self.residual.derivative('dofs').eval_batch('dofs', dofs=self.lhs)
+    self.assertEqual(len(jacs), self.lhs.shape[1])
+    for jac, lhs in zip(jacs, self.lhs.T):
+      numpy.testing.assert_almost_equal(jac.export('dense'), self.residual.derivative('dofs').eval(dofs=lhs).export('dense'), decimal=14)
+
+  def test_scalar(self):
+    nrg = self.energy.eval_batch('dofs', dofs=self.lhs)
+    numpy.testing.assert_almost_equal(nrg, [self.energy.eval(dofs=lhs) for lhs in self.lhs.T], decimal=14)
+
+  def test_scalar_argument(self):
+    f = numpy.array([1., 2.])
+    res = self.residual.eval_batch('f', dofs=self.lhs[:,0], f=f)
+    for resi, fi in zip(res, f):
+      numpy.testing.assert_almost_equal(resi, self.residual.eval(dofs=self.lhs[:,0], f=numpy.array(fi)), decimal=14)
+
+  def test_independent(self):
+    nrg = self.energy.eval_batch('f', dofs=self.lhs[:,0], f=numpy.array([1., 2.]))
+    self.assertEqual(nrg, (self.energy.eval(dofs=self.lhs[:,0]),) * 2)
+
+  def test_missing(self):
+    with self.assertRaises(ValueError):
+      self.residual.eval_batch('g', dofs=self.lhs[:,0], f=numpy.array(2.))
+
+  def test_shape(self):
+    with self.assertRaises(ValueError):
+      self.residual.eval_batch('dofs', dofs=self.lhs[:-1], f=numpy.array(2.))
+
+  def test_argument_named_batch(self):
+    residual = self.residual.replace(dict(f=function.Argument('batch', ())))
+    res = residual.eval_batch('dofs', dofs=self.lhs, batch=numpy.array(2.))
+    numpy.testing.assert_almost_equal(res[0], self.residual.eval(dofs=self.lhs[:,0], f=numpy.array(2.)), decimal=14)
+    numpy.testing.assert_almost_equal(residual.eval(dofs=self.lhs[:,0], batch=numpy.array(2.)), res[0], decimal=14)
+
+  def test_name_collision(self):
+    residual = self.residual.replace({'f': function.Argument('dofs[0]', ())})
+    res = residual.eval_batch('dofs', dofs=self.lhs, **{'dofs[0]': numpy.array(2.)})
+    for resi, lhs in zip(res, self.lhs.T):
+      numpy.testing.assert_almost_equal(resi, self.residual.eval(dofs=lhs, f=numpy.array(2.)), decimal=14)
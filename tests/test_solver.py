@@ -1,6 +1,6 @@
-from nutils import solver, mesh, function, cache, types, numeric
+from nutils import solver, mesh, function, cache, types, numeric, matrix
 from nutils.testing import *
-import numpy, contextlib, tempfile
+import numpy, contextlib, tempfile, unittest, unittest.mock, itertools
 
 @contextlib.contextmanager
 def tmpcache():
@@ -118,6 +118,57 @@ class finitestrain(TestCase):
   def test_newton_iter(self):
     _test_recursion_cache(self, lambda: ((types.frozenarray(lhs), info.resnorm) for lhs, info in solver.newton('dofs', residual=self.residual, constrain=self.cons)))
 
+  def test_newton_modified(self):
+    self.assert_resnorm(solver.newton('dofs', residual=self.residual, constrain=self.cons, jacobian_update='modified', jacobian_interval=3).solve(tol=self.tol, maxiter=14))
+
+  def test_newton_broyden(self):
+    self.assert_resnorm(solver.newton('dofs', residual=self.residual, constrain=self.cons, jacobian_update='broyden').solve(tol=self.tol, maxiter=14))
+
+  def test_newton_broyden_iter(self):
+    _test_recursion_cache(self, lambda: ((types.frozenarray(lhs), info.resnorm) for lhs, info in solver.newton('dofs', residual=self.residual, constrain=self.cons, jacobian_update='broyden')))
+
+  def _krylov_iterations(self, maxforcing):
+    residuals = []
+    solveargs = dict(solver='gmres', atol=1e-12, precon='spilu', restart=100, callback=lambda res: residuals.append(res))
+    with matrix.backend('scipy'):
+      self.assert_resnorm(solver.newton('dofs', residual=self.residual, constrain=self.cons, maxforcing=maxforcing, solveargs=solveargs).solve(tol=self.tol, maxiter=10))
+    return len(residuals)
+
+  def test_newton_inexact(self):
+    self.assertLess(self._krylov_iterations(.5), self._krylov_iterations(0.))
+
+  def test_newton_inexact_iter(self):
+    with matrix.backend('scipy'):
+      _test_recursion_cache(self, lambda: ((types.frozenarray(lhs), info.resnorm) for lhs, info in solver.newton('dofs', residual=self.residual, constrain=self.cons, maxforcing=.5, solveargs=dict(solver='gmres', atol=1e-12, precon='spilu'))))
+
+  def test_newton_krylov(self):
+    with matrix.backend('scipy'):
+      self.assert_resnorm(solver.newton_krylov('dofs', residual=self.residual, constrain=self.cons, preconditioner=self.residual.derivative('dofs'), solveargs=dict(atol=1e-12, precon='spilu')).solve(tol=self.tol, maxiter=7))
+
+  def test_newton_krylov_iter(self):
+    with matrix.backend('scipy'):
+      _test_recursion_cache(self, lambda: ((types.frozenarray(lhs), info.resnorm) for lhs, info in solver.newton_krylov('dofs', residual=self.residual, constrain=self.cons, preconditioner=self.residual.derivative('dofs'), solveargs=dict(atol=1e-12, precon='spilu'))))
+
+  def _point_direction(self):
+    rng = numpy.random.RandomState(0)
+    n, = self.residual.shape
+    return rng.uniform(-.1, .1, n), rng.uniform(-1, 1, n)
+
+  def test_directional(self):
+    lhs, direction = self._point_direction()
+    directional = solver._directional(self.residual, 'dofs', 'direction').eval(arguments=dict(dofs=lhs, direction=direction))
+    jacobian = self.residual.derivative('dofs').eval(arguments=dict(dofs=lhs))
+    numpy.testing.assert_allclose(directional, jacobian.matvec(direction), atol=1e-12)
+
+  def test_eval_directional(self):
+    lhs, direction = self._point_direction()
+    newton = solver.newton('dofs', residual=self.residual, constrain=self.cons)
+    res, slope = newton._eval_directional(lhs, direction)
+    numpy.testing.assert_allclose(res, newton._eval_residual(lhs), atol=1e-12)
+    eps = 1e-6
+    fdslope = (newton._eval_residual(lhs+eps*direction) - newton._eval_residual(lhs-eps*direction)) / (2*eps)
+    numpy.testing.assert_allclose(slope, fdslope, atol=1e-6)
+
   def test_minimize(self):
     self.assert_resnorm(solver.minimize('dofs', energy=self.energy, constrain=self.cons).solve(tol=self.tol, maxiter=8))
 
@@ -182,6 +233,36 @@ optimize(minimize=False)
 optimize(minimize=True)
 
 
+@unittest.skipIf(not matrix.Scipy.isavailable(), 'scipy is not available')
+class multigrid(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    domain, geom = mesh.rectilinear([numpy.linspace(0,1,3)]*2)
+    self.topos = [domain.refine(n) for n in range(4)]
+    self.bases = [topo.basis('std', degree=1) for topo in self.topos]
+    self.prolongators = [fine.prolongation(coarsebasis, finebasis, degree=2) for fine, coarsebasis, finebasis in zip(self.topos[1:], self.bases, self.bases[1:])]
+    self.geom = geom
+
+  def _solve(self, nlevels):
+    domain = self.topos[nlevels]
+    basis = self.bases[nlevels]
+    u = basis.dot(function.Argument('dofs', [len(basis)]))
+    residual = domain.integral(((basis.grad(self.geom) * u.grad(self.geom)).sum(-1) - basis) * function.J(self.geom), degree=2)
+    cons = domain.boundary['left'].project(0, onto=basis, geometry=self.geom, ischeme='gauss2')
+    residuals = []
+    with matrix.backend('scipy'):
+      lhs = solver.solve_linear('dofs', residual=residual, constrain=cons, solveargs=dict(solver='cg', atol=1e-10, precon=matrix.multigrid(self.prolongators[:nlevels], cons), callback=lambda res: residuals.append(res)))
+    res = residual.eval(arguments=dict(dofs=lhs))
+    self.assertLess(numpy.linalg.norm(res[numpy.isnan(cons)]), 1e-9)
+    return len(residuals)
+
+  def test_iterations(self):
+    # the number of iterations should not grow with the number of levels
+    for nlevels in 1, 2, 3:
+      self.assertLessEqual(self._solve(nlevels), 8)
+
+
 class burgers(TestCase):
 
   def setUp(self):
@@ -200,8 +281,156 @@ class burgers(TestCase):
     assert numpy.equal(next(it), self.lhs0).all()
     numeric.assert_allclose64(next(it), 'eNpzNBA1NjHuNHQ3FDsTfCbAuNz4nUGZgeyZiDOZxlONmQwU9W3OFJ/pNQAADZIOPA==')
 
+  def test_switch_backend(self):
+    method = solver.impliciteuler('dofs', residual=self.residual, inertia=self.inertia, lhs0=self.lhs0, timestep=1)
+    with matrix.backend('numpy'):
+      expected = list(itertools.islice(method, 3))
+    with matrix.backend('scipy'):
+      actual = list(itertools.islice(method, 3))
+    numpy.testing.assert_allclose(actual, expected, atol=1e-12)
+
   def test_resume(self):
     _test_recursion_cache(self, lambda: map(types.frozenarray, solver.impliciteuler('dofs', residual=self.residual, inertia=self.inertia, lhs0=self.lhs0, timestep=1)))
 
   def test_resume_withscaling(self):
     _test_recursion_cache(self, lambda: map(types.frozenarray, solver.impliciteuler('dofs', residual=self.residual, inertia=self.inertia, lhs0=self.lhs0, timestep=100)))
+
+  def test_adaptive(self):
+    times = []
+    for lhs, info in itertools.islice(solver.adaptivethetamethod('dofs', residual=self.residual, inertia=self.inertia, lhs0=self.lhs0, timestep=1., theta=1., timetol=1e-2), 5):
+      self.assertLessEqual(info.error, 1e-2)
+      times.append(info.time)
+    self.assertEqual(times, [0, .0625, .125, .1875, .25]) # initial timestep is halved four times
+
+  def test_adaptive_reuse(self):
+    step = solver.adaptivethetamethod._step
+    nsteps = []
+    def _step(*args):
+      nsteps.append(None)
+      return step(*args)
+    with unittest.mock.patch.object(solver.adaptivethetamethod, '_step', _step):
+      for lhs, info in itertools.islice(solver.adaptivethetamethod('dofs', residual=self.residual, inertia=self.inertia, lhs0=self.lhs0, timestep=1., theta=1., timetol=1e-2), 2):
+        pass
+    self.assertEqual(len(nsteps), 3 + 4*2) # every retry reuses the first half step
+
+  def test_adaptive_mintimestep(self):
+    with self.assertRaises(solver.SolverError):
+      for lhs, info in itertools.islice(solver.adaptivethetamethod('dofs', residual=self.residual, inertia=self.inertia, lhs0=self.lhs0, timestep=1., theta=1., timetol=1e-2, mintimestep=.25), 5):
+        pass
+
+  def test_adaptive_resume(self):
+    _test_recursion_cache(self, lambda: ((types.frozenarray(lhs), info.time, info.timestep) for lhs, info in solver.adaptivethetamethod('dofs', residual=self.residual, inertia=self.inertia, lhs0=self.lhs0, timestep=1., theta=1., timetol=1e-2)))
+
+
+@parametrize
+class sweep(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    ns = function.Namespace()
+    domain, ns.x = mesh.rectilinear([numpy.linspace(0,1,5)]*2)
+    ns.basis = domain.basis('std', degree=1)
+    ns.u = 'basis_n ?dofs_n'
+    self.residual = domain.integral('(basis_n,i u_,i (1 + u^2) - basis_n ?f) d:x' @ ns, degree=4)
+    self.cons = domain.boundary.project(0, onto=ns.basis, geometry=ns.x, degree=2)
+    self.arguments = [dict(f=numpy.array(f)) for f in numpy.linspace(1, 10, 4)]
+
+  def solve(self, arguments):
+    return solver.newton('dofs', residual=self.residual, constrain=self.cons, arguments=arguments).solve(tol=1e-10)
+
+  def test_results(self):
+    results = dict(solver.sweep(self.solve, self.arguments, nprocs=self.nprocs))
+    self.assertEqual(sorted(results), list(range(len(self.arguments))))
+    for i, arguments in enumerate(self.arguments):
+      numpy.testing.assert_allclose(results[i], self.solve(arguments), atol=1e-12)
+
+  def test_failure(self):
+    def solve(arguments):
+      if arguments['f'] > 5:
+        raise ValueError('invalid argument')
+      return self.solve(arguments)
+    with self.assertRaises(ValueError):
+      list(solver.sweep(solve, self.arguments, nprocs=self.nprocs))
+
+  def test_break(self):
+    for i, result in solver.sweep(self.solve, self.arguments, nprocs=self.nprocs):
+      break
+    self.assertEqual(i, 0)
+
+sweep(nprocs=1)
+sweep(nprocs=3)
+
+
+class reducedorder(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    ns = function.Namespace()
+    domain, ns.x = mesh.rectilinear([numpy.linspace(0,1,7)]*2)
+    ns.basis = domain.basis('std', degree=1)
+    ns.u = 'basis_n ?dofs_n'
+    self.residual = domain.integral('(basis_n,i u_,i (1 + u^2) - basis_n ?f) d:x' @ ns, degree=4)
+    self.cons = domain.boundary.project(0, onto=ns.basis, geometry=ns.x, degree=2)
+    self.arguments = [dict(f=f) for f in (1., 4., 7., 10.)]
+    self.snapshots = [self.solve(arguments) for arguments in self.arguments]
+
+  def solve(self, arguments):
+    return solver.newton('dofs', residual=self.residual, constrain=self.cons, arguments=arguments).solve(tol=1e-12)
+
+  def test_pod(self):
+    basis = solver.pod(self.snapshots)
+    self.assertEqual(basis.shape, (len(self.snapshots[0]), 4))
+    numpy.testing.assert_almost_equal(basis.T.dot(basis), numpy.eye(4), decimal=14)
+    self.assertEqual(solver.pod(self.snapshots, nmodes=2).shape[1], 2)
+    self.assertLess(solver.pod(self.snapshots, tol=1e-2).shape[1], 4)
+
+  def test_snapshot(self):
+    rom = solver.reducedorder('dofs', self.residual, self.snapshots)
+    self.assertEqual(rom.basis.shape[1], 3)
+    numpy.testing.assert_almost_equal(rom.solve(1e-12, arguments=self.arguments[1]), self.snapshots[1], decimal=10)
+
+  def test_constrained(self):
+    rom = solver.reducedorder('dofs', self.residual, self.snapshots)
+    numpy.testing.assert_equal(rom.solve(1e-12, arguments=dict(f=5.))[self.cons.where], 0)
+
+  def test_hyperreduction(self):
+    rom = solver.reducedorder('dofs', self.residual, self.snapshots, snapshotarguments=self.arguments, hypertol=1e-10)
+    nelems = sum(di.nelems for di in rom.residual._integrands)
+    self.assertLess(nelems, 36)
+    numpy.testing.assert_almost_equal(rom.solve(1e-12, arguments=self.arguments[2]), self.snapshots[2], decimal=8)
+    lhs = self.solve(dict(f=5.))
+    self.assertLess(numpy.linalg.norm(rom.solve(1e-12, arguments=dict(f=5.)) - lhs), 1e-3 * numpy.linalg.norm(lhs))
+
+
+@parametrize
+class condense(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    ns = function.Namespace()
+    domain, ns.x = mesh.rectilinear([numpy.linspace(0,1,5)]*2)
+    ns.basis = domain.basis(self.btype, degree=3)
+    ns.u = 'basis_n ?dofs_n'
+    self.residual = domain.integral('(basis_n,i u_,i + basis_n u - basis_n x_0) d:x' @ ns, degree=6)
+    if self.btype == 'discont':
+      self.residual += domain.interfaces.integral('[basis_n] [u] d:x' @ ns, degree=6)
+    self.cons = domain.boundary['left'].project(1, onto=ns.basis, geometry=ns.x, degree=6) if self.constrain else None
+
+  def test_solve(self):
+    lhs = solver.solve_linear('dofs', self.residual, constrain=self.cons)
+    numpy.testing.assert_almost_equal(solver.solve_linear('dofs', self.residual, constrain=self.cons, condense=True), lhs, decimal=12)
+
+condense(btype='std', constrain=True)
+condense(btype='std', constrain=False)
+condense(btype='spline', constrain=True)
+condense(btype='discont', constrain=False)
+
+class condense_interior(TestCase):
+
+  def test_projection(self):
+    domain, geom = mesh.rectilinear([3,3])
+    basis = domain.basis('discont', degree=2)
+    dofs = function.Argument('dofs', basis.shape)
+    residual = domain.integral(basis * (basis.dot(dofs) - geom[0]**2) * function.J(geom), degree=4)
+    lhs = solver.solve_linear('dofs', residual, condense=True)
+    numpy.testing.assert_almost_equal(lhs, solver.solve_linear('dofs', residual), decimal=12)
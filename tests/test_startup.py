@@ -0,0 +1,44 @@
+import sys, os, subprocess, json, unittest
+import nutils
+from nutils.testing import *
+
+class startup(TestCase):
+
+  def _run(self, script):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(nutils.__file__))] + list(filter(None, [os.environ.get('PYTHONPATH')]))))
+    output = subprocess.check_output([sys.executable, '-c', 'import sys, json, time\n' + script], env=env)
+    return json.loads(output.decode())
+
+  def _modules(self, script):
+    return set(self._run(script + '\nprint(json.dumps(list(sys.modules)))'))
+
+  def test_lazy_submodules(self):
+    modules = self._modules('import nutils')
+    self.assertEqual({m for m in modules if m.startswith('nutils.')}, set())
+
+  def test_submodule_attribute(self):
+    self.assertEqual(self._run('import nutils\nprint(json.dumps([nutils.function.__name__, nutils.long_version, "mesh" in dir(nutils)]))'), ['nutils.function', nutils.long_version, True])
+
+  def test_missing_attribute(self):
+    self.assertTrue(self._run('import nutils\nprint(json.dumps(not hasattr(nutils, "spam")))'))
+
+  def test_import_all(self):
+    modules = self._modules('from nutils import *')
+    self.assertLessEqual({'nutils.'+name for name in nutils.__all__ if name not in ('_', 'numpy')}, modules)
+
+  def test_optional_dependencies(self):
+    modules = self._modules('import nutils.matrix, nutils.export, nutils.solver, nutils.cli')
+    self.assertNotIn('scipy', modules)
+    self.assertNotIn('matplotlib', modules)
+
+  def test_numpy_backend(self):
+    modules = self._modules('import nutils.matrix\nwith nutils.matrix.backend("numpy"): pass')
+    self.assertNotIn('scipy', modules)
+
+  # Wall-clock timings are unreliable on shared machines, hence this test
+  # runs only if a budget in seconds is set via NUTILS_IMPORTTIME_BUDGET.
+  @unittest.skipIf('NUTILS_IMPORTTIME_BUDGET' not in os.environ, 'NUTILS_IMPORTTIME_BUDGET is not set')
+  def test_importtime(self):
+    budget = float(os.environ['NUTILS_IMPORTTIME_BUDGET'])
+    times = [self._run('t0 = time.perf_counter()\nimport nutils.cli, nutils.mesh, nutils.function, nutils.solver, nutils.export\nprint(time.perf_counter() - t0)') for i in range(3)]
+    self.assertLess(min(times), budget, 'importing nutils took {:.2f}s'.format(min(times)))
@@ -372,6 +372,33 @@ hierarchical('1d_c_p', pos=0.5, ndims=1, periodic=[0])
 #hierarchical('1d_l_r', pos=0, ndims=1, periodic=[]) # disabled, see issue #193
 
 
+@parametrize
+class prolongation(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.coarse, self.geom = mesh.rectilinear([3,2])
+    self.fine = self.coarse.refined if self.refine == 'uniform' else self.coarse.refined_by([self.coarse.elements[0].transform])
+
+  def test_exact(self):
+    coarsebasis = self.coarse.basis(self.btype, degree=self.degree)
+    finebasis = self.fine.basis(self.btype if self.refine == 'uniform' else 'th-'+self.btype, degree=self.degree)
+    if self.vector:
+      coarsebasis = coarsebasis.vector(2)
+      finebasis = finebasis.vector(2)
+    P = self.fine.prolongation(coarsebasis, finebasis, degree=2*self.degree)
+    self.assertEqual(P.shape, (len(finebasis), len(coarsebasis)))
+    coeffs = numpy.sin(numpy.arange(len(coarsebasis))) # "random" coefficients
+    coarsevals, finevals = self.fine.sample('gauss', 3).eval([coarsebasis.dot(coeffs), finebasis.dot(P.matvec(coeffs))])
+    numpy.testing.assert_array_almost_equal(finevals, coarsevals, decimal=14)
+
+for btype in 'std', 'spline', 'discont':
+  for degree in 1, 2:
+    prolongation(btype=btype, degree=degree, refine='uniform', vector=False)
+prolongation(btype='std', degree=2, refine='uniform', vector=True)
+prolongation(btype='spline', degree=2, refine='hierarchical', vector=False)
+
+
 @parametrize
 class multipatch_hyperrect(TestCase):
 
@@ -1,6 +1,6 @@
 from nutils.testing import *
 import nutils.types
-import inspect, pickle, itertools, ctypes
+import inspect, pickle, itertools, ctypes, tempfile, os
 import numpy
 
 class apply_annotations(TestCase):
@@ -88,6 +88,22 @@ class apply_annotations(TestCase):
     self.assertEqual(f(None), None)
     self.assertEqual(f(1), '1')
 
+  def test_canonical(self):
+    calls = []
+    def ann(x):
+      calls.append(x)
+      return int(x)
+    ann.__canonical__ = int
+    @nutils.types.apply_annotations
+    def f(a:ann, b:ann=None):
+      return a, b
+    self.assertEqual(f(1, 2), (1, 2))
+    self.assertEqual(calls, [])
+    self.assertEqual(f('1', None), (1, None))
+    self.assertEqual(calls, ['1'])
+    self.assertEqual(f(1, b=2.), (1, 2))
+    self.assertEqual(calls, ['1', 2.])
+
 class nutils_hash(TestCase):
 
   def test_ellipsis(self):
@@ -169,6 +185,35 @@ class nutils_hash(TestCase):
     with self.assertRaises(TypeError):
       nutils.types.nutils_hash([])
 
+  def test_frozenarray(self):
+    a = numpy.arange(12.).reshape(3, 4)
+    self.assertEqual(nutils.types.nutils_hash(nutils.types.frozenarray(a)).hex(), '14f1dd6fb930d34e7c4cebb91a55496886b7f9ec')
+    self.assertEqual(nutils.types.nutils_hash(nutils.types.frozenarray(numpy.asfortranarray(a))).hex(), '14f1dd6fb930d34e7c4cebb91a55496886b7f9ec')
+    self.assertEqual(nutils.types.nutils_hash(nutils.types.frozenarray(a.T, copy=False)), nutils.types.nutils_hash(nutils.types.frozenarray(a.T.copy())))
+
+  def test_frozenarray_memoized(self):
+    a = nutils.types.frozenarray(numpy.arange(12.))
+    self.assertIs(nutils.types.nutils_hash(a), nutils.types.nutils_hash(a))
+
+  def test_frozenarray_blake2b(self):
+    a = numpy.arange(12.).reshape(3, 4)
+    with nutils.config(hashalgorithm='blake2b'):
+      h = nutils.types.nutils_hash(nutils.types.frozenarray(a))
+      self.assertEqual(nutils.types.nutils_hash(nutils.types.frozenarray(a.tolist())), h)
+    self.assertNotEqual(nutils.types.nutils_hash(nutils.types.frozenarray(a)), h)
+
+  def test_frozenarray_hashalgorithm_memoized(self):
+    a = nutils.types.frozenarray(numpy.arange(12.))
+    t = nutils.types.frozendict({'a': a})
+    h1 = nutils.types.nutils_hash(a), nutils.types.nutils_hash(t)
+    with nutils.config(hashalgorithm='blake2b'):
+      h2 = nutils.types.nutils_hash(a), nutils.types.nutils_hash(t)
+      b = nutils.types.frozenarray(numpy.arange(12.))
+      self.assertEqual(h2, (nutils.types.nutils_hash(b), nutils.types.nutils_hash(nutils.types.frozendict({'a': b}))))
+    self.assertNotEqual(h1[0], h2[0])
+    self.assertNotEqual(h1[1], h2[1])
+    self.assertEqual((nutils.types.nutils_hash(a), nutils.types.nutils_hash(t)), h1)
+
 class CacheMeta(TestCase):
 
   def test_property(self):
@@ -772,6 +817,51 @@ class frozenarray(TestCase):
     self.assertEqual(nutils.types.nutils_hash(a).hex(), '42cc3a5e1216c1f0a9921a61a3a2c67025c98d69')
     self.assertEqual(nutils.types.nutils_hash(b).hex(), '8f0c9f9a118c42c258f1e69e374aadda99b4be97')
 
+  def test_readonly(self):
+    base = numpy.frombuffer(numpy.array([1.,2.,3.,4.]).tobytes()).reshape(2,2)
+    for frozen in nutils.types.frozenarray(base), nutils.types.frozenarray[float](base), nutils.types.frozenarray(base.T):
+      self.assertTrue(numpy.shares_memory(frozen, base))
+    self.assertFalse(numpy.shares_memory(nutils.types.frozenarray(base, dtype=int), base))
+
+  def test_readonly_owner(self):
+    base = numpy.array([[1.,2.],[3.,4.]])
+    base.flags.writeable = False
+    for frozen in nutils.types.frozenarray(base), nutils.types.frozenarray(base.T):
+      self.assertFalse(numpy.shares_memory(frozen, base))
+    frozen = nutils.types.frozenarray(base)
+    base.flags.writeable = True
+    base[0,0] = 5.
+    self.assertEqual(frozen.tolist(), [[1.,2.],[3.,4.]])
+
+  def test_readonly_view_of_writeable(self):
+    base = numpy.array([[1.,2.],[3.,4.]])
+    view = base[:,::-1]
+    view.flags.writeable = False
+    frozen = nutils.types.frozenarray(view)
+    self.assertFalse(numpy.shares_memory(frozen, base))
+    base[0,0] = 5.
+    self.assertEqual(frozen.tolist(), [[2.,1.],[4.,3.]])
+
+  def test_readonly_buffer(self):
+    base = numpy.frombuffer(b'\x01\x02\x03', dtype=numpy.uint8)
+    self.assertTrue(numpy.shares_memory(nutils.types.frozenarray(base), base))
+    base = numpy.frombuffer(bytearray(b'\x01\x02\x03'), dtype=numpy.uint8)
+    base.flags.writeable = False
+    self.assertFalse(numpy.shares_memory(nutils.types.frozenarray(base), base))
+
+  def test_memmap(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      path = os.path.join(tmpdir, 'data.npy')
+      numpy.save(path, numpy.arange(6.).reshape(2,3))
+      for mode, shared in ('r', True), ('c', False), ('r+', False):
+        with self.subTest(mode=mode):
+          base = numpy.load(path, mmap_mode=mode)
+          frozen = nutils.types.frozenarray(base)
+          self.assertEqual(numpy.shares_memory(frozen, base), shared)
+          self.assertIs(type(numpy.asarray(frozen)), numpy.ndarray)
+          self.assertEqual(frozen.tolist(), [[0.,1.,2.],[3.,4.,5.]])
+          del base, frozen
+
   def test_pickle(self):
     src = [[1,2],[3,4]]
     value = pickle.loads(pickle.dumps(nutils.types.frozenarray(src)))
@@ -922,6 +1012,37 @@ class ImmutableFamily(TestCase):
     self.assertEqual(T(1), T('1'))
     self.assertEqual(T(1), T(x='1'))
 
+  def test_preprocessors_canonical(self):
+    class T(self.cls):
+      @nutils.types.apply_annotations
+      def __init__(self, x: nutils.types.strictint, y: nutils.types.tuple[nutils.types.strictint] = ()):
+        pass
+
+    self.assertIsNotNone(T._canonicalize)
+    self.assertEqual(T(1, (2, 3)), T(numpy.int64(1), y=[numpy.int32(2), 3]))
+    with self.assertRaises(ValueError):
+      T(1.5)
+
+  def test_preprocessors_canonical_unannotated(self):
+    class T(self.cls):
+      def __init__(self, x: int):
+        pass
+
+    self.assertIsNotNone(T._canonicalize)
+    self.assertEqual(T('5')._args, ('5',))
+    self.assertEqual(T(x='5')._args, ('5',))
+
+  def test_constructionstats(self):
+    class T(self.cls):
+      def __init__(self, x):
+        pass
+
+    with nutils.types.constructionstats() as stats:
+      T(1)
+      T(1)
+      T(2)
+    self.assertEqual(stats[T], [3, 2 if self.cls is nutils.types.Singleton else 3])
+
   def test_nutils_hash(self):
     class T(self.cls):
       def __init__(self, x, y):
@@ -963,4 +1084,86 @@ class ImmutableFamily(TestCase):
 ImmutableFamily(cls=nutils.types.Immutable)
 ImmutableFamily(cls=nutils.types.Singleton)
 
+class memoryusage(TestCase):
+
+  def setUp(self):
+    super().setUp()
+    class T(nutils.types.Singleton):
+      __cache__ = 'x', 'y'
+      def __init__(self, n):
+        pass
+      @property
+      def x(self):
+        return numpy.zeros(self._args[0])
+      def y(self, a):
+        return a
+    class U(T):
+      __cache__ = 'x',
+      @property
+      def x(self):
+        return super().x
+    self.T = T
+    self.U = U
+
+  def test_usage(self):
+    a = self.T(100)
+    b = self.U(200)
+    a.x
+    b.x
+    b.y(1)
+    usage = nutils.types.memoryusage(self.T)
+    self.assertEqual(set(usage), {self.T, self.U})
+    n, nbytes, cached = usage[self.T]
+    self.assertEqual(n, 1)
+    self.assertEqual(cached['x'][0], 1)
+    self.assertGreaterEqual(cached['x'][1], 800)
+    self.assertEqual(cached['y'], (0, 0))
+    self.assertGreaterEqual(nbytes, cached['x'][1])
+    n, nbytes, cached = usage[self.U]
+    self.assertEqual(n, 1)
+    self.assertEqual(cached['x'][0], 1)
+    self.assertGreaterEqual(cached['x'][1], 1600)
+    self.assertEqual(cached['y'][0], 1)
+    self.assertEqual(nutils.types.memoryusage(self.U).keys(), {self.U})
+
+  def test_unreferenced(self):
+    self.T(100)
+    self.assertEqual(nutils.types.memoryusage(self.T), {})
+
+  def test_invalid(self):
+    with self.assertRaises(ValueError):
+      nutils.types.memoryusage(nutils.types.Immutable)
+
+  def test_purge(self):
+    a = self.T(100)
+    b = self.U(200)
+    x = a.x
+    b.x
+    b.y(1)
+    self.assertEqual(nutils.types.purgecache('x', cls=self.T), 3)
+    cached = nutils.types.memoryusage(self.T)[self.U][2]
+    self.assertEqual(cached['x'], (0, 0))
+    self.assertEqual(cached['y'][0], 1)
+    self.assertIsNot(a.x, x)
+    self.assertEqual(nutils.types.purgecache(cls=self.T), 2)
+    self.assertEqual(nutils.types.purgecache(cls=self.T), 0)
+
+  def test_purge_unreferenced(self):
+    class V(nutils.types.Singleton):
+      __cache__ = 'x',
+      def __init__(self):
+        pass
+      @property
+      def x(self):
+        return self.T(1)
+    V.T = self.T
+    v = V()
+    v.x
+    self.assertEqual(len(self.T._cache), 1)
+    nutils.types.purgecache(cls=V)
+    self.assertEqual(len(self.T._cache), 1)
+    nutils.types.purgecache('x', cls=nutils.types.Singleton)
+    nutils.types.memoryusage(self.T)
+    self.assertEqual(len(self.T._cache), 0)
+
 # vim:shiftwidth=2:softtabstop=2:expandtab:foldmethod=indent:foldnestmax=2